@@ -0,0 +1,74 @@
+"""Замеры эмулятора командной строки (homework1)."""
+
+import contextlib
+import io
+import os
+
+import yaml
+
+from common import measure, use_homework
+from generators import make_fs_zip
+
+
+def write_config(workdir, zip_path, name):
+    """Конфигурация эмулятора с отдельным логом для замера."""
+    config_path = os.path.join(workdir, f"{name}.yaml")
+    config = {
+        "username": "bench",
+        "virtual_fs_path": zip_path,
+        "log_file_path": os.path.join(workdir, f"{name}.xml"),
+    }
+    with open(config_path, "w") as f:
+        yaml.dump(config, f)
+    return config_path
+
+
+def close(emulator):
+    emulator.logger.close()
+    emulator.fs.close()
+
+
+def run_quietly(emulator, commands):
+    """Выполняет команды, отбрасывая их вывод."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        for command in commands:
+            emulator.execute_command(command)
+
+
+def run(workdir, params):
+    use_homework("homework1")
+    from emulator import ShellEmulator
+
+    repeat = params["repeat"]
+    results = {}
+    for files in params["fs_files"]:
+        label = f"files={files},depth={params['fs_depth']}"
+        zip_path = os.path.join(workdir, f"fs_{files}.zip")
+        directories = make_fs_zip(zip_path, files, depth=params["fs_depth"])
+        config = write_config(workdir, zip_path, f"fs_{files}")
+
+        results[f"emulator.startup[{label}]"] = measure(
+            lambda: close(ShellEmulator(config)), repeat)
+
+        emulator = ShellEmulator(config)
+        commands = []
+        for directory in directories[:params["nav_dirs"]]:
+            commands += [f"cd /{directory}", "ls", "du -s", "cd /", "ls"]
+        results[f"emulator.ls_cd[{label}]"] = measure(
+            lambda: run_quietly(emulator, commands), repeat)
+        results[f"emulator.du[{label}]"] = measure(
+            lambda: run_quietly(emulator, ["du", "du -s -h"]), repeat)
+        close(emulator)
+
+    entries = params["log_entries"]
+    config = write_config(workdir, os.path.join(workdir, f"fs_{params['fs_files'][0]}.zip"), "log")
+    emulator = ShellEmulator(config)
+
+    def long_session():
+        for index in range(entries):
+            emulator.log_action(f"cat /dir/file{index}.txt")
+        emulator.logger.flush()
+
+    results[f"emulator.log_action[entries={entries}]"] = measure(long_session, repeat)
+    close(emulator)
+    return results
@@ -0,0 +1,37 @@
+"""Замеры визуализатора истории git (homework2)."""
+
+import os
+import subprocess
+
+from common import measure, use_homework
+from generators import make_git_repo
+
+
+def run(workdir, params):
+    use_homework("homework2")
+    from hw2 import generate_dot_file, iter_commits, load_repo_history
+
+    repeat = params["repeat"]
+    results = {}
+    for commits in params["git_commits"]:
+        label = f"commits={commits}"
+        repo = os.path.join(workdir, f"repo_{commits}")
+        target = make_git_repo(repo, commits, branch_every=params["git_branch_every"])
+        dot_path = os.path.join(workdir, f"repo_{commits}.dot")
+
+        for backend in ("git", "native"):
+            results[f"hw2.history.{backend}[{label}]"] = measure(
+                lambda: list(iter_commits(repo, target, backend)), repeat)
+            results[f"hw2.repo_history.{backend}[{label}]"] = measure(
+                lambda: load_repo_history(repo, backend), repeat)
+
+        # native с commit-graph и фильтрами Блума измененных путей
+        subprocess.run(["git", "-C", repo, "commit-graph", "write", "--reachable", "--changed-paths"],
+                       check=True, capture_output=True)
+        results[f"hw2.history.native_graph[{label}]"] = measure(
+            lambda: list(iter_commits(repo, target, "native")), repeat)
+
+        history = list(iter_commits(repo, target))
+        results[f"hw2.generate_dot_file[{label}]"] = measure(
+            lambda: generate_dot_file(repo, history, dot_path), repeat)
+    return results
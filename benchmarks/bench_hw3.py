@@ -0,0 +1,33 @@
+"""Замеры конвертера TOML в учебный конфигурационный язык (homework3)."""
+
+import io
+import os
+
+import toml
+
+from common import measure, use_homework
+from generators import make_toml
+
+
+def run(workdir, params):
+    use_homework("homework3")
+    from hw3 import convert_stream, parse_config, toml_to_custom_config
+
+    repeat = params["repeat"]
+    results = {}
+    shapes = [("wide", tables, params["toml_width"], 1) for tables in params["toml_tables"]]
+    shapes.append(("nested", params["toml_tables"][0], params["toml_width"], params["toml_depth"]))
+    for shape, tables, width, depth in shapes:
+        label = f"{shape},tables={tables},width={width},depth={depth}"
+        text = make_toml(tables, width, depth)
+        data = toml.loads(text)
+        output = os.path.join(workdir, f"{shape}_{tables}.txt")
+
+        results[f"hw3.toml_to_custom_config[{label}]"] = measure(
+            lambda: toml_to_custom_config(data), repeat)
+        results[f"hw3.convert_stream[{label}]"] = measure(
+            lambda: convert_stream(io.StringIO(text), output), repeat)
+        converted = toml_to_custom_config(data)
+        results[f"hw3.parse_config[{label}]"] = measure(
+            lambda: parse_config(converted), repeat)
+    return results
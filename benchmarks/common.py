@@ -0,0 +1,37 @@
+"""Общие средства замеров: подключение модулей домашних заданий и таймер."""
+
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def use_homework(name):
+    """Добавляет каталог домашнего задания в sys.path."""
+    path = os.path.join(ROOT, name)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def measure(func, repeat=5, setup=None):
+    """
+    Замер func: repeat запусков, setup (если задан) выполняется перед
+    каждым запуском и в замер не входит.
+
+    Возвращает словарь с медианой, минимумом и максимумом в секундах.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "max": max(times),
+        "repeat": repeat,
+    }
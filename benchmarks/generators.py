@@ -0,0 +1,143 @@
+"""
+Детерминированные генераторы входных данных для замеров.
+
+Одинаковые параметры и seed всегда дают побайтно одинаковый результат:
+фиксированы даты в архиве, автор и время коммитов, порядок ключей TOML.
+"""
+
+import os
+import random
+import subprocess
+import zipfile
+
+ZIP_DATE = (2024, 1, 1, 0, 0, 0)
+GIT_IDENTITY = "Bench <bench@example.com>"
+GIT_EPOCH = 1700000000
+HOT_FILE = "hot.txt"
+
+
+def fs_dir(index, depth, fanout):
+    """Каталог файла с номером index в дереве глубины depth."""
+    parts = []
+    for level in range(depth):
+        parts.append(f"d{level}_{index % fanout}")
+        index //= fanout
+    return "/".join(parts)
+
+
+def make_fs_zip(path, files, depth=3, fanout=8, file_size=256, seed=0):
+    """
+    Архив виртуальной ФС: files файлов, разложенных по дереву каталогов
+    глубины depth с fanout подкаталогами на уровне.
+
+    Возвращает список каталогов архива (без ведущего '/').
+    """
+    rnd = random.Random(seed)
+    directories = set()
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for index in range(files):
+            directory = fs_dir(index, depth, fanout)
+            directories.add(directory)
+            lines = []
+            size = 0
+            while size < file_size:
+                line = f"line {size} {rnd.randrange(1 << 30)} error={rnd.random() < 0.1}"
+                lines.append(line)
+                size += len(line) + 1
+            name = f"{directory}/file{index}.txt" if directory else f"file{index}.txt"
+            info = zipfile.ZipInfo(name, ZIP_DATE)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, "\n".join(lines) + "\n")
+    return sorted(directories)
+
+
+def fast_import_data(text):
+    """Блок data для потока git fast-import."""
+    data = text.encode("utf-8")
+    return b"data %d\n%s\n" % (len(data), data)
+
+
+def make_git_repo(path, commits, files=20, branch_every=10, seed=0):
+    """
+    Локальный репозиторий из commits коммитов, собранный через git fast-import.
+
+    Внутри каждого цикла из branch_every коммитов нечетные коммиты попадают
+    в ветку side, четные - в main, а последний коммит цикла сливает side
+    в main. Файл HOT_FILE меняется примерно в каждом третьем коммите.
+    """
+    rnd = random.Random(seed)
+    paths = [f"src/m{index % 7}/f{index}.txt" for index in range(files)]
+    stream = []
+    main = side = None
+    for mark in range(1, commits + 1):
+        phase = mark % branch_every if branch_every else 2
+        merge = None
+        if phase == 0 and side is not None:
+            ref, parent, merge = "main", main, side
+        elif phase % 2 == 1 and main is not None:
+            ref, parent = "side", side if side is not None else main
+        else:
+            ref, parent = "main", main
+
+        changed = rnd.sample(paths, rnd.randint(1, 3))
+        if rnd.random() < 0.35:
+            changed.append(HOT_FILE)
+        stream.append(b"commit refs/heads/%s\nmark :%d\n" % (ref.encode(), mark))
+        stream.append(b"committer %s %d +0000\n" % (GIT_IDENTITY.encode(), GIT_EPOCH + mark * 60))
+        stream.append(fast_import_data(f"commit {mark}"))
+        if parent is not None:
+            stream.append(b"from :%d\n" % parent)
+        if merge is not None:
+            stream.append(b"merge :%d\n" % merge)
+        for name in changed:
+            stream.append(b"M 100644 inline %s\n" % name.encode())
+            stream.append(fast_import_data(f"{name} {mark} {rnd.randrange(1 << 30)}\n"))
+
+        if ref == "main":
+            main = mark
+            if merge is not None:
+                side = None
+        else:
+            side = mark
+
+    os.makedirs(path, exist_ok=True)
+    subprocess.run(["git", "init", "-q", path], check=True)
+    subprocess.run(["git", "-C", path, "fast-import", "--quiet"],
+                   input=b"".join(stream), check=True)
+    subprocess.run(["git", "-C", path, "symbolic-ref", "HEAD", "refs/heads/main"], check=True)
+    return HOT_FILE
+
+
+def toml_value(rnd, index):
+    """Значение одного из поддерживаемых конвертером типов."""
+    kind = index % 5
+    if kind == 0:
+        return str(rnd.randrange(1 << 31))
+    if kind == 1:
+        return f"{rnd.random() * 1000:.6f}"
+    if kind == 2:
+        return "true" if rnd.random() < 0.5 else "false"
+    if kind == 3:
+        return f'"value {rnd.randrange(1 << 20)} \\"quoted\\""'
+    return f'"line {rnd.randrange(1000)}\\nnext line"'
+
+
+def make_toml(tables, width=10, depth=1, seed=0):
+    """
+    TOML-документ из tables таблиц с width ключами в каждой.
+
+    При depth > 1 каждая таблица получает цепочку вложенных подтаблиц
+    [tN.s1], [tN.s1.s2], ... с тем же числом ключей.
+    """
+    rnd = random.Random(seed)
+    lines = []
+    for table in range(tables):
+        name = f"t{table}"
+        for level in range(depth):
+            if level:
+                name += f".s{level}"
+            lines.append(f"[{name}]")
+            for key in range(width):
+                lines.append(f"k{key} = {toml_value(rnd, key)}")
+            lines.append("")
+    return "\n".join(lines)
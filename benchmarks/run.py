@@ -0,0 +1,156 @@
+"""
+Запуск замеров всех трех заданий и сравнение с сохраненным эталоном.
+
+    python benchmarks/run.py --scale small --output results.json
+    python benchmarks/run.py --save-baseline baseline.json
+    python benchmarks/run.py --baseline baseline.json
+
+Эталон в репозитории не хранится: времена зависят от машины, поэтому его
+снимают командой --save-baseline там же, где потом сравнивают (см. readme.md).
+
+Код возврата 1 означает, что хотя бы один замер медленнее эталона больше
+чем на порог --threshold.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+
+import bench_emulator
+import bench_hw2
+import bench_hw3
+
+SUITES = {
+    "emulator": bench_emulator,
+    "hw2": bench_hw2,
+    "hw3": bench_hw3,
+}
+
+SCALES = {
+    "small": {
+        "repeat": 3,
+        "fs_files": [200, 2000],
+        "fs_depth": 3,
+        "nav_dirs": 20,
+        "log_entries": 2000,
+        "git_commits": [100, 500],
+        "git_branch_every": 10,
+        "toml_tables": [100, 1000],
+        "toml_width": 10,
+        "toml_depth": 8,
+    },
+    "large": {
+        "repeat": 5,
+        "fs_files": [2000, 20000],
+        "fs_depth": 4,
+        "nav_dirs": 100,
+        "log_entries": 50000,
+        "git_commits": [1000, 5000],
+        "git_branch_every": 10,
+        "toml_tables": [1000, 10000],
+        "toml_width": 20,
+        "toml_depth": 16,
+    },
+}
+
+
+def run_suites(names, params, workdir):
+    """Прогоняет выбранные наборы замеров и возвращает их результаты."""
+    results = {}
+    for name in names:
+        print(f"Замеры {name}...", file=sys.stderr)
+        suite_dir = os.path.join(workdir, name)
+        os.makedirs(suite_dir, exist_ok=True)
+        results.update(SUITES[name].run(suite_dir, params))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Сравнение медиан с эталоном.
+
+    Возвращает строки отчета и список замеров, ставших медленнее порога.
+    """
+    lines = []
+    regressions = []
+    for name in sorted(results):
+        median = results[name]["median"]
+        if name not in baseline:
+            lines.append(f"{name}: {median * 1000:.3f} мс (нет в эталоне)")
+            continue
+        ratio = median / baseline[name]["median"] if baseline[name]["median"] > 0 else 1.0
+        mark = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            mark = "  <-- регрессия"
+        lines.append(f"{name}: {median * 1000:.3f} мс, эталон "
+                     f"{baseline[name]['median'] * 1000:.3f} мс (x{ratio:.2f}){mark}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности заданий.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small",
+                        help="Размер синтетических входных данных.")
+    parser.add_argument("--only", nargs="+", choices=sorted(SUITES), default=sorted(SUITES),
+                        help="Какие наборы замеров запускать.")
+    parser.add_argument("--output", default=None, help="Файл для результатов в формате JSON.")
+    parser.add_argument("--baseline", default=None, help="Эталонные результаты для сравнения.")
+    parser.add_argument("--save-baseline", default=None, metavar="FILE",
+                        help="Сохранить результаты как новый эталон.")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Допустимое замедление относительно эталона (0.25 = 25%%).")
+    parser.add_argument("--workdir", default=None,
+                        help="Каталог для сгенерированных данных (по умолчанию временный).")
+    args = parser.parse_args()
+    if args.baseline and not os.path.exists(args.baseline):
+        print(f"Эталон {args.baseline} не найден, снимите его командой: "
+              f"python benchmarks/run.py --scale {args.scale} --save-baseline {args.baseline}", file=sys.stderr)
+        return 2
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_")
+    try:
+        results = run_suites(args.only, SCALES[args.scale], workdir)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "scale": args.scale,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if not args.baseline:
+        for name in sorted(results):
+            print(f"{name}: {results[name]['median'] * 1000:.3f} мс")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["meta"]["scale"] != args.scale:
+        print(f"Предупреждение: эталон снят на масштабе {baseline['meta']['scale']}.", file=sys.stderr)
+    lines, regressions = compare(results, baseline["results"], args.threshold)
+    for line in lines:
+        print(line)
+    if regressions:
+        print(f"Регрессий: {len(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
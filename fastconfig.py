@@ -0,0 +1,116 @@
+"""
+Общий загрузчик конфигурационных файлов для всех заданий.
+
+Разобранный файл кэшируется рядом с исходным в компактном marshal-файле
+(.<имя>.marshal). Ключ кэша - время изменения и размер исходного файла,
+поэтому любая правка файла приводит к повторному разбору. Модули yaml и toml
+импортируются только при промахе кэша.
+"""
+
+import marshal
+import os
+import sys
+
+CACHE_VERSION = 1
+IMPORT_PROFILE_FLAG = "--import-profile"
+
+
+def sidecar_path(path):
+    """Путь к кэшу разобранного файла."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.marshal")
+
+
+def parse_file(path, fmt):
+    """Разбор файла YAML или TOML без кэша."""
+    with open(path, 'r', encoding='utf-8') as f:
+        if fmt == "toml":
+            import toml
+            return toml.load(f)
+        import yaml
+        return yaml.safe_load(f)
+
+
+def save_sidecar(cache, key, data):
+    """Запись кэша; данные, которые marshal не поддерживает (даты), не кэшируются."""
+    try:
+        payload = marshal.dumps((key, data))
+    except ValueError:
+        return
+    temp = f"{cache}.{os.getpid()}.tmp"
+    try:
+        with open(temp, 'wb') as f:
+            f.write(payload)
+        os.replace(temp, cache)
+    except OSError:
+        # Каталог только для чтения: работаем без кэша
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def load_config(path, fmt=None):
+    """
+    Загрузка конфигурации с кэшем разобранных данных.
+
+    Формат определяется по расширению (.toml - TOML, иначе YAML), если
+    не задан явно.
+    """
+    fmt = fmt or ("toml" if path.endswith(".toml") else "yaml")
+    try:
+        st = os.stat(path)
+    except OSError:
+        # Ошибку отсутствующего файла сообщит сам разбор
+        return parse_file(path, fmt)
+    key = (CACHE_VERSION, fmt, st.st_mtime_ns, st.st_size)
+    cache = sidecar_path(path)
+    try:
+        with open(cache, 'rb') as f:
+            cached_key, data = marshal.load(f)
+        if cached_key == key:
+            return data
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    data = parse_file(path, fmt)
+    save_sidecar(cache, key, data)
+    return data
+
+
+def parse_importtime(lines):
+    """Записи вывода -X importtime: (суммарно мкс, собственное мкс, уровень, модуль)."""
+    records = []
+    for line in lines:
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            own, cumulative = int(fields[0]), int(fields[1])
+        except (ValueError, IndexError):
+            continue  # строка заголовка
+        name = fields[2].rstrip()[1:]
+        level = (len(name) - len(name.lstrip())) // 2
+        records.append((cumulative, own, level, name.strip()))
+    return records
+
+
+def run_import_profile(argv=None, limit=15, file=sys.stderr):
+    """
+    Перезапуск скрипта под python -X importtime и отчет о времени импорта.
+
+    Возвращает код завершения дочернего процесса.
+    """
+    import subprocess
+    argv = [arg for arg in (argv or sys.argv) if arg != IMPORT_PROFILE_FLAG]
+    result = subprocess.run([sys.executable, "-X", "importtime", *argv],
+                            stderr=subprocess.PIPE, text=True)
+    lines = result.stderr.splitlines()
+    for line in lines:
+        if not line.startswith("import time:"):
+            print(line, file=file)
+
+    records = parse_importtime(lines)
+    total = sum(cumulative for cumulative, _, level, _ in records if level == 0)
+    print(f"Импорт модулей: {total / 1000:.1f} мс, модулей: {len(records)}", file=file)
+    print(f"{'суммарно, мс':>14} {'собственное, мс':>16}  модуль", file=file)
+    for cumulative, own, _, name in sorted(records, reverse=True)[:limit]:
+        print(f"{cumulative / 1000:14.1f} {own / 1000:16.1f}  {name}", file=file)
+    return result.returncode
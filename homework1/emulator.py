@@ -1,13 +1,1128 @@
 import os
-import zipfile
-import yaml
-import xml.etree.ElementTree as ET
 import sys
+import abc
 import argparse
+import bisect
+import codecs
+import collections
+import contextlib
 import datetime
+import fnmatch
+import io
+import json
+import mmap
+import re
+import struct
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fastconfig
+
+# zipfile, hashlib, asyncio, cProfile и pstats импортируются там, где нужны:
+# короткие пакетные запуски не должны платить за них при старте.
+
+CHUNK_SIZE = 64 * 1024
+ZIP_STORED = 0  # zipfile.ZIP_STORED
+
+
+def format_size(size):
+    """Format a byte count the way 'du -h' does."""
+    for unit in ("", "K", "M", "G", "T"):
+        if size < 1024 or unit == "T":
+            break
+        size /= 1024
+    if unit == "":
+        return str(size)
+    return f"{size:.1f}{unit}" if size < 10 else f"{size:.0f}{unit}"
+
+
+def percentile(sorted_values, fraction):
+    """Return the nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def batch_stats(latencies, elapsed):
+    """Summarize per-command latencies (seconds) of a batch run."""
+    ordered = sorted(latencies)
+    return {
+        "commands": len(ordered),
+        "seconds": elapsed,
+        "commands_per_second": len(ordered) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p90_ms": percentile(ordered, 0.90) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "max_ms": (ordered[-1] if ordered else 0.0) * 1000,
+    }
+
+
+def print_batch_stats(stats, file=sys.stderr):
+    """Print the throughput report of a batch run."""
+    print(f"Команд выполнено: {stats['commands']} за {stats['seconds']:.3f} с "
+          f"({stats['commands_per_second']:.0f} команд/с)", file=file)
+    print(f"Задержка, мс: p50={stats['p50_ms']:.3f} p90={stats['p90_ms']:.3f} "
+          f"p99={stats['p99_ms']:.3f} max={stats['max_ms']:.3f}", file=file)
+
+
+def xml_escape(text):
+    """Escape &, < and > for XML text content."""
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def latency_bucket(seconds):
+    """Return the log2 histogram bucket of a latency: bucket k holds [2^(k-1), 2^k) us."""
+    return int(seconds * 1_000_000).bit_length()
+
+
+def bucket_label(bucket):
+    """Return a human-readable microsecond range of a histogram bucket."""
+    if bucket == 0:
+        return "<1us"
+    return f"{1 << (bucket - 1)}-{1 << bucket}us"
+
+
+class OutputBuffer:
+    """Text buffer that passes its contents on to a stream once it holds max_chars."""
+
+    def __init__(self, out, max_chars=CHUNK_SIZE):
+        self.out = out
+        self.max_chars = max_chars
+        self._parts = []
+        self._size = 0
+
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.max_chars:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        """Write the buffered text to the stream."""
+        if self._parts:
+            self.out.write("".join(self._parts))
+            self._parts.clear()
+            self._size = 0
+
+
+class SessionOutput:
+    """Output of one server command: text and file streams sent lazily.
+
+    File contents are kept as iterators, so the server reads the next
+    chunk only after the previous one has been drained to the client.
+    """
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        if text:
+            self.parts.append(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def stream(self, texts):
+        """Queue an iterator of text chunks."""
+        self.parts.append(texts)
+
+
+def decode_stream(chunks):
+    """Decode byte chunks incrementally, ending the text with a newline."""
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    last = ""
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+            last = text[-1]
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+        last = text[-1]
+    if last and last != "\n":
+        yield "\n"
+
+
+class CommandStats:
+    """Per-command call counts, total time and log2 latency histograms."""
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.total = collections.defaultdict(float)
+        self.slowest = collections.defaultdict(float)
+        self.histograms = collections.defaultdict(collections.Counter)
+
+    def record(self, name, seconds):
+        """Account one call of a command."""
+        self.calls[name] += 1
+        self.total[name] += seconds
+        if seconds > self.slowest[name]:
+            self.slowest[name] = seconds
+        self.histograms[name][latency_bucket(seconds)] += 1
+
+    def as_dict(self):
+        """Return the statistics as a JSON-serializable dictionary."""
+        result = {}
+        for name in sorted(self.calls):
+            calls = self.calls[name]
+            histogram = self.histograms[name]
+            result[name] = {
+                "calls": calls,
+                "total_ms": self.total[name] * 1000,
+                "mean_ms": self.total[name] * 1000 / calls,
+                "max_ms": self.slowest[name] * 1000,
+                "histogram": {bucket_label(bucket): histogram[bucket] for bucket in sorted(histogram)},
+            }
+        return result
+
+    def dump(self, path):
+        """Write the statistics to a JSON file."""
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.as_dict(), file, ensure_ascii=False, indent=2)
+
+    def report(self):
+        """Return the statistics as text lines, slowest commands first."""
+        stats = self.as_dict()
+        lines = []
+        for name in sorted(stats, key=lambda name: -stats[name]["total_ms"]):
+            item = stats[name]
+            histogram = " ".join(f"{label}:{count}" for label, count in item["histogram"].items())
+            lines.append(f"{name}: вызовов {item['calls']}, всего {item['total_ms']:.3f} мс, "
+                         f"среднее {item['mean_ms']:.3f} мс, макс {item['max_ms']:.3f} мс [{histogram}]")
+        return lines
+
+
+class XmlLogWriter:
+    """Append-only writer for the XML action log.
+
+    The file always ends with the closing ``</log>`` tag, so new entries are
+    written over it instead of reparsing and rewriting the whole document.
+    Entries are buffered and flushed in batches by count or by age. A
+    background thread flushes entries left pending while the shell is idle.
+    """
+
+    CLOSING_TAG = b"</log>"
+
+    def __init__(self, path, batch_size=64, flush_interval=1.0,
+                 max_bytes=1024 * 1024, backup_count=3):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._pending = []
+        self._pending_size = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flusher = None
+        self._file = None
+        self._end = 0
+        self._open()
+
+    def _open(self):
+        """Open the log file and find the position of the closing tag."""
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            self._file = open(self.path, "r+b")
+            end = self._find_closing_tag()
+            if end is not None:
+                self._end = end
+                return
+            # Файл поврежден или записан в другом формате: убираем его в ротацию
+            self._file.close()
+            self._shift_backups()
+
+        self._file = open(self.path, "w+b")
+        self._file.write(b"<log>" + self.CLOSING_TAG)
+        self._file.flush()
+        self._end = len(b"<log>")
+
+    def _find_closing_tag(self):
+        """Return the offset of the trailing ``</log>`` tag or None."""
+        size = self._file.seek(0, os.SEEK_END)
+        tail_start = max(0, size - 256)
+        self._file.seek(tail_start)
+        tail = self._file.read()
+        stripped = tail.rstrip()
+        if stripped.endswith(self.CLOSING_TAG):
+            return tail_start + len(stripped) - len(self.CLOSING_TAG)
+        if tail_start == 0 and tail.strip() == b"<log />":
+            # Пустой документ, записанный ElementTree как <log />
+            self._file.seek(0)
+            self._file.truncate()
+            self._file.write(b"<log>" + self.CLOSING_TAG)
+            return len(b"<log>")
+        return None
+
+    def write(self, timestamp, action, user):
+        """Queue one log entry and flush if a threshold is reached."""
+        entry = (
+            f"<log_entry><timestamp>{xml_escape(timestamp)}</timestamp>"
+            f"<action>{xml_escape(action)}</action>"
+            f"<user>{xml_escape(user)}</user></log_entry>"
+        ).encode("ascii", "xmlcharrefreplace")
+        with self._lock:
+            self._pending.append(entry)
+            self._pending_size += len(entry)
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush()
+        if self._flusher is None and self.flush_interval > 0:
+            self._start_flusher()
+
+    def _start_flusher(self):
+        """Start the thread that flushes entries older than flush_interval."""
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True,
+                                         name="xml-log-flusher")
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        """Flush pending entries once flush_interval has passed since the last flush."""
+        with self._lock:
+            if self._pending and time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        """Write all pending entries to disk."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if not self._pending or self._file is None:
+            return
+
+        if self.max_bytes and self._end + self._pending_size > self.max_bytes \
+                and self._end > len(b"<log>"):
+            self._rotate()
+
+        data = b"".join(self._pending)
+        self._pending.clear()
+        self._pending_size = 0
+
+        self._file.seek(self._end)
+        self._file.write(data + self.CLOSING_TAG)
+        self._file.flush()
+        self._end += len(data)
+
+    def _shift_backups(self):
+        """Rename log -> log.1 -> log.2 ... dropping the oldest backup."""
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def _rotate(self):
+        """Start a new log file, keeping the old one as a backup."""
+        self._file.close()
+        self._shift_backups()
+        self._file = open(self.path, "w+b")
+        self._file.write(b"<log>" + self.CLOSING_TAG)
+        self._end = len(b"<log>")
+
+    def close(self):
+        """Flush pending entries and close the file."""
+        self._closed.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush()
+            self._file.close()
+            self._file = None
+
+
+class VfsNode:
+    """A file or directory of the virtual file system."""
+
+    __slots__ = ("name", "parent", "children", "size", "source", "_sorted")
+
+    def __init__(self, name, parent=None, is_dir=True, size=0, source=None):
+        self.name = name
+        self.parent = parent
+        self.children = {} if is_dir else None
+        self.size = size
+        self.source = source
+        self._sorted = None
+
+    @property
+    def is_dir(self):
+        return self.children is not None
+
+    @property
+    def path(self):
+        parts = []
+        node = self
+        while node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        return "/" + "/".join(reversed(parts))
+
+    def sorted_names(self):
+        """Return child names in sorted order, cached until the next change."""
+        if self._sorted is None:
+            self._sorted = sorted(self.children)
+        return self._sorted
+
+
+class VirtualFileSystem(abc.ABC):
+    """In-memory directory tree built once when the image is loaded.
+
+    Backends only fill the tree and know how to open a file node;
+    navigation never touches the real file system. Every node is also
+    indexed by its normalized absolute path, so resolving a path is a
+    single dict lookup.
+    """
+
+    def __init__(self):
+        self.root = VfsNode("")
+        self._index = {"/": self.root}
+        self._search = None
+
+    def search_index(self):
+        """Return the search index, building it on first use."""
+        if self._search is None:
+            self._search = SearchIndex(self)
+        return self._search
+
+    def iter_nodes(self, path="/"):
+        """Yield (path, node) pairs for the node at path and all its descendants."""
+        if path == "/":
+            yield from self._index.items()
+            return
+        prefix = path + "/"
+        for key, node in self._index.items():
+            if key == path or key.startswith(prefix):
+                yield key, node
+
+    def _add(self, path, is_dir, size=0, source=None):
+        """Insert a node, creating missing parent directories.
+
+        Empty, "." and ".." components are dropped, as ImageCache.extract
+        does, so archive names like "./a" or "../a" land inside the root.
+        """
+        parts = [part for part in path.split("/") if part not in ("", ".", "..")]
+        if not parts:
+            return self.root
+
+        node = self.root
+        node_path = ""
+        for part in parts[:-1]:
+            node_path += "/" + part
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = VfsNode(part, node)
+                node._sorted = None
+                self._index[node_path] = child
+            node = child
+
+        name = parts[-1]
+        child = node.children.get(name)
+        if child is None:
+            child = node.children[name] = VfsNode(name, node, is_dir, size, source)
+            node._sorted = None
+            self._index[node_path + "/" + name] = child
+        elif not is_dir:
+            child.size = size
+            child.source = source
+        return child
+
+    @staticmethod
+    def normalize(cwd, path):
+        """Return the normalized absolute path, or None if it leaves the root.
+
+        Handles absolute and relative paths, '.', '..' and repeated slashes.
+        """
+        parts = [] if path.startswith("/") else [part for part in cwd.split("/") if part]
+        for part in path.split("/"):
+            if not part or part == ".":
+                continue
+            if part == "..":
+                if not parts:
+                    return None
+                parts.pop()
+            else:
+                parts.append(part)
+        return "/" + "/".join(parts)
+
+    def resolve(self, cwd, path):
+        """Return the node for a path relative to cwd or None."""
+        normalized = self.normalize(cwd, path)
+        if normalized is None:
+            return None
+        return self._index.get(normalized)
+
+    def get_node(self, path):
+        """Return the node for an absolute path or None."""
+        node = self._index.get(path)
+        if node is None:
+            node = self.resolve("/", path)
+        return node
+
+    def isdir(self, path):
+        node = self.get_node(path)
+        return node is not None and node.is_dir
+
+    def listdir(self, path):
+        """Return sorted entry names of a directory or None."""
+        node = self.get_node(path)
+        if node is None or not node.is_dir:
+            return None
+        return list(node.sorted_names())
+
+    def complete(self, cwd, text):
+        """Return completions of a (possibly partial) path.
+
+        Directories are completed with a trailing slash.
+        """
+        head, _, prefix = text.rpartition("/")
+        if text.startswith("/") and not head:
+            head = "/"
+        node = self.resolve(cwd, head or ".")
+        if node is None or not node.is_dir:
+            return []
+
+        names = node.sorted_names()
+        if head and not head.endswith("/"):
+            head += "/"
+        result = []
+        for i in range(bisect.bisect_left(names, prefix), len(names)):
+            name = names[i]
+            if not name.startswith(prefix):
+                break
+            suffix = "/" if node.children[name].is_dir else ""
+            result.append(head + name + suffix)
+        return result
+
+    def total_size(self, path):
+        """Return the total size of all files under the path."""
+        node = self.get_node(path)
+        return 0 if node is None else node.size
+
+    def _aggregate_sizes(self):
+        """Compute directory sizes bottom-up once after loading."""
+        order = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.is_dir:
+                order.append(node)
+                stack.extend(child for child in node.children.values() if child.is_dir)
+        for node in reversed(order):
+            node.size = sum(child.size for child in node.children.values())
+
+    def _propagate_size(self, node, delta):
+        """Apply a size change to a directory and all of its ancestors."""
+        while node is not None and delta:
+            node.size += delta
+            node = node.parent
+
+    def add_file(self, path, size=0, source=None):
+        """Add or resize a file, updating only the affected ancestors."""
+        old = self.get_node(path)
+        if old is not None and old.is_dir:
+            raise IsADirectoryError(path)
+        old_size = 0 if old is None else old.size
+        node = self._add(path, False, size, source)
+        self._propagate_size(node.parent, size - old_size)
+        self._search = None
+        return node
+
+    def remove(self, path):
+        """Remove a file or directory subtree from the tree."""
+        node = self.get_node(path)
+        if node is None or node is self.root:
+            raise FileNotFoundError(path)
+        prefix = node.path
+        del node.parent.children[node.name]
+        node.parent._sorted = None
+        for key in [key for key in self._index if key == prefix or key.startswith(prefix + "/")]:
+            del self._index[key]
+        self._propagate_size(node.parent, -node.size)
+        node.parent = None
+        self._search = None
+
+    @abc.abstractmethod
+    def open(self, node):
+        """Open a file node for binary reading."""
+
+    def iter_chunks(self, node, chunk_size=CHUNK_SIZE):
+        """Yield the content of a file node in fixed-size chunks."""
+        with self.open(node) as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def iter_lines(self, node):
+        """Yield decoded lines of a file node without reading it whole."""
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        rest = ""
+        for chunk in self.iter_chunks(node):
+            lines = (rest + decoder.decode(chunk)).split("\n")
+            rest = lines.pop()
+            yield from lines
+        rest += decoder.decode(b"", final=True)
+        if rest:
+            yield rest
+
+    def head(self, node, lines):
+        """Yield chunks up to and including the n-th newline."""
+        if lines <= 0:
+            return
+        for chunk in self.iter_chunks(node):
+            count = chunk.count(b"\n")
+            if count < lines:
+                lines -= count
+                yield chunk
+                continue
+            end = -1
+            for _ in range(lines):
+                end = chunk.index(b"\n", end + 1)
+            yield chunk[:end + 1]
+            return
+
+    def tail(self, node, lines):
+        """Return the bytes of the last n lines of a file node."""
+        if lines <= 0:
+            return b""
+        # По умолчанию сжатые данные можно только читать по порядку:
+        # храним не больше n последних строк
+        last = collections.deque(maxlen=lines + 1)
+        partial = b""
+        for chunk in self.iter_chunks(node):
+            pieces = (partial + chunk).split(b"\n")
+            partial = pieces.pop()
+            last.extend(pieces)
+        if partial:
+            last.append(partial)
+            return b"\n".join(list(last)[-lines:])
+        return b"\n".join(list(last)[-lines:]) + b"\n" if last else b""
+
+    @staticmethod
+    def _tail_seekable(f, size, lines, offset=0):
+        """Read the last n lines by seeking backwards from the end of a file.
+
+        offset is where the data starts in f, e.g. a member inside an archive.
+        """
+        end = size
+        pos = size
+        found = 0
+        # Завершающий перевод строки не начинает новую строку
+        skip_last = True
+        while pos > 0:
+            step = min(CHUNK_SIZE, pos)
+            pos -= step
+            f.seek(offset + pos)
+            chunk = f.read(step)
+            index = len(chunk)
+            while True:
+                index = chunk.rfind(b"\n", 0, index)
+                if index < 0:
+                    break
+                if skip_last and pos + index == size - 1:
+                    skip_last = False
+                    continue
+                found += 1
+                if found == lines:
+                    f.seek(offset + pos + index + 1)
+                    return f.read(end - pos - index - 1)
+            skip_last = False
+        f.seek(offset)
+        return f.read(end)
+
+    def read(self, path):
+        """Read the whole content of a file."""
+        node = self.get_node(path)
+        if node is None or node.is_dir:
+            raise FileNotFoundError(path)
+        with self.open(node) as f:
+            return f.read()
+
+    def close(self):
+        pass
+
+
+class SearchIndex:
+    """Filename and token-level inverted indexes over a virtual file system.
+
+    Both indexes are built lazily on the first find/grep and reused by every
+    session sharing the file system. grep uses the token index only to pick
+    candidate files and then checks their lines, so results are exact.
+    """
+
+    TOKEN_RE = re.compile(r"\w+")
+    CACHE_SIZE = 256
+
+    def __init__(self, fs):
+        self.fs = fs
+        self._names = None
+        self._tokens = None
+        self._vocabulary = None
+        self._cache = {}
+
+    def _build_names(self):
+        self._names = {}
+        for path, node in self.fs.iter_nodes():
+            if node is not self.fs.root:
+                self._names.setdefault(node.name, []).append(path)
+
+    def _build_tokens(self):
+        self._tokens = {}
+        for path, node in self.fs.iter_nodes():
+            if node.is_dir:
+                continue
+            tokens = set()
+            for line in self.fs.iter_lines(node):
+                tokens.update(self.TOKEN_RE.findall(line.lower()))
+            for token in tokens:
+                self._tokens.setdefault(token, set()).add(path)
+        self._vocabulary = sorted(self._tokens)
+
+    def find(self, pattern, start="/"):
+        """Return sorted paths under start whose name matches a glob pattern."""
+        if self._names is None:
+            self._build_names()
+        if any(char in pattern for char in "*?["):
+            paths = [path for name, paths in self._names.items()
+                     if fnmatch.fnmatchcase(name, pattern) for path in paths]
+        else:
+            paths = self._names.get(pattern, [])
+        if start != "/":
+            paths = [path for path in paths if path.startswith(start + "/")]
+        return sorted(paths)
+
+    def _paths_with_token(self, token, exact_start, exact_end):
+        """Return files containing a token, or a token fragment cut by the term."""
+        if exact_start and exact_end:
+            return self._tokens.get(token, set())
+
+        paths = set()
+        if exact_start:
+            # Фрагмент - начало слова: ищем по диапазону словаря
+            index = bisect.bisect_left(self._vocabulary, token)
+            while index < len(self._vocabulary) and self._vocabulary[index].startswith(token):
+                paths |= self._tokens[self._vocabulary[index]]
+                index += 1
+        else:
+            for word in self._vocabulary:
+                if (word.endswith(token) if exact_end else token in word):
+                    paths |= self._tokens[word]
+        return paths
+
+    def candidates(self, term):
+        """Return sorted files that may contain term, using the token index."""
+        if self._tokens is None:
+            self._build_tokens()
+        cached = self._cache.get(term)
+        if cached is not None:
+            return cached
+
+        result = None
+        for match in self.TOKEN_RE.finditer(term):
+            paths = self._paths_with_token(match.group().lower(),
+                                           exact_start=match.start() > 0,
+                                           exact_end=match.end() < len(term))
+            result = paths if result is None else result & paths
+            if not result:
+                break
+        if result is None:
+            result = [path for path, node in self.fs.iter_nodes() if not node.is_dir]
+        result = sorted(result)
+
+        if len(self._cache) >= self.CACHE_SIZE:
+            self._cache.clear()
+        self._cache[term] = result
+        return result
+
+    def grep(self, term, start="/", ignore_case=False):
+        """Yield (path, line number, line) for lines under start containing term."""
+        needle = term.lower() if ignore_case else term
+        for path in self.candidates(term):
+            if start != "/" and not path.startswith(start + "/"):
+                continue
+            for lineno, line in enumerate(self.fs.iter_lines(self.fs.get_node(path)), 1):
+                if needle in (line.lower() if ignore_case else line):
+                    yield path, lineno, line
+
+
+class ZipFileSystem(VirtualFileSystem):
+    """Virtual file system served directly from a zip archive.
+
+    The tree is built from the central directory only; file contents are
+    decompressed lazily when a file is opened.
+    """
+
+    def __init__(self, zip_path):
+        import zipfile
+        super().__init__()
+        self._zip = zipfile.ZipFile(zip_path, 'r')
+        for info in self._zip.infolist():
+            name = info.filename.replace("\\", "/")
+            if info.is_dir():
+                self._add(name, True)
+            else:
+                self._add(name, False, info.file_size, info)
+        self._aggregate_sizes()
+
+    def open(self, node):
+        return self._zip.open(node.source)
+
+    def tail(self, node, lines):
+        info = node.source
+        if info.compress_type != ZIP_STORED or info.flag_bits & 0x1 or lines <= 0:
+            return super().tail(node, lines)
+        # Несжатый элемент читается с конца прямо из файла архива:
+        # ZipExtFile.seek назад перечитывает элемент с начала
+        with open(self._zip.filename, "rb") as f:
+            f.seek(info.header_offset)
+            header = f.read(30)
+            if len(header) < 30 or header[:4] != b"PK\x03\x04":
+                return super().tail(node, lines)
+            name_length, extra_length = struct.unpack_from("<HH", header, 26)
+            offset = info.header_offset + 30 + name_length + extra_length
+            return self._tail_seekable(f, node.size, lines, offset)
+
+    def close(self):
+        self._zip.close()
+
+
+class DirectoryFileSystem(VirtualFileSystem):
+    """Virtual file system over an already extracted directory."""
+
+    def __init__(self, root_dir):
+        super().__init__()
+        for dirpath, dirnames, filenames in os.walk(root_dir):
+            rel = os.path.relpath(dirpath, root_dir).replace(os.sep, "/")
+            rel = "" if rel == "." else rel
+            for d in dirnames:
+                self._add(f"{rel}/{d}", True)
+            for f in filenames:
+                full_path = os.path.join(dirpath, f)
+                self._add(f"{rel}/{f}", False, os.path.getsize(full_path), full_path)
+        self._aggregate_sizes()
+
+    def open(self, node):
+        return open(node.source, "rb")
+
+    @contextlib.contextmanager
+    def _mapped(self, node):
+        """Memory-map a file node; yields None for empty files."""
+        with open(node.source, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield None
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+    def iter_chunks(self, node, chunk_size=CHUNK_SIZE):
+        with self._mapped(node) as mapped:
+            if mapped is None:
+                return
+            for start in range(0, len(mapped), chunk_size):
+                yield mapped[start:start + chunk_size]
+
+    def tail(self, node, lines):
+        if lines <= 0:
+            return b""
+        with self._mapped(node) as mapped:
+            if mapped is None:
+                return b""
+            size = len(mapped)
+            pos = size - 1 if mapped[size - 1:size] == b"\n" else size
+            for _ in range(lines):
+                pos = mapped.rfind(b"\n", 0, pos)
+                if pos < 0:
+                    return mapped[:]
+            return mapped[pos + 1:]
+
+
+def central_directory_digest(zip_path):
+    """Return the SHA-256 of a zip archive's central directory.
+
+    The central directory lists every member with its name, sizes and CRC,
+    so it identifies the image without reading or decompressing the data.
+    """
+    import hashlib
+    with open(zip_path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        tail_size = min(size, 22 + 0xFFFF)
+        f.seek(size - tail_size)
+        tail = f.read()
+        end = tail.rfind(b"PK\x05\x06")
+        if end < 0 or end + 22 > len(tail):
+            raise ValueError(f"{zip_path}: не найден центральный каталог zip-архива")
+        cd_size, cd_offset = struct.unpack_from("<II", tail, end + 12)
+        locator = end - 20
+        if (0xFFFFFFFF in (cd_size, cd_offset) and locator >= 0
+                and tail[locator:locator + 4] == b"PK\x06\x07"):
+            # Архив zip64: настоящие размер и смещение лежат в записи zip64
+            f.seek(struct.unpack_from("<Q", tail, locator + 8)[0])
+            cd_size, cd_offset = struct.unpack_from("<QQ", f.read(56), 40)
+
+        digest = hashlib.sha256()
+        f.seek(cd_offset)
+        remaining = cd_size
+        while remaining:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+        return digest.hexdigest()
+
+
+class ImageCache:
+    """Content-addressed cache of extracted virtual FS images.
+
+    Layout under the cache root:
+      images/<central directory digest>/ - one extracted tree per image
+      objects/<crc prefix>/<crc32>-<size>-<sha256> - shared content store
+      tmp/ - staging area, images are renamed into place when complete
+
+    Image files are hardlinks of store objects, so files shared by many
+    images are stored once; where hardlinks are not supported every image
+    keeps its own copy. Images are evicted least recently used first when
+    the cache exceeds max_bytes.
+    """
+
+    def __init__(self, root, max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.images_dir = os.path.join(root, "images")
+        self.objects_dir = os.path.join(root, "objects")
+        self.tmp_dir = os.path.join(root, "tmp")
+        self.buckets = set()
+        for path in (self.images_dir, self.objects_dir, self.tmp_dir):
+            os.makedirs(path, exist_ok=True)
+
+    def get(self, zip_path):
+        """Return the directory of an extracted image, extracting it on a miss."""
+        image = os.path.join(self.images_dir, central_directory_digest(zip_path))
+        if os.path.isdir(image):
+            os.utime(image)
+            return image
+
+        import shutil
+        staging = os.path.join(self.tmp_dir, f"{os.path.basename(image)}.{os.getpid()}")
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            self.extract(zip_path, staging)
+            os.rename(staging, image)
+        except OSError:
+            # Тот же образ мог успеть распаковать другой процесс
+            shutil.rmtree(staging, ignore_errors=True)
+            if not os.path.isdir(image):
+                raise
+        self.evict(keep=image)
+        return image
+
+    def extract(self, zip_path, target):
+        """Extract an archive into target through the content store."""
+        import shutil
+        import zipfile
+        index = self.object_index()
+        directories = {target}
+        files = set()
+        os.makedirs(target)
+        with zipfile.ZipFile(zip_path, "r") as archive:
+            for info in archive.infolist():
+                parts = [part for part in info.filename.replace("\\", "/").split("/")
+                         if part not in ("", ".", "..")]
+                if not parts:
+                    continue
+                path = os.path.join(target, *parts)
+                directory = path if info.is_dir() else os.path.dirname(path)
+                if directory not in directories:
+                    os.makedirs(directory, exist_ok=True)
+                    directories.add(directory)
+                if info.is_dir():
+                    continue
+                if path in files:
+                    # Повторяющееся имя в архиве: не пишем поверх ссылки на хранилище
+                    os.remove(path)
+                files.add(path)
+                self.store(archive, info, index, path)
+
+    def object_index(self):
+        """Map (crc, size) of stored objects to their SHA-256 digests."""
+        index = collections.defaultdict(set)
+        self.buckets = set()
+        for bucket in os.scandir(self.objects_dir):
+            self.buckets.add(bucket.path)
+            for entry in os.scandir(bucket.path):
+                crc, size, digest = entry.name.split("-")
+                index[crc, size].add(digest)
+        return index
+
+    def store(self, archive, info, index, path):
+        """Place an archive member at path, sharing its content through the store.
+
+        Objects are named <crc32>-<size>-<sha256> and grouped by the first
+        byte of the CRC; index is the object_index() of this extraction.
+        New content is written straight to path and then linked into the
+        store, known content is linked from the store without writing.
+        """
+        import hashlib
+        import shutil
+        crc, size = f"{info.CRC:08x}", str(info.file_size)
+        bucket = os.path.join(self.objects_dir, crc[:2])
+        candidates = index.get((crc, size))
+        if candidates:
+            # CRC и размер совпали: сверяем SHA-256, не записывая данные на диск
+            digest = hashlib.sha256()
+            with archive.open(info) as src:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+            if digest.hexdigest() in candidates:
+                stored = os.path.join(bucket, f"{crc}-{size}-{digest.hexdigest()}")
+                try:
+                    os.link(stored, path)
+                except OSError:
+                    shutil.copyfile(stored, path)
+                return
+
+        digest = hashlib.sha256()
+        with archive.open(info) as src, open(path, "wb") as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                dst.write(chunk)
+        if bucket not in self.buckets:
+            os.makedirs(bucket, exist_ok=True)
+            self.buckets.add(bucket)
+        try:
+            os.link(path, os.path.join(bucket, f"{crc}-{size}-{digest.hexdigest()}"))
+        except FileExistsError:
+            pass
+        except OSError:
+            # Жесткие ссылки не поддерживаются: образ хранит свою копию
+            return
+        index[crc, size].add(digest.hexdigest())
+
+    def usage(self):
+        """Return the bytes used by the cache, counting hardlinked files once."""
+        seen = set()
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                st = os.lstat(os.path.join(dirpath, name))
+                if (st.st_dev, st.st_ino) not in seen:
+                    seen.add((st.st_dev, st.st_ino))
+                    total += st.st_size
+        return total
+
+    def collect_garbage(self):
+        """Remove store objects no longer linked from any image."""
+        for bucket in os.listdir(self.objects_dir):
+            bucket_path = os.path.join(self.objects_dir, bucket)
+            for name in os.listdir(bucket_path):
+                path = os.path.join(bucket_path, name)
+                if os.stat(path).st_nlink <= 1:
+                    os.remove(path)
+            if not os.listdir(bucket_path):
+                os.rmdir(bucket_path)
+
+    def evict(self, keep=None):
+        """Drop least recently used images until the cache fits max_bytes.
+
+        The cache is walked once: removing an image frees the files that
+        no remaining image links to, and the store objects left without
+        links are collected after the loop.
+        """
+        if not self.max_bytes:
+            return
+        import shutil
+        sizes = {}
+        links = collections.Counter()
+        image_files = collections.defaultdict(list)
+        usage = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            image = None
+            if dirpath.startswith(self.images_dir + os.sep):
+                name = os.path.relpath(dirpath, self.images_dir).split(os.sep)[0]
+                image = os.path.join(self.images_dir, name)
+            for name in filenames:
+                st = os.lstat(os.path.join(dirpath, name))
+                key = (st.st_dev, st.st_ino)
+                if key not in sizes:
+                    sizes[key] = st.st_size
+                    usage += st.st_size
+                if image is not None:
+                    image_files[image].append(key)
+                    links[key] += 1
+
+        images = sorted((os.stat(path).st_mtime, path) for path in
+                        (os.path.join(self.images_dir, name) for name in os.listdir(self.images_dir)))
+        removed = False
+        for _, image in images:
+            if usage <= self.max_bytes:
+                break
+            if image == keep:
+                continue
+            shutil.rmtree(image)
+            removed = True
+            for key in image_files[image]:
+                links[key] -= 1
+                if not links[key]:
+                    usage -= sizes[key]
+        if removed:
+            self.collect_garbage()
+
 
 class ShellEmulator:
-    def __init__(self, config_file):
+    # Имя команды -> метод-обработчик, вызываемый как handler(cmd, args)
+    COMMANDS = {
+        "cat": "cmd_cat",
+        "cd": "cmd_cd",
+        "du": "cmd_du",
+        "exit": "cmd_exit",
+        "find": "cmd_find",
+        "grep": "cmd_grep",
+        "head": "cmd_head_tail",
+        "ls": "cmd_ls",
+        "profile": "cmd_profile",
+        "stats": "cmd_stats",
+        "tail": "cmd_head_tail",
+        "wc": "cmd_wc",
+        "whoami": "cmd_whoami",
+    }
+    COMMAND_NAMES = tuple(sorted(COMMANDS))
+    PROFILE_LINES = 20
+    # Атрибуты, которые у каждого сеанса свои; остальные общие с родителем
+    SESSION_STATE = ("current_path", "history", "username", "interactive", "running", "owns_resources")
+
+    def __init__(self, config_file=None, parent=None, username=None):
+        """Load the configuration and the image, or open a session of parent.
+
+        A session shares every attribute of parent (configuration, file
+        system, log writer, statistics) except those in SESSION_STATE.
+        """
+        if parent is not None:
+            vars(self).update((name, value) for name, value in vars(parent).items()
+                              if name not in self.SESSION_STATE)
+            self.current_path = "/"
+            self.history = []
+            self.username = username or parent.username
+            self.interactive = False
+            self.running = True
+            self.owns_resources = False
+            return
+
         self.current_path = "/"
         self.history = []
         self.username = "user"
@@ -15,20 +1130,52 @@ class ShellEmulator:
         self.virtual_fs_path = ""
         self.log_file_path = ""
         self.virtual_fs_dir = "virtual_fs"
+        self.virtual_fs_mode = "zip"
+        self.image_cache_dir = "virtual_fs_cache"
+        self.image_cache_max_bytes = 1 << 30
+        self.fs = None
+        self.interactive = True
+        self.running = True
+        self.owns_resources = True
+        self.log_options = {}
+        self.stats = CommandStats()
+        self.stats_path = ""
 
         self.read_config(config_file)
-        self.extract_virtual_fs()
+        self.logger = XmlLogWriter(self.log_file_path, **self.log_options)
+        self.load_virtual_fs()
         self.log_action("Эмулятор запущен")
 
+    def spawn_session(self, username=None):
+        """Create a lightweight session sharing this emulator's image and log.
+
+        The session only owns its current path, history and username; the
+        file system index and the log writer are shared and never closed by it.
+        """
+        return type(self)(parent=self, username=username)
+
+    def prompt(self):
+        """Return the command prompt string."""
+        return f"{self.username}@{self.computer_name}:{self.current_path} $ "
+
     def read_config(self, config_file):
         """Load configuration from the provided YAML file."""
         try:
-            with open(config_file, 'r') as file:
-                config = yaml.safe_load(file)
+            config = fastconfig.load_config(config_file)
 
             self.username = config.get("username", self.username)
             self.virtual_fs_path = config.get("virtual_fs_path", "")
             self.log_file_path = config.get("log_file_path", "")
+            self.virtual_fs_mode = config.get("virtual_fs_mode", self.virtual_fs_mode)
+            self.stats_path = config.get("stats_path", self.stats_path)
+            self.image_cache_dir = config.get("image_cache_dir", self.image_cache_dir)
+            self.image_cache_max_bytes = config.get("image_cache_max_bytes", self.image_cache_max_bytes)
+            for key, option in (("log_batch_size", "batch_size"),
+                                ("log_flush_interval", "flush_interval"),
+                                ("log_max_bytes", "max_bytes"),
+                                ("log_backup_count", "backup_count")):
+                if key in config:
+                    self.log_options[option] = config[key]
 
             if not self.virtual_fs_path or not os.path.exists(self.virtual_fs_path):
                 print("Ошибка: путь к виртуальной файловой системе некорректен.")
@@ -39,139 +1186,571 @@ class ShellEmulator:
             sys.exit(1)
 
     def extract_virtual_fs(self):
-        """Extract the virtual file system from the zip archive."""
-        if not os.path.exists(self.virtual_fs_dir):
-            os.mkdir(self.virtual_fs_dir)
+        """Extract the virtual file system through the image cache.
 
-        with zipfile.ZipFile(self.virtual_fs_path, 'r') as zip_ref:
-            zip_ref.extractall(self.virtual_fs_dir)
+        A known image costs only a hash of the zip's central directory.
+        """
+        cache = ImageCache(self.image_cache_dir, self.image_cache_max_bytes)
+        self.virtual_fs_dir = cache.get(self.virtual_fs_path)
+
+    def load_virtual_fs(self):
+        """Build the in-memory tree of the virtual file system."""
+        if self.virtual_fs_mode == "extract":
+            self.extract_virtual_fs()
+            self.fs = DirectoryFileSystem(self.virtual_fs_dir)
+        else:
+            self.fs = ZipFileSystem(self.virtual_fs_path)
 
     def log_action(self, action):
         """Log an action with a timestamp in XML format."""
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        log_entry = ET.Element("log_entry")
-        ET.SubElement(log_entry, "timestamp").text = timestamp
-        ET.SubElement(log_entry, "action").text = action
-        ET.SubElement(log_entry, "user").text = self.username
-
-        if os.path.exists(self.log_file_path):
-            tree = ET.parse(self.log_file_path)
-            root = tree.getroot()
-            root.append(log_entry)
-            tree.write(self.log_file_path)
-        else:
-            root = ET.Element("log")
-            root.append(log_entry)
-            tree = ET.ElementTree(root)
-            tree.write(self.log_file_path)
+        self.logger.write(timestamp, action, self.username)
 
-    def list_files(self):
+    def list_files(self, path=None):
         """Simulate the 'ls' command."""
-        path = os.path.join(self.virtual_fs_dir, self.current_path.strip("/"))
-        try:
-            files = os.listdir(path)
-            if files:
-                print("\n".join(files))
-            else:
-                print("Пустая директория")
-            self.log_action("ls")
-        except FileNotFoundError:
+        action = "ls" if path is None else f"ls {path}"
+        node = self.fs.resolve(self.current_path, path or ".")
+        if node is None or not node.is_dir:
             print("Директория не найдена")
-            self.log_action("ls (ошибка: директория не найдена)")
+            self.log_action(f"{action} (ошибка: директория не найдена)")
+            return
+        files = node.sorted_names()
+        if files:
+            print("\n".join(files))
+        else:
+            print("Пустая директория")
+        self.log_action(action)
 
     def change_directory(self, path):
         """Simulate the 'cd' command."""
-        if path == "..":
-            # Проверка, находимся ли мы в корневой директории
-            if self.current_path == "" or self.current_path == "/":
-                print("Вы не можете выйти за пределы виртуальной файловой системы.")
-                self.log_action("cd .. (ошибка: выход из корневой директории запрещен)")
-                return
-            else:
-                # Переход на уровень выше
-                parts = self.current_path.split("/")
-                parts.pop()  # Удаляем последний элемент (текущую директорию)
-                self.current_path = "/".join(parts) or "/"  # Если ничего не осталось, устанавливаем в корень
-                return
+        new_path = self.fs.normalize(self.current_path, path)
 
-        # Формируем новый путь
-        new_path = os.path.join(f"virtual_fs{self.current_path}", path)
+        # Проверка, не выходим ли мы за пределы корневой директории
+        if new_path is None:
+            print("Вы не можете выйти за пределы виртуальной файловой системы.")
+            self.log_action(f"cd {path} (ошибка: выход из корневой директории запрещен)")
+            return
 
         # Проверка существования директории
-        if os.path.isdir(new_path):
-            self.current_path = new_path.replace("virtual_fs", "")
+        if self.fs.isdir(new_path):
+            self.current_path = new_path
             return
         else:
             print("Директория не найдена")
             self.log_action(f"cd {path} (ошибка: директория не найдена)")
-    
 
+    def complete(self, line):
+        """Return completions for the last word of a command line."""
+        parts = line.split(" ")
+        if len(parts) == 1:
+            return [name + " " for name in self.COMMAND_NAMES if name.startswith(parts[0])]
+        prefix = " ".join(parts[:-1]) + " "
+        return [prefix + match for match in self.fs.complete(self.current_path, parts[-1])]
 
     def whoami(self):
         """Simulate the 'whoami' command."""
         print(f"Пользователь: {self.username}")
         self.log_action("whoami")
 
-    def disk_usage(self):
-        """Simulate the 'du' command."""
-        path = os.path.join(self.virtual_fs_dir, self.current_path.strip("/"))
-        total_size = 0
-        for dirpath, dirnames, filenames in os.walk(path):
-            for f in filenames:
-                fp = os.path.join(dirpath, f)
-                total_size += os.path.getsize(fp)
-        
-        print(f"Используемое пространство: {total_size} байт")
-        self.log_action("du")
+    def disk_usage(self, args=()):
+        """Simulate the 'du' command.
+
+        Supports -s (total only), -h (human-readable sizes) and an optional path.
+        Sizes are precomputed per directory, so any subtree costs O(children).
+        """
+        action = " ".join(("du",) + tuple(args))
+        summary = human = False
+        path = "."
+        for arg in args:
+            if arg.startswith("-") and len(arg) > 1:
+                for flag in arg[1:]:
+                    if flag == "s":
+                        summary = True
+                    elif flag == "h":
+                        human = True
+                    else:
+                        print(f"du: неизвестный параметр -{flag}")
+                        self.log_action(f"{action} (ошибка: неизвестный параметр)")
+                        return
+            else:
+                path = arg
+
+        node = self.fs.resolve(self.current_path, path)
+        if node is None:
+            print("Директория не найдена")
+            self.log_action(f"{action} (ошибка: директория не найдена)")
+            return
+
+        fmt = format_size if human else str
+        if node.is_dir and not summary:
+            for name in node.sorted_names():
+                child = node.children[name]
+                print(f"{fmt(child.size)}\t{name}{'/' if child.is_dir else ''}")
+
+        if human:
+            print(f"Используемое пространство: {format_size(node.size)}")
+        else:
+            print(f"Используемое пространство: {node.size} байт")
+        self.log_action(action)
+
+    def find_files(self, pattern):
+        """Simulate the 'find' command: search names under the current directory."""
+        paths = self.fs.search_index().find(pattern, self.current_path)
+        if paths:
+            print("\n".join(paths))
+        else:
+            print("Ничего не найдено")
+        self.log_action(f"find {pattern}")
+
+    def grep_files(self, args):
+        """Simulate the 'grep' command: search file contents under the current directory."""
+        ignore_case = bool(args) and args[0] == "-i"
+        term = " ".join(args[1:] if ignore_case else args)
+        if not term:
+            print("Нужен аргумент для команды grep.")
+            return
+        found = False
+        for path, lineno, line in self.fs.search_index().grep(term, self.current_path, ignore_case):
+            print(f"{path}:{lineno}:{line}")
+            found = True
+        if not found:
+            print("Ничего не найдено")
+        self.log_action(f"grep {' '.join(args)}")
+
+    def _open_file(self, path, action):
+        """Resolve a file argument, printing and logging errors."""
+        node = self.fs.resolve(self.current_path, path)
+        if node is None:
+            print(f"Файл не найден: {path}")
+            self.log_action(f"{action} (ошибка: файл не найден)")
+            return None
+        if node.is_dir:
+            print(f"{path}: это директория")
+            self.log_action(f"{action} (ошибка: это директория)")
+            return None
+        return node
+
+    @staticmethod
+    def _write_stream(chunks):
+        """Decode byte chunks incrementally and write them to stdout."""
+        texts = decode_stream(chunks)
+        stream = getattr(sys.stdout, "stream", None)
+        if stream is not None:
+            # Сервер сам читает поток по мере отправки клиенту
+            stream(texts)
+            return
+        for text in texts:
+            sys.stdout.write(text)
+
+    @staticmethod
+    def _parse_line_count(args, default=10):
+        """Parse '-n N', '-nN' or '-N' options; return (count, rest) or None."""
+        count = default
+        rest = []
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg == "-n" and args:
+                arg = "-n" + args.pop(0)
+            if arg.startswith("-n") and arg[2:].isdigit():
+                count = int(arg[2:])
+            elif arg.startswith("-") and arg[1:].isdigit():
+                count = int(arg[1:])
+            elif arg.startswith("-"):
+                return None
+            else:
+                rest.append(arg)
+        return count, rest
+
+    def cat_files(self, paths):
+        """Simulate the 'cat' command, streaming each file in chunks."""
+        if not paths:
+            print("Нужен аргумент для команды cat.")
+            return
+        for path in paths:
+            node = self._open_file(path, f"cat {path}")
+            if node is not None:
+                self._write_stream(self.fs.iter_chunks(node))
+                self.log_action(f"cat {path}")
+
+    def head_tail(self, cmd, args):
+        """Simulate the 'head' and 'tail' commands."""
+        action = " ".join([cmd] + list(args))
+        parsed = self._parse_line_count(args)
+        if parsed is None or len(parsed[1]) != 1:
+            print(f"Использование: {cmd} [-n N] <файл>")
+            return
+        count, (path,) = parsed
+        node = self._open_file(path, action)
+        if node is None:
+            return
+        if cmd == "head":
+            self._write_stream(self.fs.head(node, count))
+        else:
+            self._write_stream([self.fs.tail(node, count)])
+        self.log_action(action)
+
+    def word_count(self, paths):
+        """Simulate the 'wc' command: lines, words and bytes of files."""
+        if not paths:
+            print("Нужен аргумент для команды wc.")
+            return
+        for path in paths:
+            node = self._open_file(path, f"wc {path}")
+            if node is None:
+                continue
+            lines = words = size = 0
+            in_word = False
+            for chunk in self.fs.iter_chunks(node):
+                lines += chunk.count(b"\n")
+                size += len(chunk)
+                words += len(chunk.split())
+                # Слово, разрезанное границей блоков, считаем один раз
+                if in_word and chunk[:1] and not chunk[:1].isspace():
+                    words -= 1
+                in_word = not chunk[-1:].isspace()
+            print(f"{lines} {words} {size} {path}")
+            self.log_action(f"wc {path}")
 
     def exit_shell(self):
-        """Exit the shell emulator."""
+        """Exit the shell emulator.
+
+        In batch mode 'exit' only ends the script instead of the process.
+        """
         self.log_action("Эмулятор завершен")
+        self.running = False
+        if self.owns_resources:
+            self.logger.close()
+            self.fs.close()
+            if self.stats_path:
+                self.stats.dump(self.stats_path)
         print("Выход из эмулятора.")
-        sys.exit(0)
+        if self.interactive:
+            sys.exit(0)
+
+    def run_batch(self, commands, flush_every=1000, flush_chars=CHUNK_SIZE):
+        """Run commands non-interactively and return throughput statistics.
+
+        Prompts are not printed and command output is buffered and written
+        out every flush_every commands or once flush_chars are buffered.
+        """
+        self.interactive = False
+        latencies = []
+        out = sys.stdout
+        buffer = OutputBuffer(out, flush_chars)
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(buffer):
+                for command in commands:
+                    command = command.strip()
+                    if not command or command.startswith("#"):
+                        continue
+                    began = time.perf_counter()
+                    self.execute_command(command)
+                    latencies.append(time.perf_counter() - began)
+                    if not self.running:
+                        break
+                    if len(latencies) % flush_every == 0:
+                        buffer.flush()
+                if self.running:
+                    self.exit_shell()
+        finally:
+            buffer.flush()
+            out.flush()
+        return batch_stats(latencies, time.perf_counter() - start)
 
     def execute_command(self, command):
-        """Parse and execute commands."""
+        """Parse a command line and dispatch it through the command table."""
         self.history.append(command)
         parts = command.split()
-        
-        if not parts:
-            return
-        
-        cmd = parts[0]
-        
-        if cmd == "ls":
-            self.list_files()
-        elif cmd == "cd":
-            if len(parts) > 1:
-                self.change_directory(parts[1])
+        if parts:
+            self.dispatch(parts[0], parts[1:])
+
+    def dispatch(self, cmd, args):
+        """Run one command and account its latency in the statistics."""
+        handler = self.COMMANDS.get(cmd)
+        began = time.perf_counter()
+        try:
+            if handler is None:
+                print(f"{self.username}: команда не найдена")
+                self.log_action(f"{cmd} (неизвестная команда)")
             else:
-                print("Нужен аргумент для команды cd.")
-                
-        elif cmd == "whoami":
-            self.whoami()
-            
-        elif cmd == "du":
-            self.disk_usage()
-            
-        elif cmd == "exit":
-            self.exit_shell()
-            
+                getattr(self, handler)(cmd, args)
+        finally:
+            # Неизвестные команды считаются вместе, чтобы опечатки не раздували таблицу
+            self.stats.record(cmd if handler else "?", time.perf_counter() - began)
+
+    def cmd_ls(self, cmd, args):
+        self.list_files(args[0] if args else None)
+
+    def cmd_cd(self, cmd, args):
+        if args:
+            self.change_directory(args[0])
+        else:
+            print("Нужен аргумент для команды cd.")
+
+    def cmd_whoami(self, cmd, args):
+        self.whoami()
+
+    def cmd_du(self, cmd, args):
+        self.disk_usage(args)
+
+    def cmd_find(self, cmd, args):
+        if args:
+            self.find_files(args[0])
         else:
-            print(f"{self.username}: команда не найдена")
-            self.log_action(f"{cmd} (неизвестная команда)")
+            print("Нужен аргумент для команды find.")
+
+    def cmd_grep(self, cmd, args):
+        self.grep_files(args)
+
+    def cmd_cat(self, cmd, args):
+        self.cat_files(args)
+
+    def cmd_head_tail(self, cmd, args):
+        self.head_tail(cmd, args)
+
+    def cmd_wc(self, cmd, args):
+        self.word_count(args)
+
+    def cmd_exit(self, cmd, args):
+        self.exit_shell()
+
+    def cmd_stats(self, cmd, args):
+        """Print command statistics; 'stats --json' prints them as JSON."""
+        if args and args[0] == "--json":
+            print(json.dumps(self.stats.as_dict(), ensure_ascii=False, indent=2))
+            return
+        lines = self.stats.report()
+        if not lines:
+            print("Статистика пуста.")
+        for line in lines:
+            print(line)
+
+    def cmd_profile(self, cmd, args):
+        """Run one command under cProfile and print its hottest functions."""
+        if not args:
+            print("Нужен аргумент для команды profile.")
+            return
+        if args[0] == "profile":
+            print("profile: вложенное профилирование не поддерживается.")
+            return
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            self.dispatch(args[0], args[1:])
+        finally:
+            profiler.disable()
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(self.PROFILE_LINES)
+        print(report.getvalue().rstrip())
+
+class EmulatorServer:
+    """Asyncio server hosting many emulator sessions over one shared image.
+
+    Every connection gets its own session; the file system index and the
+    log writer belong to the base emulator and are shared by all sessions.
+    """
+
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.emulator.interactive = False
+        self.active_sessions = 0
+
+    def run_command(self, session, command):
+        """Execute one command in a session and return its SessionOutput."""
+        output = SessionOutput()
+        # Команды выполняются синхронно, поэтому подмена stdout безопасна
+        with contextlib.redirect_stdout(output):
+            session.execute_command(command)
+        return output
+
+    @staticmethod
+    async def send_output(writer, output):
+        """Send command output, reading file streams one chunk per drain."""
+        text = []
+        for part in output.parts:
+            if isinstance(part, str):
+                text.append(part)
+                continue
+            if text:
+                writer.write("".join(text).encode("utf-8"))
+                text.clear()
+            try:
+                for chunk in part:
+                    writer.write(chunk.encode("utf-8"))
+                    await writer.drain()
+            finally:
+                part.close()
+        if text:
+            writer.write("".join(text).encode("utf-8"))
+
+    async def handle_client(self, reader, writer):
+        session = self.emulator.spawn_session()
+        self.active_sessions += 1
+        session.log_action("Сеанс открыт")
+        try:
+            writer.write(session.prompt().encode("utf-8"))
+            await writer.drain()
+            while session.running:
+                line = await reader.readline()
+                if not line:
+                    break
+                output = self.run_command(session, line.decode("utf-8", "replace").strip())
+                await self.send_output(writer, output)
+                if session.running:
+                    writer.write(session.prompt().encode("utf-8"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if session.running:
+                session.log_action("Сеанс прерван")
+            self.active_sessions -= 1
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=0, unix_path=None):
+        """Start listening on a TCP port or a Unix socket."""
+        import asyncio
+        if unix_path:
+            return await asyncio.start_unix_server(self.handle_client, unix_path, backlog=4096)
+        return await asyncio.start_server(self.handle_client, host, port, backlog=4096)
+
+    async def serve_forever(self, host="127.0.0.1", port=0, unix_path=None):
+        server = await self.start(host, port, unix_path)
+        addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+        print(f"Сервер эмулятора запущен: {addresses}")
+        async with server:
+            await server.serve_forever()
+
+
+async def drive_sessions(sessions, commands, host="127.0.0.1", port=0,
+                         unix_path=None, concurrency=None):
+    """Simulate many clients, each running the same commands in its own session.
+
+    Returns the number of sessions, commands and the elapsed time.
+    """
+    import asyncio
+    limit = asyncio.Semaphore(concurrency or sessions)
+    prompt_end = b"$ "
+
+    async def client():
+        async with limit:
+            if unix_path:
+                reader, writer = await asyncio.open_unix_connection(unix_path)
+            else:
+                reader, writer = await asyncio.open_connection(host, port)
+            await reader.readuntil(prompt_end)
+            for command in commands:
+                writer.write(command.encode("utf-8") + b"\n")
+                await writer.drain()
+                await reader.readuntil(prompt_end)
+            writer.write(b"exit\n")
+            await writer.drain()
+            await reader.read()
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(sessions)))
+    elapsed = time.perf_counter() - start
+    return {"sessions": sessions, "commands": sessions * (len(commands) + 1), "seconds": elapsed}
+
+
+async def run_load_test(server, sessions, commands, concurrency=None):
+    """Start the server on an ephemeral port and drive sessions against it."""
+    listener = await server.start()
+    port = listener.sockets[0].getsockname()[1]
+    async with listener:
+        return await drive_sessions(sessions, commands, port=port, concurrency=concurrency)
+
 
 if __name__ == "__main__":
+    if fastconfig.IMPORT_PROFILE_FLAG in sys.argv:
+        sys.exit(fastconfig.run_import_profile())
+
     parser = argparse.ArgumentParser(description="Запуск эмулятора командной строки.")
     parser.add_argument("config", type=str, help="Путь к конфигурационному файлу.")
+    parser.add_argument("--script", type=str, default=None,
+                        help="Файл с командами для пакетного режима ('-' - стандартный ввод).")
+    parser.add_argument("--serve", type=str, default=None, metavar="HOST:PORT",
+                        help="Запустить многопользовательский сервер на TCP-адресе.")
+    parser.add_argument("--unix", type=str, default=None, metavar="PATH",
+                        help="Запустить многопользовательский сервер на Unix-сокете.")
+    parser.add_argument("--load-test", type=int, default=None, metavar="N",
+                        help="Прогнать N одновременных сеансов через локальный сервер.")
+    parser.add_argument("--import-profile", action="store_true",
+                        help="Выполнить запуск под -X importtime и показать, на что уходит время импорта.")
     args = parser.parse_args()
 
     emulator = ShellEmulator(args.config)
 
-    while True:
+    if args.serve or args.unix or args.load_test:
+        import asyncio
+
+    if args.serve or args.unix:
+        host, _, port = (args.serve or "").rpartition(":")
         try:
-            command = input(f"{emulator.username}@{emulator.computer_name}:{emulator.current_path} $ ")
-            emulator.execute_command(command.strip())
-        except EOFError:
-            emulator.exit_shell()
\ No newline at end of file
+            asyncio.run(EmulatorServer(emulator).serve_forever(
+                host or "127.0.0.1", int(port or 0), args.unix))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            emulator.logger.close()
+            emulator.fs.close()
+        sys.exit(0)
+
+    if args.load_test:
+        commands = ["ls", "cd ..", "whoami", "du -s"]
+        if args.script:
+            with open(args.script, "r", encoding="utf-8") as script:
+                commands = [line.strip() for line in script
+                            if line.strip() and not line.startswith("#") and line.strip() != "exit"]
+        stats = asyncio.run(run_load_test(EmulatorServer(emulator), args.load_test, commands))
+        emulator.exit_shell()
+        print(f"Сеансов: {stats['sessions']}, команд: {stats['commands']}, "
+              f"время: {stats['seconds']:.3f} с "
+              f"({stats['commands'] / stats['seconds']:.0f} команд/с)", file=sys.stderr)
+        sys.exit(0)
+
+    # Пакетный режим: скрипт из файла или команды через конвейер
+    if args.script is not None or not sys.stdin.isatty():
+        if args.script in (None, "-"):
+            stats = emulator.run_batch(sys.stdin)
+        else:
+            with open(args.script, "r", encoding="utf-8") as script:
+                stats = emulator.run_batch(script)
+        print_batch_stats(stats)
+        sys.exit(0)
+
+    try:
+        import readline
+    except ImportError:
+        readline = None
+
+    if readline is not None:
+        def completer(text, state):
+            begin = readline.get_begidx()
+            line = readline.get_line_buffer()[:readline.get_endidx()]
+            # readline подставляет только последнее слово строки
+            matches = [match[begin:] for match in emulator.complete(line)]
+            return matches[state] if state < len(matches) else None
+
+        readline.set_completer_delims(" ")
+        readline.set_completer(completer)
+        readline.parse_and_bind("tab: complete")
+
+    # Буферизованные записи лога сбрасываются и при Ctrl+C или ошибке команды
+    try:
+        while True:
+            try:
+                command = input(emulator.prompt())
+                emulator.execute_command(command.strip())
+            except EOFError:
+                emulator.exit_shell()
+    except KeyboardInterrupt:
+        print()
+    finally:
+        emulator.logger.close()
+        emulator.fs.close()
\ No newline at end of file
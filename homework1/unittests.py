@@ -1,10 +1,17 @@
+import asyncio
+import io
+import json
 import unittest
 import os
 import shutil
 import tempfile
+import time
 import yaml
 import zipfile
-from emulator import ShellEmulator
+import xml.etree.ElementTree as ET
+from unittest.mock import patch
+from emulator import ShellEmulator, EmulatorServer, run_load_test, batch_stats, XmlLogWriter, ZipFileSystem, DirectoryFileSystem, CommandStats, latency_bucket, ImageCache
+import fastconfig  # каталог с общим модулем добавляет в sys.path emulator
 
 
 class TestShellEmulator(unittest.TestCase):
@@ -37,6 +44,8 @@ class TestShellEmulator(unittest.TestCase):
 
     def tearDown(self):
         """Удаляем временные файлы после тестов."""
+        self.emulator.logger.close()
+        self.emulator.fs.close()
         shutil.rmtree(self.test_dir)
 
     def create_virtual_fs(self, content):
@@ -82,6 +91,39 @@ class TestShellEmulator(unittest.TestCase):
         self.emulator.change_directory("nonexistent")
         self.assertEqual(self.emulator.current_path, "/")
 
+    def test_cd_path_resolution(self):
+        """Проверяем абсолютные, многосоставные пути и '.', '..'."""
+        self.emulator.change_directory("dir1/../dir2/.")
+        self.assertEqual(self.emulator.current_path, "/dir2")
+
+        self.emulator.change_directory("/dir1")
+        self.assertEqual(self.emulator.current_path, "/dir1")
+
+        # Файл не является директорией
+        self.emulator.change_directory("file1.txt")
+        self.assertEqual(self.emulator.current_path, "/dir1")
+
+        # Выход за пределы корня запрещен
+        output = self.capture_output(self.emulator.change_directory, "../..")
+        self.assertIn("Вы не можете выйти", output)
+        self.assertEqual(self.emulator.current_path, "/dir1")
+
+    def test_ls_with_path(self):
+        """Проверяем команду ls с аргументом."""
+        output = self.capture_output(self.emulator.execute_command, "ls /dir1")
+        self.assertEqual(output.split(), ["file1.txt", "file2.txt"])
+        output = self.capture_output(self.emulator.execute_command, "ls missing")
+        self.assertIn("Директория не найдена", output)
+
+    def test_completion(self):
+        """Проверяем автодополнение команд и путей."""
+        self.assertEqual(self.emulator.complete("wh"), ["whoami "])
+        self.assertEqual(self.emulator.complete("cd d"), ["cd dir1/", "cd dir2/"])
+        self.assertEqual(self.emulator.complete("ls /dir1/file1"), ["ls /dir1/file1.txt"])
+        self.emulator.change_directory("dir2")
+        self.assertEqual(self.emulator.complete("cd ../dir1/f"),
+                         ["cd ../dir1/file1.txt", "cd ../dir1/file2.txt"])
+
     def test_whoami_command(self):
         """Проверяем команду whoami."""
         output = self.capture_output(self.emulator.whoami)
@@ -90,13 +132,436 @@ class TestShellEmulator(unittest.TestCase):
     def test_du_command(self):
         """Проверяем команду du."""
         output = self.capture_output(self.emulator.disk_usage)
-        expected_size = 77
+        expected_size = 34
         self.assertIn(str(expected_size), output)
 
+    def test_du_options(self):
+        """Проверяем du -s, du -h, du <путь> и разбивку по дочерним элементам."""
+        output = self.capture_output(self.emulator.execute_command, "du")
+        self.assertEqual(output.splitlines(), [
+            "22\tdir1/", "12\tdir2/", "Используемое пространство: 34 байт"])
+
+        output = self.capture_output(self.emulator.execute_command, "du -s dir1")
+        self.assertEqual(output.splitlines(), ["Используемое пространство: 22 байт"])
+
+        self.emulator.fs.add_file("/dir2/big.bin", 3 * 1024)
+        output = self.capture_output(self.emulator.execute_command, "du -sh")
+        self.assertIn("3.0K", output)
+
+    def test_du_sizes_updated_on_mutation(self):
+        """Проверяем, что изменения ФС обновляют размеры только у предков."""
+        fs = self.emulator.fs
+        fs.add_file("/dir1/sub/new.txt", 100)
+        self.assertEqual(fs.total_size("/dir1/sub"), 100)
+        self.assertEqual(fs.total_size("/dir1"), 122)
+        self.assertEqual(fs.total_size("/dir2"), 12)
+        self.assertEqual(fs.total_size("/"), 134)
+
+        fs.add_file("/dir1/sub/new.txt", 40)
+        self.assertEqual(fs.total_size("/"), 74)
+
+        fs.remove("/dir1")
+        self.assertEqual(fs.total_size("/"), 12)
+        self.assertIsNone(fs.get_node("/dir1/sub"))
+
+    def test_batch_mode(self):
+        """Проверяем пакетный режим: exit завершает скрипт, а не процесс."""
+        commands = ["cd dir1", "ls", "# комментарий", "exit", "whoami"]
+        output = self.capture_output(self.emulator.run_batch, commands)
+        self.assertIn("file1.txt", output)
+        self.assertIn("Выход из эмулятора.", output)
+        self.assertNotIn("test_user", output)
+        self.assertFalse(self.emulator.running)
+
+        actions = [e.find("action").text for e in ET.parse(self.log_file_path).getroot()]
+        self.assertEqual(actions, ["Эмулятор запущен", "ls", "Эмулятор завершен"])
+
+    def test_batch_output_flushed_by_size(self):
+        """Проверяем, что вывод пакетного режима не копится до конца скрипта."""
+        writes = []
+
+        class Recorder(io.StringIO):
+            def write(self, text):
+                writes.append(text)
+                return super().write(text)
+
+        with patch("sys.stdout", new_callable=Recorder) as out:
+            self.emulator.run_batch(["cat dir1/file1.txt"] * 3, flush_chars=16)
+        self.assertEqual(out.getvalue().count("Hello, World!"), 3)
+        self.assertGreater(len(writes), 1)
+        self.assertLess(max(len(text) for text in writes), len(out.getvalue()))
+
+    def test_batch_skips_blank_lines(self):
+        """Проверяем, что пустые строки скрипта не считаются командами."""
+        commands = ["ls\n", "\n", "   \n", "whoami\n", "", "exit\n"]
+        stats = {}
+        self.capture_output(lambda: stats.update(self.emulator.run_batch(commands)))
+        self.assertEqual(stats["commands"], 3)
+        self.assertEqual(self.emulator.history, ["ls", "whoami", "exit"])
+
+    def test_batch_stats(self):
+        """Проверяем статистику пакетного прогона."""
+        stats = batch_stats([0.001 * i for i in range(1, 101)], 2.0)
+        self.assertEqual(stats["commands"], 100)
+        self.assertEqual(stats["commands_per_second"], 50)
+        self.assertAlmostEqual(stats["p50_ms"], 50)
+        self.assertAlmostEqual(stats["p99_ms"], 99)
+        self.assertAlmostEqual(stats["max_ms"], 100)
+
+    def test_sessions_share_image(self):
+        """Проверяем, что сеансы разделяют образ, но имеют свое состояние."""
+        first = self.emulator.spawn_session()
+        second = self.emulator.spawn_session("guest")
+        first.change_directory("dir1")
+        self.assertEqual(first.current_path, "/dir1")
+        self.assertEqual(second.current_path, "/")
+        self.assertIs(first.fs, second.fs)
+        # У сеанса есть все атрибуты, которые задает конструктор эмулятора
+        self.assertEqual(set(vars(first)), set(vars(self.emulator)))
+        self.assertEqual(second.username, "guest")
+
+        output = self.capture_output(second.execute_command, "exit")
+        self.assertIn("Выход из эмулятора.", output)
+        # Сеанс не закрывает общий лог и образ
+        self.assertEqual(self.emulator.fs.read("/dir1/file1.txt"), b"Hello, World!")
+        self.emulator.logger.flush()
+        users = [e.find("user").text for e in ET.parse(self.log_file_path).getroot()]
+        self.assertEqual(users[-1], "guest")
+
+    def test_server_drives_many_sessions(self):
+        """Проверяем многопользовательский сервер на локальном порту."""
+        server = EmulatorServer(self.emulator)
+        stats = asyncio.run(run_load_test(server, 50, ["cd dir1", "ls", "du -s"]))
+        self.assertEqual(stats["sessions"], 50)
+        self.assertEqual(server.active_sessions, 0)
+
+        self.emulator.logger.flush()
+        actions = [e.find("action").text for e in ET.parse(self.log_file_path).getroot()]
+        self.assertEqual(actions.count("Сеанс открыт"), 50)
+        self.assertEqual(actions.count("du -s"), 50)
+
+    def test_server_streams_file_output(self):
+        """Проверяем, что сервер отправляет файл частями, дожидаясь drain после каждой."""
+        self.emulator.logger.close()
+        self.emulator.fs.close()
+        content = "".join(f"line {i}\n" for i in range(30000))
+        self.create_virtual_fs({"big": {"data.txt": content}})
+        self.emulator = ShellEmulator(self.config_file)
+        server = EmulatorServer(self.emulator)
+        output = server.run_command(self.emulator.spawn_session(), "cat big/data.txt")
+
+        class Writer:
+            def __init__(self):
+                self.chunks = []
+                self.drains = 0
+
+            def write(self, data):
+                self.chunks.append(data)
+
+            async def drain(self):
+                self.drains += 1
+
+        writer = Writer()
+        asyncio.run(server.send_output(writer, output))
+        self.assertEqual(b"".join(writer.chunks).decode("utf-8"), content)
+        self.assertGreater(writer.drains, 3)
+        self.assertLessEqual(max(len(chunk) for chunk in writer.chunks), 64 * 1024)
+
+    def test_find_command(self):
+        """Проверяем поиск файлов по имени и шаблону."""
+        output = self.capture_output(self.emulator.execute_command, "find file*.txt")
+        self.assertEqual(output.split(), ["/dir1/file1.txt", "/dir1/file2.txt", "/dir2/file3.txt"])
+
+        self.emulator.change_directory("dir2")
+        output = self.capture_output(self.emulator.execute_command, "find file*.txt")
+        self.assertEqual(output.split(), ["/dir2/file3.txt"])
+        output = self.capture_output(self.emulator.execute_command, "find file1.txt")
+        self.assertIn("Ничего не найдено", output)
+
+    def test_grep_command(self):
+        """Проверяем поиск по содержимому через инвертированный индекс."""
+        output = self.capture_output(self.emulator.execute_command, "grep World")
+        self.assertEqual(output.strip(), "/dir1/file1.txt:1:Hello, World!")
+
+        # Фрагменты слов тоже находятся
+        output = self.capture_output(self.emulator.execute_command, "grep other fi")
+        self.assertEqual(output.strip(), "/dir2/file3.txt:1:Another file")
+
+        output = self.capture_output(self.emulator.execute_command, "grep world")
+        self.assertIn("Ничего не найдено", output)
+        output = self.capture_output(self.emulator.execute_command, "grep -i world")
+        self.assertIn("/dir1/file1.txt", output)
+
+    def test_search_index_invalidated_on_mutation(self):
+        """Проверяем сброс индекса поиска при изменении ФС."""
+        index = self.emulator.fs.search_index()
+        self.assertEqual(index.candidates("file"), ["/dir1/file2.txt", "/dir2/file3.txt"])
+        self.assertIs(self.emulator.fs.search_index(), index)
+        self.emulator.fs.remove("/dir2")
+        self.assertIsNot(self.emulator.fs.search_index(), index)
+        self.assertEqual(self.emulator.fs.search_index().candidates("file"), ["/dir1/file2.txt"])
+
+    def test_cat_head_tail_wc_commands(self):
+        """Проверяем потоковые команды cat, head, tail и wc."""
+        self.emulator.fs.add_file("/dir1/empty.txt", 0)
+        output = self.capture_output(self.emulator.execute_command, "cat dir1/file1.txt /dir2/file3.txt")
+        self.assertEqual(output, "Hello, World!\nAnother file\n")
+
+        output = self.capture_output(self.emulator.execute_command, "cat dir1")
+        self.assertIn("это директория", output)
+        output = self.capture_output(self.emulator.execute_command, "head -n 1 missing.txt")
+        self.assertIn("Файл не найден", output)
+
+        output = self.capture_output(self.emulator.execute_command, "wc dir1/file2.txt")
+        self.assertEqual(output.strip(), "0 2 9 dir1/file2.txt")
+
+    def test_streaming_large_file(self):
+        """Проверяем head/tail/wc на файле больше одного блока чтения."""
+        lines = [f"line {i}" for i in range(20000)]
+        data = ("\n".join(lines) + "\n").encode()
+        zip_path = os.path.join(self.test_dir, "big.zip")
+        for compression in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            with zipfile.ZipFile(zip_path, "w", compression) as zipf:
+                zipf.writestr("logs/big.log", data)
+            fs = ZipFileSystem(zip_path)
+            node = fs.get_node("/logs/big.log")
+            self.assertEqual(fs.tail(node, 3), b"line 19997\nline 19998\nline 19999\n")
+            self.assertEqual(b"".join(fs.head(node, 2)), b"line 0\nline 1\n")
+            fs.close()
+
+        # Несжатый элемент не первый в архиве и с дополнительным полем в заголовке
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as zipf:
+            zipf.writestr("first.txt", "first\n")
+            info = zipfile.ZipInfo("logs/big.log")
+            info.extra = b"\xfe\xca\x04\x00abcd"
+            zipf.writestr(info, data)
+        fs = ZipFileSystem(zip_path)
+        node = fs.get_node("/logs/big.log")
+        with patch.object(fs._zip, "open", side_effect=AssertionError("чтение через ZipExtFile")):
+            self.assertEqual(fs.tail(node, 2), b"line 19998\nline 19999\n")
+            self.assertEqual(fs.tail(node, 19999), data[len(b"line 0\n"):])
+            self.assertEqual(fs.tail(node, 50000), data)
+        fs.close()
+
+        # Имена с "./" и ".." попадают в дерево так же, как при распаковке в кэш
+        with zipfile.ZipFile(zip_path, "w") as zipf:
+            for name in ("./logs/a.log", "../b.log", "/c/../d.log"):
+                zipf.writestr(zipfile.ZipInfo(name), "x\n")
+        fs = ZipFileSystem(zip_path)
+        for path in ("/logs/a.log", "/b.log", "/c/d.log"):
+            self.assertEqual(b"".join(fs.head(fs.get_node(path), 1)), b"x\n")
+        self.assertEqual(sorted(fs.root.children), ["b.log", "c", "logs"])
+        fs.close()
+
+        extract_dir = os.path.join(self.test_dir, "extracted")
+        os.makedirs(os.path.join(extract_dir, "logs"))
+        with open(os.path.join(extract_dir, "logs", "big.log"), "wb") as f:
+            f.write(data)
+        fs = DirectoryFileSystem(extract_dir)
+        node = fs.get_node("/logs/big.log")
+        self.assertEqual(fs.tail(node, 1), b"line 19999\n")
+        self.assertEqual(b"".join(fs.iter_chunks(node)), data)
+
+        session = self.emulator.spawn_session()
+        session.fs = fs
+        output = self.capture_output(session.execute_command, "wc logs/big.log")
+        self.assertEqual(output.split()[:3], ["20000", "40000", str(len(data))])
+
     def test_log_creation(self):
         """Проверяем создание файла логов."""
         self.assertTrue(os.path.exists(self.log_file_path))
 
+    def test_zip_fs_reads_lazily(self):
+        """Проверяем чтение файлов прямо из архива без распаковки."""
+        self.assertIsInstance(self.emulator.fs, ZipFileSystem)
+        self.assertEqual(self.emulator.fs.listdir("/dir1"), ["file1.txt", "file2.txt"])
+        self.assertEqual(self.emulator.fs.read("/dir1/file1.txt"), b"Hello, World!")
+        self.assertIsNone(self.emulator.fs.listdir("/dir1/file1.txt"))
+
+    def test_directory_fs_matches_zip_fs(self):
+        """Проверяем, что распакованный образ дает то же дерево, что и архив."""
+        extract_dir = os.path.join(self.test_dir, "extracted")
+        with zipfile.ZipFile(self.virtual_fs_path) as zipf:
+            zipf.extractall(extract_dir)
+        fs = DirectoryFileSystem(extract_dir)
+        self.assertEqual(fs.listdir("/"), self.emulator.fs.listdir("/"))
+        self.assertEqual(fs.total_size("/"), self.emulator.fs.total_size("/"))
+        self.assertEqual(fs.read("/dir2/file3.txt"), b"Another file")
+
+    def test_log_entries_flushed(self):
+        """Проверяем, что записи лога дописываются и документ остается корректным."""
+        self.emulator.whoami()
+        self.emulator.logger.flush()
+        root = ET.parse(self.log_file_path).getroot()
+        actions = [entry.find("action").text for entry in root.findall("log_entry")]
+        self.assertEqual(actions, ["Эмулятор запущен", "whoami"])
+        self.assertEqual(root.find("log_entry/user").text, "test_user")
+
+    def test_log_batches_and_appends_to_existing_file(self):
+        """Проверяем пакетную запись и дозапись в существующий лог."""
+        path = os.path.join(self.test_dir, "batch.xml")
+        with open(path, "w") as f:
+            f.write("<log><log_entry><timestamp>t</timestamp>"
+                    "<action>old</action><user>u</user></log_entry></log>")
+
+        writer = XmlLogWriter(path, batch_size=3, flush_interval=3600)
+        writer.write("t", "a1", "u")
+        writer.write("t", "a2", "u")
+        self.assertEqual(len(ET.parse(path).getroot()), 1)
+        writer.write("t", "a3 <&>", "u")
+        self.assertEqual(len(ET.parse(path).getroot()), 4)
+        writer.close()
+
+        actions = [e.find("action").text for e in ET.parse(path).getroot()]
+        self.assertEqual(actions, ["old", "a1", "a2", "a3 <&>"])
+
+    def test_idle_log_flush(self):
+        """Проверяем, что записи не задерживаются в буфере, пока оболочка простаивает."""
+        path = os.path.join(self.test_dir, "idle.xml")
+        writer = XmlLogWriter(path, batch_size=100, flush_interval=0.05)
+        writer.write("t", "a1", "u")
+        writer.write("t", "a2", "u")
+        deadline = time.monotonic() + 5
+        while len(ET.parse(path).getroot()) < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual([e.find("action").text for e in ET.parse(path).getroot()], ["a1", "a2"])
+        writer.close()
+
+    def test_log_rotation(self):
+        """Проверяем ротацию лога по размеру."""
+        path = os.path.join(self.test_dir, "rotate.xml")
+        writer = XmlLogWriter(path, batch_size=1, max_bytes=300, backup_count=2)
+        for i in range(20):
+            writer.write("2024-01-01 00:00:00", f"action {i}", "u")
+        writer.close()
+
+        self.assertTrue(os.path.exists(path + ".1"))
+        self.assertTrue(os.path.exists(path + ".2"))
+        self.assertFalse(os.path.exists(path + ".3"))
+        for name in (path, path + ".1", path + ".2"):
+            self.assertLessEqual(os.path.getsize(name), 300)
+            ET.parse(name)
+        last = ET.parse(path).getroot()[-1]
+        self.assertEqual(last.find("action").text, "action 19")
+
+    def test_command_stats_histogram(self):
+        """Проверяем счетчики вызовов и логарифмическую гистограмму задержек."""
+        self.assertEqual(latency_bucket(0.0000005), 0)
+        self.assertEqual(latency_bucket(0.000003), 2)
+        stats = CommandStats()
+        stats.record("ls", 0.000003)
+        stats.record("ls", 0.000003)
+        stats.record("ls", 0.001)
+        data = stats.as_dict()["ls"]
+        self.assertEqual(data["calls"], 3)
+        self.assertEqual(data["histogram"], {"2-4us": 2, "512-1024us": 1})
+        self.assertAlmostEqual(data["max_ms"], 1.0)
+
+    def test_dispatch_records_stats(self):
+        """Проверяем, что каждая команда учитывается в статистике."""
+        self.capture_output(self.emulator.execute_command, "ls")
+        self.capture_output(self.emulator.execute_command, "cd dir1")
+        self.capture_output(self.emulator.execute_command, "ls")
+        output = self.capture_output(self.emulator.execute_command, "foo")
+        self.assertIn("команда не найдена", output)
+        self.assertEqual(self.emulator.current_path, "/dir1")
+
+        calls = {name: item["calls"] for name, item in self.emulator.stats.as_dict().items()}
+        self.assertEqual(calls, {"ls": 2, "cd": 1, "?": 1})
+        output = self.capture_output(self.emulator.execute_command, "stats")
+        self.assertTrue(output.splitlines()[0].split(":")[0] in ("ls", "cd", "?"))
+        self.assertIn("вызовов 2", output)
+
+        session = self.emulator.spawn_session()
+        self.capture_output(session.execute_command, "whoami")
+        self.assertEqual(self.emulator.stats.calls["whoami"], 1)
+
+    def test_profile_command(self):
+        """Проверяем профилирование одной команды."""
+        output = self.capture_output(self.emulator.execute_command, "profile du -s")
+        self.assertIn("function calls", output)
+        self.assertIn("disk_usage", output)
+        self.assertEqual(self.emulator.stats.calls["du"], 1)
+        self.assertEqual(self.emulator.stats.calls["profile"], 1)
+        output = self.capture_output(self.emulator.execute_command, "profile")
+        self.assertIn("Нужен аргумент для команды profile.", output)
+
+    def test_stats_dumped_on_exit(self):
+        """Проверяем выгрузку статистики в JSON при выходе."""
+        stats_path = os.path.join(self.test_dir, "stats.json")
+        self.emulator.stats_path = stats_path
+        self.capture_output(self.emulator.run_batch, ["ls", "whoami", "ls"])
+        with open(stats_path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.assertEqual(data["ls"]["calls"], 2)
+        self.assertEqual(data["whoami"]["calls"], 1)
+        self.assertEqual(sum(data["ls"]["histogram"].values()), 2)
+
+    def test_config_sidecar_cache(self):
+        """Проверяем кэш разобранной конфигурации и его сброс при изменении файла."""
+        cache = fastconfig.sidecar_path(self.config_file)
+        self.assertTrue(os.path.exists(cache))
+        with patch("fastconfig.parse_file", side_effect=AssertionError("кэш не использован")):
+            self.assertEqual(fastconfig.load_config(self.config_file)["username"], "test_user")
+
+        with open(self.config_file, "a") as f:
+            f.write("computer_name: other\n")
+        config = fastconfig.load_config(self.config_file)
+        self.assertEqual(config["computer_name"], "other")
+        with patch("fastconfig.parse_file", side_effect=AssertionError("кэш не обновлен")):
+            self.assertEqual(fastconfig.load_config(self.config_file), config)
+
+    def make_zip(self, name, files):
+        """Создает архив с заданными файлами и возвращает путь к нему."""
+        path = os.path.join(self.test_dir, name)
+        with zipfile.ZipFile(path, "w") as zipf:
+            for file_name, content in files.items():
+                zipf.writestr(file_name, content)
+        return path
+
+    def test_extract_mode_reuses_cached_image(self):
+        """Проверяем, что известный образ не распаковывается повторно."""
+        cache_dir = os.path.join(self.test_dir, "cache")
+        with open(self.config_file) as f:
+            config = yaml.safe_load(f)
+        config.update({"virtual_fs_mode": "extract", "image_cache_dir": cache_dir})
+        with open(self.config_file, "w") as f:
+            yaml.dump(config, f)
+
+        first = ShellEmulator(self.config_file)
+        first.logger.close()
+        output = self.capture_output(first.execute_command, "cat /dir1/file1.txt")
+        self.assertIn("Hello, World!", output)
+        self.assertTrue(first.virtual_fs_dir.startswith(cache_dir))
+
+        with patch.object(ImageCache, "extract", side_effect=AssertionError("повторная распаковка")):
+            second = ShellEmulator(self.config_file)
+        second.logger.close()
+        self.assertEqual(second.virtual_fs_dir, first.virtual_fs_dir)
+
+    def test_image_cache_dedup_and_eviction(self):
+        """Проверяем общие файлы образов и вытеснение давно не используемых образов."""
+        cache = ImageCache(os.path.join(self.test_dir, "cache"), max_bytes=4000)
+        shared = "x" * 1000
+        image_a = cache.get(self.make_zip("a.zip", {"shared.txt": shared, "a.txt": "a" * 1500}))
+        image_b = cache.get(self.make_zip("b.zip", {"d/shared.txt": shared, "b.txt": "b" * 1000}))
+        self.assertNotEqual(image_a, image_b)
+        self.assertTrue(os.path.samefile(os.path.join(image_a, "shared.txt"),
+                                         os.path.join(image_b, "d", "shared.txt")))
+        self.assertEqual(cache.usage(), 3500)
+
+        os.utime(image_a, (0, 0))
+        # Размер кэша считается один раз, а не после каждого удаленного образа
+        with patch.object(ImageCache, "usage", side_effect=AssertionError("повторный обход кэша")):
+            image_c = cache.get(self.make_zip("c.zip", {"c.txt": "c" * 1500}))
+        self.assertFalse(os.path.exists(image_a))
+        self.assertTrue(os.path.isdir(image_b))
+        self.assertTrue(os.path.isdir(image_c))
+        self.assertEqual(cache.usage(), 3500)
+        # Общий файл остался в хранилище, пока на него ссылается образ b
+        with open(os.path.join(image_b, "d", "shared.txt")) as f:
+            self.assertEqual(f.read(), shared)
+
     def capture_output(self, func, *args, **kwargs):
         """Перехватывает вывод функции."""
         from io import StringIO
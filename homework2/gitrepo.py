@@ -0,0 +1,897 @@
+import heapq
+import mmap
+import os
+import re
+import struct
+import zlib
+
+OBJ_COMMIT = 1
+OBJ_TREE = 2
+OBJ_BLOB = 3
+OBJ_TAG = 4
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+
+TYPE_NAMES = {b"commit": OBJ_COMMIT, b"tree": OBJ_TREE, b"blob": OBJ_BLOB, b"tag": OBJ_TAG}
+
+GRAPH_PARENT_NONE = 0x70000000
+GRAPH_EXTRA_EDGES = 0x80000000
+GRAPH_LAST_EDGE = 0x80000000
+
+BLOOM_SEEDS = (0x293AE76F, 0x7E646E2C)
+
+DELTA_CACHE_SIZE = 256
+TREE_CACHE_SIZE = 4096
+
+
+class GitError(Exception):
+    """Ошибка чтения репозитория git."""
+
+
+def find_git_dir(repo_path):
+    """Поиск каталога .git: обычный репозиторий, файл .git (worktree) или bare."""
+    dot_git = os.path.join(repo_path, ".git")
+    if os.path.isdir(dot_git):
+        return dot_git
+    if os.path.isfile(dot_git):
+        with open(dot_git, "r") as f:
+            line = f.read().strip()
+        if line.startswith("gitdir:"):
+            return os.path.normpath(os.path.join(repo_path, line[len("gitdir:"):].strip()))
+    if os.path.isfile(os.path.join(repo_path, "HEAD")) and os.path.isdir(os.path.join(repo_path, "objects")):
+        return repo_path
+    raise GitError(f"Не найден репозиторий git: {repo_path}")
+
+
+def apply_delta(base, delta):
+    """Применение дельты pack-файла к базовому объекту."""
+    pos = 0
+
+    def read_varint():
+        nonlocal pos
+        value = shift = 0
+        while True:
+            byte = delta[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value
+
+    base_size = read_varint()
+    if base_size != len(base):
+        raise GitError("Размер базового объекта не совпадает с дельтой")
+    result_size = read_varint()
+    out = bytearray()
+    length = len(delta)
+
+    while pos < length:
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            # Копирование диапазона из базового объекта
+            offset = size = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+            if size == 0:
+                size = 0x10000
+            out += base[offset:offset + size]
+        elif op:
+            # Вставка новых данных
+            out += delta[pos:pos + op]
+            pos += op
+        else:
+            raise GitError("Некорректная инструкция дельты")
+
+    if len(out) != result_size:
+        raise GitError("Размер результата дельты не совпадает")
+    return bytes(out)
+
+
+def murmur3(data, seed):
+    """32-битный MurmurHash3, которым git хэширует пути для фильтров Блума."""
+    h = seed
+    tail = len(data) & ~3
+    for (k,) in struct.iter_unpack("<I", data[:tail]):
+        k = (k * 0xCC9E2D51) & 0xFFFFFFFF
+        k = ((k << 15) | (k >> 17)) * 0x1B873593 & 0xFFFFFFFF
+        h ^= k
+        h = ((h << 13) | (h >> 19)) & 0xFFFFFFFF
+        h = (h * 5 + 0xE6546B64) & 0xFFFFFFFF
+    k = int.from_bytes(data[tail:], "little")
+    if tail < len(data):
+        k = (k * 0xCC9E2D51) & 0xFFFFFFFF
+        h ^= ((k << 15) | (k >> 17)) * 0x1B873593 & 0xFFFFFFFF
+    h ^= len(data)
+    h ^= h >> 16
+    h = (h * 0x85EBCA6B) & 0xFFFFFFFF
+    h ^= h >> 13
+    h = (h * 0xC2B2AE35) & 0xFFFFFFFF
+    return h ^ (h >> 16)
+
+
+class PackFile:
+    """Pack-файл с индексом .idx версии 2, читаемые через mmap."""
+
+    def __init__(self, idx_path, hash_size):
+        self.hash_size = hash_size
+        self._idx_file = open(idx_path, "rb")
+        self._pack_file = open(idx_path[:-4] + ".pack", "rb")
+        self.idx = mmap.mmap(self._idx_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.pack = mmap.mmap(self._pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.idx[:4] != b"\377tOc" or struct.unpack(">I", self.idx[4:8])[0] != 2:
+            raise GitError(f"Неподдерживаемый формат индекса: {idx_path}")
+        self.fanout = struct.unpack(">256I", self.idx[8:8 + 1024])
+        self.count = self.fanout[255]
+        self._names = 8 + 1024
+        self._offsets = self._names + self.count * hash_size + self.count * 4
+        self._large_offsets = self._offsets + self.count * 4
+
+    def _name(self, i):
+        start = self._names + i * self.hash_size
+        return self.idx[start:start + self.hash_size]
+
+    def find(self, oid):
+        """Смещение объекта в pack-файле или None (двоичный поиск по индексу)."""
+        lo = self.fanout[oid[0] - 1] if oid[0] else 0
+        hi = self.fanout[oid[0]]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            name = self._name(mid)
+            if name < oid:
+                lo = mid + 1
+            elif name > oid:
+                hi = mid
+            else:
+                return self._offset(mid)
+        return None
+
+    def _offset(self, i):
+        start = self._offsets + i * 4
+        offset = struct.unpack(">I", self.idx[start:start + 4])[0]
+        if offset & 0x80000000:
+            start = self._large_offsets + (offset & 0x7FFFFFFF) * 8
+            offset = struct.unpack(">Q", self.idx[start:start + 8])[0]
+        return offset
+
+    def read_header(self, offset):
+        """Заголовок объекта: (тип, размер, позиция данных)."""
+        data = self.pack
+        byte = data[offset]
+        obj_type = (byte >> 4) & 7
+        size = byte & 0x0F
+        shift = 4
+        pos = offset + 1
+        while byte & 0x80:
+            byte = data[pos]
+            pos += 1
+            size |= (byte & 0x7F) << shift
+            shift += 7
+        return obj_type, size, pos
+
+    def decompress(self, pos, size):
+        """Распаковка zlib-потока, начинающегося с позиции pos."""
+        decompressor = zlib.decompressobj()
+        out = []
+        step = max(size, 64) + 64
+        while not decompressor.eof:
+            chunk = self.pack[pos:pos + step]
+            if not chunk:
+                raise GitError("Неожиданный конец pack-файла")
+            out.append(decompressor.decompress(chunk))
+            pos += step
+        return b"".join(out)
+
+    def close(self):
+        self.idx.close()
+        self.pack.close()
+        self._idx_file.close()
+        self._pack_file.close()
+
+
+class CommitGraph:
+    """Файл commit-graph: родители, корневое дерево и время коммитов без распаковки."""
+
+    def __init__(self, path, hash_size):
+        self.hash_size = hash_size
+        self._file = open(path, "rb")
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self.data
+
+        if data[:4] != b"CGPH" or data[4] != 1:
+            raise GitError(f"Неподдерживаемый формат commit-graph: {path}")
+        chunk_count = data[6]
+        if data[7] != 0:
+            raise GitError("Цепочки commit-graph не поддерживаются")
+
+        chunks = {}
+        for i in range(chunk_count + 1):
+            start = 8 + i * 12
+            chunk_id = bytes(data[start:start + 4])
+            chunks[chunk_id] = struct.unpack(">Q", data[start + 4:start + 12])[0]
+
+        self.fanout = struct.unpack(">256I", data[chunks[b"OIDF"]:chunks[b"OIDF"] + 1024])
+        self.count = self.fanout[255]
+        self._oids = chunks[b"OIDL"]
+        self._data = chunks[b"CDAT"]
+        self._edges = chunks.get(b"EDGE")
+        # Номера уже встреченных коммитов: родители в CDAT заданы номерами,
+        # и при обходе истории поиск по OIDL почти не нужен
+        self._positions = {}
+
+        # Фильтры Блума измененных путей (commit-graph write --changed-paths)
+        self._bloom_index = chunks.get(b"BIDX")
+        self._bloom_data = chunks.get(b"BDAT")
+        self.bloom_version = self.bloom_hashes = 0
+        if self._bloom_index is not None and self._bloom_data is not None:
+            self.bloom_version, self.bloom_hashes, _ = struct.unpack_from(">III", data, self._bloom_data)
+
+    def oid(self, position):
+        start = self._oids + position * self.hash_size
+        return self.data[start:start + self.hash_size]
+
+    def position(self, oid):
+        """Номер коммита в графе или None."""
+        position = self._positions.get(oid)
+        if position is not None:
+            return position
+        lo = self.fanout[oid[0] - 1] if oid[0] else 0
+        hi = self.fanout[oid[0]]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            name = self.oid(mid)
+            if name < oid:
+                lo = mid + 1
+            elif name > oid:
+                hi = mid
+            else:
+                self._positions[oid] = mid
+                return mid
+        return None
+
+    def commit(self, position):
+        """(корневое дерево, список родителей, время коммита) по номеру в графе."""
+        start = self._data + position * (self.hash_size + 16)
+        tree = self.data[start:start + self.hash_size]
+        start += self.hash_size
+        first, second, high, low = struct.unpack(">IIII", self.data[start:start + 16])
+
+        parents = []
+        if first != GRAPH_PARENT_NONE:
+            parents.append(self._parent(first))
+        if second != GRAPH_PARENT_NONE:
+            if second & GRAPH_EXTRA_EDGES:
+                # Коммит с тремя и более родителями: остальные в списке EDGE
+                edge = self._edges + (second & ~GRAPH_EXTRA_EDGES) * 4
+                while True:
+                    value = struct.unpack(">I", self.data[edge:edge + 4])[0]
+                    parents.append(self._parent(value & ~GRAPH_LAST_EDGE))
+                    if value & GRAPH_LAST_EDGE:
+                        break
+                    edge += 4
+            else:
+                parents.append(self._parent(second))
+
+        commit_time = ((high & 0x3) << 32) | low
+        return tree, parents, commit_time
+
+    def _parent(self, position):
+        oid = self.oid(position)
+        self._positions[oid] = position
+        return oid
+
+    def generation(self, position):
+        """Номер поколения коммита или 0, если граф записан без них."""
+        start = self._data + position * (self.hash_size + 16) + self.hash_size + 8
+        return struct.unpack(">I", self.data[start:start + 4])[0] >> 2
+
+    def bloom_keys(self, path):
+        """Хэши пути и его каталогов для фильтров Блума или None, если фильтров нет."""
+        data = path.encode("utf-8", "surrogateescape")
+        # Версия 1 хэширует байты как знаковые, для ASCII это не важно
+        if self.bloom_version not in (1, 2) or not data or (self.bloom_version == 1 and not data.isascii()):
+            return None
+        keys = []
+        parts = data.split(b"/")
+        for i in range(len(parts), 0, -1):
+            prefix = b"/".join(parts[:i])
+            first, step = (murmur3(prefix, seed) for seed in BLOOM_SEEDS)
+            keys.append([(first + j * step) & 0xFFFFFFFF for j in range(self.bloom_hashes)])
+        return keys
+
+    def maybe_changed(self, position, keys):
+        """Может ли коммит менять путь относительно первого родителя.
+
+        False означает, что путь точно не менялся: хотя бы одного из
+        ключей bloom_keys нет в фильтре коммита. Без фильтра - True.
+        """
+        end = struct.unpack_from(">I", self.data, self._bloom_index + position * 4)[0]
+        start = struct.unpack_from(">I", self.data, self._bloom_index + position * 4 - 4)[0] if position else 0
+        bits = (end - start) * 8
+        if not bits:
+            return True
+        base = self._bloom_data + 12 + start
+        data = self.data
+        for hashes in keys:
+            for value in hashes:
+                bit = value % bits
+                if not data[base + (bit >> 3)] & (1 << (bit & 7)):
+                    return False
+        return True
+
+    def close(self):
+        self.data.close()
+        self._file.close()
+
+
+class Repository:
+    """Чтение объектов git без вызова git: loose-объекты, pack-файлы и commit-graph."""
+
+    def __init__(self, repo_path):
+        self.git_dir = find_git_dir(repo_path)
+        self.hash_size = 32 if self._object_format() == "sha256" else 20
+        self.objects_dir = self._objects_dir()
+
+        pack_dir = os.path.join(self.objects_dir, "pack")
+        self.packs = []
+        if os.path.isdir(pack_dir):
+            for name in sorted(os.listdir(pack_dir)):
+                if name.endswith(".idx") and os.path.exists(os.path.join(pack_dir, name[:-4] + ".pack")):
+                    self.packs.append(PackFile(os.path.join(pack_dir, name), self.hash_size))
+
+        self.graph = None
+        graph_path = os.path.join(self.objects_dir, "info", "commit-graph")
+        if os.path.isfile(graph_path):
+            try:
+                self.graph = CommitGraph(graph_path, self.hash_size)
+            except (GitError, KeyError, struct.error):
+                self.graph = None
+
+        # Элемент дерева: режим, пробел, имя, нулевой байт и хэш
+        self._tree_entry = re.compile(rb"(\d+) ([^\0]*)\0(.{%d})" % self.hash_size, re.DOTALL)
+        self._delta_cache = {}
+        self._tree_cache = {}
+        self._commit_cache = {}
+        self._generation = {}
+
+    def _object_format(self):
+        config_path = os.path.join(self.git_dir, "config")
+        if not os.path.isfile(config_path):
+            return "sha1"
+        with open(config_path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                key, _, value = line.partition("=")
+                if key.strip().lower() == "objectformat":
+                    return value.strip().lower()
+        return "sha1"
+
+    def _objects_dir(self):
+        # В worktree объекты лежат в общем каталоге (commondir)
+        common_file = os.path.join(self.git_dir, "commondir")
+        if os.path.isfile(common_file):
+            with open(common_file, "r") as f:
+                common = os.path.join(self.git_dir, f.read().strip())
+            return os.path.join(os.path.normpath(common), "objects")
+        return os.path.join(self.git_dir, "objects")
+
+    def close(self):
+        for pack in self.packs:
+            pack.close()
+        if self.graph is not None:
+            self.graph.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Ссылки
+
+    def _ref_dirs(self):
+        dirs = [self.git_dir]
+        common = os.path.dirname(self.objects_dir)
+        if common != self.git_dir:
+            dirs.append(common)
+        return dirs
+
+    def resolve_ref(self, name="HEAD"):
+        """Хэш коммита для ссылки (HEAD, ветка, тег или сам хэш) в виде hex-строки."""
+        for _ in range(10):
+            if len(name) == self.hash_size * 2 and all(c in "0123456789abcdef" for c in name):
+                return name
+            value = self._read_ref(name)
+            if value is None:
+                raise GitError(f"Ссылка не найдена: {name}")
+            if value.startswith("ref:"):
+                name = value[4:].strip()
+            else:
+                return self._peel(value)
+        raise GitError(f"Слишком длинная цепочка ссылок: {name}")
+
+    def _read_ref(self, name):
+        candidates = [name] if name.startswith("refs/") or name == "HEAD" else \
+            [name, f"refs/heads/{name}", f"refs/tags/{name}"]
+        for candidate in candidates:
+            for base in self._ref_dirs():
+                path = os.path.join(base, *candidate.split("/"))
+                if os.path.isfile(path):
+                    with open(path, "r") as f:
+                        return f.read().strip()
+        for base in self._ref_dirs():
+            packed = os.path.join(base, "packed-refs")
+            if not os.path.isfile(packed):
+                continue
+            with open(packed, "r") as f:
+                for line in f:
+                    if line.startswith(("#", "^")):
+                        continue
+                    parts = line.split()
+                    if len(parts) == 2 and parts[1] in candidates:
+                        return parts[0]
+        return None
+
+    def _peel(self, hex_oid):
+        """Аннотированный тег разыменовывается до коммита."""
+        oid = bytes.fromhex(hex_oid)
+        obj_type, data = self.read_object(oid)
+        while obj_type == OBJ_TAG:
+            target = data.split(b"\n", 1)[0].split()[1]
+            oid = bytes.fromhex(target.decode())
+            obj_type, data = self.read_object(oid)
+        return oid.hex()
+
+    # Объекты
+
+    def read_object(self, oid):
+        """(тип, содержимое) объекта по бинарному хэшу."""
+        for pack in self.packs:
+            offset = pack.find(oid)
+            if offset is not None:
+                return self._read_packed(pack, offset)
+
+        hex_oid = oid.hex()
+        path = os.path.join(self.objects_dir, hex_oid[:2], hex_oid[2:])
+        try:
+            with open(path, "rb") as f:
+                raw = zlib.decompress(f.read())
+        except FileNotFoundError:
+            raise GitError(f"Объект не найден: {hex_oid}") from None
+        header, _, data = raw.partition(b"\0")
+        type_name = header.split(b" ", 1)[0]
+        return TYPE_NAMES[type_name], data
+
+    def _read_packed(self, pack, offset):
+        """Чтение объекта из pack-файла с разрешением цепочки дельт."""
+        key = (id(pack), offset)
+        cached = self._delta_cache.get(key)
+        if cached is not None:
+            return cached
+
+        # Собираем цепочку дельт до базового объекта без рекурсии
+        chain = []
+        current_pack, current = pack, offset
+        while True:
+            cached = self._delta_cache.get((id(current_pack), current))
+            if cached is not None:
+                obj_type, data = cached
+                break
+            obj_type, size, pos = current_pack.read_header(current)
+            if obj_type == OBJ_OFS_DELTA:
+                byte = current_pack.pack[pos]
+                pos += 1
+                distance = byte & 0x7F
+                while byte & 0x80:
+                    byte = current_pack.pack[pos]
+                    pos += 1
+                    distance = ((distance + 1) << 7) | (byte & 0x7F)
+                chain.append((current_pack, current, pos, size))
+                current = current - distance
+            elif obj_type == OBJ_REF_DELTA:
+                base_oid = current_pack.pack[pos:pos + self.hash_size]
+                pos += self.hash_size
+                chain.append((current_pack, current, pos, size))
+                base_offset = current_pack.find(base_oid)
+                if base_offset is None:
+                    obj_type, data = self.read_object(base_oid)
+                    break
+                current = base_offset
+            else:
+                data = current_pack.decompress(pos, size)
+                self._remember((id(current_pack), current), (obj_type, data))
+                break
+
+        for delta_pack, delta_offset, pos, size in reversed(chain):
+            data = apply_delta(data, delta_pack.decompress(pos, size))
+            self._remember((id(delta_pack), delta_offset), (obj_type, data))
+        return obj_type, data
+
+    def _remember(self, key, value):
+        if len(self._delta_cache) >= DELTA_CACHE_SIZE:
+            self._delta_cache.pop(next(iter(self._delta_cache)))
+        self._delta_cache[key] = value
+
+    # Коммиты и деревья
+
+    def commit_info(self, oid):
+        """(корневое дерево, родители, время коммита) для бинарного хэша."""
+        cached = self._commit_cache.get(oid)
+        if cached is not None:
+            return cached
+
+        position = self.graph.position(oid) if self.graph is not None else None
+        if position is not None:
+            info = self.graph.commit(position)
+        else:
+            obj_type, data = self.read_object(oid)
+            if obj_type != OBJ_COMMIT:
+                raise GitError(f"Объект {oid.hex()} не является коммитом")
+            tree = None
+            parents = []
+            commit_time = 0
+            for line in data.split(b"\n"):
+                if not line:
+                    break
+                key, _, value = line.partition(b" ")
+                if key == b"tree":
+                    tree = bytes.fromhex(value.decode())
+                elif key == b"parent":
+                    parents.append(bytes.fromhex(value.decode()))
+                elif key == b"committer":
+                    commit_time = int(value.rsplit(b" ", 2)[1])
+            info = (tree, parents, commit_time)
+
+        self._commit_cache[oid] = info
+        return info
+
+    def tree_entries(self, oid):
+        """Словарь имя -> (режим, хэш) для дерева."""
+        entries = self._tree_cache.get(oid)
+        if entries is not None:
+            return entries
+
+        obj_type, data = self.read_object(oid)
+        if obj_type != OBJ_TREE:
+            raise GitError(f"Объект {oid.hex()} не является деревом")
+        entries = {name.decode("utf-8", "surrogateescape"): (mode, oid)
+                   for mode, name, oid in self._tree_entry.findall(data)}
+
+        if len(self._tree_cache) >= TREE_CACHE_SIZE:
+            self._tree_cache.pop(next(iter(self._tree_cache)))
+        self._tree_cache[oid] = entries
+        return entries
+
+    def path_entry(self, tree, parts):
+        """(режим, хэш) элемента по пути в дереве или None."""
+        entry = (b"40000", tree)
+        for part in parts:
+            if entry[0] != b"40000":
+                return None
+            entry = self.tree_entries(entry[1]).get(part)
+            if entry is None:
+                return None
+        return entry
+
+    def changed_files(self, old, new, prefix):
+        """Пути файлов, различающихся между двумя элементами (файлами или деревьями)."""
+        if old == new:
+            return []
+        old_is_tree = old is not None and old[0] == b"40000"
+        new_is_tree = new is not None and new[0] == b"40000"
+        if not old_is_tree and not new_is_tree:
+            return [prefix]
+
+        changed = []
+        if old is not None and not old_is_tree:
+            changed.append(prefix)
+        if new is not None and not new_is_tree:
+            changed.append(prefix)
+        old_entries = self.tree_entries(old[1]) if old_is_tree else {}
+        new_entries = self.tree_entries(new[1]) if new_is_tree else {}
+        # Спускаемся только в различающиеся элементы: одинаковые хэши
+        # означают одинаковое содержимое поддерева
+        names = [name for name, entry in new_entries.items() if old_entries.get(name) != entry]
+        names.extend(name for name in old_entries if name not in new_entries)
+        for name in sorted(names):
+            changed.extend(self.changed_files(old_entries.get(name), new_entries.get(name),
+                                              f"{prefix}/{name}"))
+        return changed
+
+    # История файла
+
+    def generation(self, oid):
+        """Номер поколения: 1 у корневых коммитов, иначе на 1 больше, чем у родителей.
+
+        Берется из commit-graph, а для коммитов вне графа вычисляется по
+        родителям и запоминается.
+        """
+        stack = [oid]
+        while stack:
+            top = stack[-1]
+            if top in self._generation:
+                stack.pop()
+                continue
+            position = self.graph.position(top) if self.graph is not None else None
+            value = self.graph.generation(position) if position is not None else 0
+            if not value:
+                parents = self.commit_info(top)[1]
+                missing = [p for p in parents if p not in self._generation]
+                if missing:
+                    stack.extend(missing)
+                    continue
+                value = 1 + max((self._generation[p] for p in parents), default=0)
+            self._generation[top] = value
+            stack.pop()
+        return self._generation[oid]
+
+    def _limited_order(self, head, stop):
+        """Коммиты, достижимые из head, но не из stop, и граничные исключенные коммиты.
+
+        Обход идет по убыванию номера поколения: к моменту выхода коммита
+        все его потомки уже пройдены, и метка "достижим из stop" у него
+        окончательная. Обход останавливается, когда в очереди остаются
+        только исключенные коммиты, поэтому старая история не читается.
+        """
+        uninteresting = dict.fromkeys(stop, True)
+        uninteresting.setdefault(head, False)
+        heap = [(-self.generation(oid), oid) for oid in uninteresting]
+        heapq.heapify(heap)
+        pending = sum(1 for flag in uninteresting.values() if not flag)
+        order = []
+        boundary = set()
+        while heap and pending:
+            _, oid = heapq.heappop(heap)
+            flag = uninteresting[oid]
+            if not flag:
+                pending -= 1
+                order.append(oid)
+            for parent in self.commit_info(oid)[1]:
+                if parent not in uninteresting:
+                    uninteresting[parent] = flag
+                    heapq.heappush(heap, (-self.generation(parent), parent))
+                    if not flag:
+                        pending += 1
+                elif flag and not uninteresting[parent]:
+                    # Родитель еще в очереди: его поколение меньше
+                    uninteresting[parent] = True
+                    pending -= 1
+        for oid in order:
+            boundary.update(p for p in self.commit_info(oid)[1] if uninteresting[p])
+        order.reverse()
+        return order, boundary
+
+    def iter_changes(self, revision="HEAD"):
+        """Все коммиты, достижимые из revision, с путями, измененными относительно каждого родителя.
+
+        Коммиты идут в порядке, обратном git log --topo-order (родители
+        раньше детей), в виде кортежей (хэш, родители, изменения, время);
+        для коммита без родителей возвращается один список - файлы
+        относительно пустого дерева.
+        """
+        head = bytes.fromhex(self.resolve_ref(revision))
+        for oid in reversed(self._topo_sort(self._date_order(head))):
+            tree, parents, commit_time = self.commit_info(oid)
+            new = (b"40000", tree)
+            bases = [(b"40000", self.commit_info(parent)[0]) for parent in parents] or [None]
+            changes = [[path[1:] for path in self.changed_files(base, new, "")] for base in bases]
+            yield oid.hex(), [parent.hex() for parent in parents], changes, commit_time
+
+    def is_ancestor(self, ancestor, descendant):
+        """Достижим ли коммит ancestor из descendant (как git merge-base --is-ancestor)."""
+        target = bytes.fromhex(self.resolve_ref(ancestor))
+        stack = [bytes.fromhex(self.resolve_ref(descendant))]
+        visited = set()
+        while stack:
+            oid = stack.pop()
+            if oid == target:
+                return True
+            if oid in visited:
+                continue
+            visited.add(oid)
+            stack.extend(p for p in self.commit_info(oid)[1] if p not in visited)
+        return False
+
+    def file_history(self, target_file, revision="HEAD", exclude=()):
+        """История файла как у git log --full-history --simplify-merges --parents.
+
+        Возвращает кортежи (хэш, родители, файлы, время) в порядке git log: сначала
+        новые коммиты. Родители переписаны на ближайшие коммиты, меняющие
+        файл, а коммиты, достижимые из exclude, остаются граничными
+        родителями и сами не выводятся.
+        """
+        parts = [part for part in target_file.replace("\\", "/").split("/") if part]
+        head = bytes.fromhex(self.resolve_ref(revision))
+        stop = [bytes.fromhex(self.resolve_ref(ref)) for ref in exclude]
+        # Порядок вывода как у git log --simplify-merges (он включает --topo-order):
+        # сначала обход по убыванию времени коммита, затем топологическая
+        # сортировка, в которой ветка выводится целиком до перехода к соседней
+        if stop:
+            order, boundary = self._limited_order(head, stop)
+            walk = self._topo_sort(self._date_order(head, set(order)))
+        else:
+            walk = self._topo_sort(self._date_order(head))
+            order, boundary = walk[::-1], set()
+
+        entry_cache = {}
+        commit_entries = {}
+
+        def entry_of(oid):
+            if oid in commit_entries:
+                return commit_entries[oid]
+            tree = self.commit_info(oid)[0]
+            if tree not in entry_cache:
+                entry_cache[tree] = self.path_entry(tree, parts)
+            return entry_cache[tree]
+
+        # Если фильтр Блума из commit-graph говорит, что коммит не менял путь
+        # относительно первого родителя, файл берется у родителя без чтения деревьев
+        keys = self.graph.bloom_keys("/".join(parts)) if self.graph is not None else None
+
+        # Исключенные коммиты, кроме явно заданных в exclude, git не считает
+        # значимыми родителями: совпадение с ними по файлу не учитывается,
+        # если у слияния есть другие родители
+        irrelevant = boundary.difference(stop)
+        replacement = {oid: oid for oid in boundary}
+        # Корневые коммиты без файла: git оставляет их родителями при
+        # упрощении слияний, но не выводит и убирает из списка родителей
+        empty_roots = set()
+        simplified = {}
+        shown = {}
+
+        def is_treesame(parents, entry):
+            relevant = [p for p in parents if p not in irrelevant] or parents
+            return all(entry_of(p) == entry for p in relevant)
+
+        for oid in order:
+            parents = self.commit_info(oid)[1]
+            if keys is not None and parents:
+                position = self.graph.position(oid)
+                if position is not None and not self.graph.maybe_changed(position, keys):
+                    commit_entries[oid] = entry_of(parents[0])
+            entry = commit_entries[oid] = entry_of(oid)
+            if len(parents) == 1:
+                # Обычный коммит: либо заменяется родителем, либо выводится
+                # с изменениями относительно него
+                parent = replacement[parents[0]]
+                parent_entry = entry_of(parent)
+                if parent_entry == entry:
+                    replacement[oid] = parent
+                    continue
+                replacement[oid] = oid
+                simplified[oid] = [parent]
+                shown[oid] = ([] if parent in empty_roots else [parent],
+                              self.changed_files(parent_entry, entry, target_file))
+                continue
+            treesame = is_treesame(parents, entry) if parents else entry is None
+            rewritten = list(dict.fromkeys(replacement[parent] for parent in parents))
+            if len(rewritten) > 1:
+                kept = self._drop_ancestors(rewritten, simplified)
+                marked = [p for p in rewritten if p not in kept or p in empty_roots]
+                if marked and all(entry_of(p) != entry for p in rewritten if p not in marked):
+                    # Как в git: если слияние совпадает по файлу только с
+                    # убираемыми родителями, первый из них остается
+                    same = next((p for p in marked if entry_of(p) == entry), None)
+                    marked = [p for p in marked if p != same]
+                if marked:
+                    rewritten = [p for p in rewritten if p not in marked]
+                    if len(rewritten) > 1:
+                        treesame = treesame or is_treesame(rewritten, entry)
+                    elif not rewritten:
+                        treesame = entry is None
+            if len(rewritten) == 1:
+                treesame = entry_of(rewritten[0]) == entry
+
+            if treesame and rewritten:
+                # Коммит не меняет файл: заменяется единственным значимым родителем
+                relevant = rewritten if len(rewritten) == 1 else [p for p in rewritten if p not in irrelevant]
+                if len(relevant) == 1:
+                    replacement[oid] = relevant[0]
+                    continue
+            replacement[oid] = oid
+            simplified[oid] = rewritten
+            if not rewritten and treesame:
+                empty_roots.add(oid)
+            if treesame and sum(p not in irrelevant for p in rewritten) < 2:
+                continue
+
+            parents = [p for p in rewritten if p not in empty_roots]
+            if len(parents) > 1:
+                files = []
+            else:
+                # Слияние с одним оставшимся родителем git сравнивает с этим родителем
+                files = self.changed_files(entry_of(parents[0]) if parents else None, entry, target_file)
+            shown[oid] = (parents, files)
+
+        result = []
+        for oid in walk:
+            if oid in shown:
+                parents, files = shown[oid]
+                result.append((oid.hex(), [p.hex() for p in parents], files, self.commit_info(oid)[2]))
+        return result
+
+    def _date_order(self, head, interesting=None):
+        """Обход коммитов от head по убыванию времени (при равенстве - по очереди).
+
+        interesting ограничивает обход заданными коммитами; по умолчанию
+        обходятся все предки head.
+        """
+        counter = 0
+        heap = [(-self.commit_info(head)[2], counter, head)]
+        queued = {head}
+        walk = []
+        while heap:
+            _, _, oid = heapq.heappop(heap)
+            walk.append(oid)
+            for parent in self.commit_info(oid)[1]:
+                if (interesting is None or parent in interesting) and parent not in queued:
+                    counter += 1
+                    queued.add(parent)
+                    heapq.heappush(heap, (-self.commit_info(parent)[2], counter, parent))
+        return walk
+
+    def _topo_sort(self, walk):
+        """Топологическая сортировка в порядке графа, как sort_in_topological_order в git."""
+        indegree = dict.fromkeys(walk, 1)
+        for oid in walk:
+            for parent in self.commit_info(oid)[1]:
+                if parent in indegree:
+                    indegree[parent] += 1
+
+        # Стек: первая вершина списка извлекается первой
+        stack = [oid for oid in walk if indegree[oid] == 1]
+        stack.reverse()
+        result = []
+        while stack:
+            oid = stack.pop()
+            for parent in self.commit_info(oid)[1]:
+                if indegree.get(parent):
+                    indegree[parent] -= 1
+                    if indegree[parent] == 1:
+                        stack.append(parent)
+            indegree[oid] = 0
+            result.append(oid)
+        return result
+
+    def _drop_ancestors(self, parents, simplified):
+        """Убирает родителей, которые являются предками других родителей.
+
+        Обход идет по уже переписанным родителям упрощенных коммитов, а
+        среди исключенных коммитов - по настоящим родителям. Коммиты с
+        номером поколения не больше, чем у кандидата, не могут быть его
+        потомками и отсекаются.
+        """
+        result = []
+        for candidate in parents:
+            limit = self.generation(candidate)
+            redundant = False
+            for other in parents:
+                if other == candidate:
+                    continue
+                stack = [other]
+                seen = set()
+                while stack:
+                    oid = stack.pop()
+                    if oid == candidate:
+                        redundant = True
+                        break
+                    if oid in seen or self.generation(oid) <= limit:
+                        continue
+                    seen.add(oid)
+                    if oid in simplified:
+                        stack.extend(simplified[oid])
+                    else:
+                        # Переписанные родители - либо показанные коммиты,
+                        # либо исключенные и их предки
+                        stack.extend(self.commit_info(oid)[1])
+                if redundant:
+                    break
+            if not redundant:
+                result.append(candidate)
+        return result
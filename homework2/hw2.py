@@ -1,117 +1,908 @@
 import subprocess
 import os
-import yaml
+import sys
+import datetime
+import fnmatch
+import glob
+import hashlib
+import json
+import shutil
+import time
+import gitrepo
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fastconfig
+
+# sqlite3 и concurrent.futures нужны только кэшу и режиму многих репозиториев,
+# поэтому импортируются там, где используются
 
 def read_config(config_path):
-    """Чтение конфигурационного файла YAML."""
-    with open(config_path, 'r') as f:
-        config = yaml.safe_load(f)
-    return config
+    """Чтение конфигурационного файла YAML (с кэшем разобранных данных)."""
+    return fastconfig.load_config(config_path, "yaml")
+
+RECORD_SEP = b"\x1e"
+FIELD_SEP = b"\x1f"
+READ_CHUNK = 64 * 1024
+
+class CommitRecord:
+    """Компактная запись о коммите: хэш, родители, измененные файлы и время.
+
+    squashed - хэши более старых коммитов линейной цепочки, свернутых
+    в эту запись при сжатии графа.
+    """
+
+    __slots__ = ("hash", "parents", "files", "time", "squashed")
+
+    def __init__(self, commit_hash, parents=(), files=(), commit_time=0, squashed=()):
+        self.hash = commit_hash
+        self.parents = tuple(parents)
+        self.files = tuple(files)
+        self.time = commit_time
+        self.squashed = tuple(squashed)
+
+    def __getitem__(self, key):
+        # Совместимость с прежним представлением коммитов в виде словарей
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f"CommitRecord({self.hash[:8]}, parents={len(self.parents)}, files={len(self.files)})"
+
+def parse_commit_record(buf, pos, final=False):
+    """Разбор одной записи вывода git log -z с форматом RS хэш US родители US [время US].
+
+    Возвращает (запись, позиция после нее) или (None, pos), если записи в
+    буфере еще не хватает данных. Имена файлов разделены NUL, а список
+    заканчивается пустым именем, поэтому разбор не зависит от длины хэшей
+    и содержимого имен файлов.
+    """
+    if pos >= len(buf):
+        return None, pos
+    if buf[pos:pos + 1] != RECORD_SEP:
+        raise ValueError(f"Неожиданный вывод git log в позиции {pos}")
+
+    hash_end = buf.find(FIELD_SEP, pos + 1)
+    parents_end = buf.find(FIELD_SEP, hash_end + 1) if hash_end >= 0 else -1
+    if parents_end < 0:
+        return None, pos
+
+    commit_hash = buf[pos + 1:hash_end].decode("ascii")
+    parents = buf[hash_end + 1:parents_end].decode("ascii").split()
+    files = []
+    i = parents_end + 1
+    commit_time = 0
+
+    if buf[i:i + 1].isdigit():
+        # Необязательное поле времени коммита (%ct); список файлов
+        # начинается с перевода строки, поэтому цифра здесь - только время
+        time_end = buf.find(FIELD_SEP, i)
+        if time_end < 0:
+            return None, pos
+        commit_time = int(buf[i:time_end])
+        i = time_end + 1
+
+    if i >= len(buf):
+        return (CommitRecord(commit_hash, parents, (), commit_time), i) if final else (None, pos)
+    if buf[i:i + 1] == b"\0":
+        return CommitRecord(commit_hash, parents, (), commit_time), i + 1
+    if buf[i:i + 1] != b"\n":
+        raise ValueError(f"Неожиданный вывод git log в позиции {i}")
 
-def get_commits_with_file(repo_path, target_file):
-    """Получение коммитов, в которых фигурирует указанный файл."""
+    i += 1
+    while True:
+        j = buf.find(b"\0", i)
+        if j < 0:
+            if not final:
+                return None, pos
+            if i < len(buf):
+                files.append(buf[i:].decode("utf-8", "surrogateescape"))
+            return CommitRecord(commit_hash, parents, files, commit_time), len(buf)
+        if j == i:
+            return CommitRecord(commit_hash, parents, files, commit_time), j + 1
+        files.append(buf[i:j].decode("utf-8", "surrogateescape"))
+        i = j + 1
+        if i >= len(buf) and final:
+            return CommitRecord(commit_hash, parents, files, commit_time), i
+
+def use_native(backend):
+    """Нужно ли читать .git напрямую: так задано в конфигурации или git не установлен."""
+    return backend == "native" or shutil.which("git") is None
+
+def iter_commits(repo_path, target_file, backend="git", revision="HEAD", exclude=()):
+    """Получение коммитов, в которых фигурирует указанный файл.
+
+    backend="native" читает объекты .git напрямую, без запуска git; он же
+    используется, если git не установлен. Коммиты, достижимые из exclude,
+    не выводятся (как revision ^exclude в git log).
+    """
+    if use_native(backend):
+        return iter_commits_native(repo_path, target_file, revision, exclude)
+    return iter_commits_git(repo_path, target_file, revision, exclude)
+
+def iter_commits_native(repo_path, target_file, revision="HEAD", exclude=()):
+    """Получение коммитов чтением loose-объектов, pack-файлов и commit-graph."""
+    try:
+        with gitrepo.Repository(repo_path) as repo:
+            for commit_hash, parents, files, commit_time in repo.file_history(target_file, revision, exclude):
+                yield CommitRecord(commit_hash, parents, files, commit_time)
+    except gitrepo.GitError as e:
+        print("Ошибка чтения репозитория:", e)
+
+def iter_commits_git(repo_path, target_file, revision="HEAD", exclude=()):
+    """Потоковое получение коммитов, в которых фигурирует указанный файл.
+
+    Вывод одного git log читается из Popen.stdout по частям, и записи
+    отдаются по мере разбора, так что в памяти не хранится вся история.
+    --full-history --simplify-merges сохраняет ветвления и слияния, в которых
+    менялся файл, а родители переписываются на ближайшие коммиты,
+    затрагивающие файл.
+    """
+    return iter_git_log(repo_path, [
+        '--parents', '--full-history', '--simplify-merges', '--name-only', '-z',
+        '--pretty=format:%x1e%H%x1f%P%x1f%ct%x1f', revision,
+        *[f'^{commit}' for commit in exclude], '--', target_file])
+
+def iter_git_log(repo_path, args):
+    """Запуск git log с аргументами args и потоковый разбор его записей."""
+    process = subprocess.Popen(
+        ['git', '-C', repo_path, '-c', 'core.quotePath=false', 'log', *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    buf = b""
+    try:
+        while True:
+            chunk = process.stdout.read(READ_CHUNK)
+            final = not chunk
+            buf += chunk
+            pos = 0
+            while True:
+                record, pos = parse_commit_record(buf, pos, final)
+                if record is None:
+                    break
+                yield record
+            buf = buf[pos:]
+            if final:
+                break
+
+        process.wait()
+        if process.returncode != 0:
+            print("Ошибка при выполнении команды git log:",
+                  process.stderr.read().decode("utf-8", "replace"))
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+def get_commits_with_file(repo_path, target_file, backend="git"):
+    """Получение списка коммитов, в которых фигурирует указанный файл."""
+    return list(iter_commits(repo_path, target_file, backend))
+
+def get_head(repo_path, backend="git"):
+    """Хэш текущего HEAD репозитория или None, если его не удалось получить."""
+    if use_native(backend):
+        try:
+            with gitrepo.Repository(repo_path) as repo:
+                return repo.resolve_ref("HEAD")
+        except gitrepo.GitError:
+            return None
     result = subprocess.run(
-        ['git', '-C', repo_path, 'log', '--name-only', '--pretty=format:%H', '--', target_file],
+        ['git', '-C', repo_path, 'rev-parse', '--verify', '-q', 'HEAD'],
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         text=True
     )
+    return result.stdout.strip() if result.returncode == 0 else None
 
-    if result.returncode != 0:
-        print("Ошибка при выполнении команды git log:", result.stderr)
-        return []
+def is_ancestor(repo_path, ancestor, descendant, backend="git"):
+    """Является ли коммит ancestor предком descendant (или им самим)."""
+    if use_native(backend):
+        try:
+            with gitrepo.Repository(repo_path) as repo:
+                return repo.is_ancestor(ancestor, descendant)
+        except gitrepo.GitError:
+            return False
+    result = subprocess.run(
+        ['git', '-C', repo_path, 'merge-base', '--is-ancestor', ancestor, descendant],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    return result.returncode == 0
 
-    lines = result.stdout.strip().split("\n")
-    commits = []
-    current_commit = None
+CACHE_SCHEMA = 2
+
+class HistoryCache:
+    """Кэш обработанной истории файлов в SQLite.
+
+    Для пары (репозиторий, файл) хранятся последний обработанный HEAD,
+    записи коммитов в порядке вывода и ребра от коммитов к родителям.
+    Хэши хранятся в двоичном виде, имена файлов разделены NUL.
+    """
+
+    def __init__(self, path):
+        import sqlite3
+        self.conn = sqlite3.connect(path)
+        self._init_schema()
+
+    def _init_schema(self):
+        conn = self.conn
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            if row is not None and row[0] != str(CACHE_SCHEMA):
+                # Кэш старого формата просто пересобирается
+                conn.executescript("""
+                    DROP TABLE IF EXISTS histories;
+                    DROP TABLE IF EXISTS commits;
+                    DROP TABLE IF EXISTS edges;
+                """)
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS histories (
+                    id INTEGER PRIMARY KEY,
+                    repo TEXT NOT NULL,
+                    target TEXT NOT NULL,
+                    head TEXT,
+                    UNIQUE (repo, target)
+                );
+                CREATE TABLE IF NOT EXISTS commits (
+                    history INTEGER NOT NULL,
+                    seq INTEGER NOT NULL,
+                    hash BLOB NOT NULL,
+                    parents BLOB NOT NULL,
+                    files BLOB NOT NULL,
+                    time INTEGER NOT NULL,
+                    PRIMARY KEY (history, seq)
+                );
+                CREATE INDEX IF NOT EXISTS commits_hash ON commits (history, hash);
+                CREATE TABLE IF NOT EXISTS edges (
+                    history INTEGER NOT NULL,
+                    child BLOB NOT NULL,
+                    parent BLOB NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS edges_child ON edges (history, child);
+                CREATE INDEX IF NOT EXISTS edges_parent ON edges (history, parent);
+            """)
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (str(CACHE_SCHEMA),))
+
+    def lookup(self, repo, target):
+        """(id истории, сохраненный HEAD) или (None, None), если истории нет."""
+        row = self.conn.execute(
+            "SELECT id, head FROM histories WHERE repo = ? AND target = ?", (repo, target)
+        ).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def reset(self, repo, target):
+        """Очистка истории перед полным обходом; возвращает ее id."""
+        history, _ = self.lookup(repo, target)
+        if history is None:
+            cursor = self.conn.execute(
+                "INSERT INTO histories (repo, target) VALUES (?, ?)", (repo, target))
+            return cursor.lastrowid
+        self.conn.execute("DELETE FROM commits WHERE history = ?", (history,))
+        self.conn.execute("DELETE FROM edges WHERE history = ?", (history,))
+        self.conn.execute("UPDATE histories SET head = NULL WHERE id = ?", (history,))
+        return history
+
+    def set_head(self, history, head):
+        self.conn.execute("UPDATE histories SET head = ? WHERE id = ?", (head, history))
+
+    def store(self, history, records, first_seq):
+        """Запись коммитов с порядковыми номерами, начиная с first_seq."""
+        seq = first_seq
+        for record in records:
+            commit_hash = bytes.fromhex(record.hash)
+            self.conn.execute(
+                "INSERT INTO commits VALUES (?, ?, ?, ?, ?, ?)",
+                (history, seq, commit_hash, bytes.fromhex("".join(record.parents)),
+                 "\0".join(record.files).encode("utf-8", "surrogateescape"), record.time))
+            self.conn.executemany(
+                "INSERT INTO edges VALUES (?, ?, ?)",
+                [(history, commit_hash, bytes.fromhex(parent)) for parent in record.parents])
+            seq += 1
+
+    def first_seq(self, history):
+        row = self.conn.execute(
+            "SELECT MIN(seq) FROM commits WHERE history = ?", (history,)).fetchone()
+        return row[0] or 0
+
+    def heads(self, history):
+        """Коммиты графа, у которых нет потомков в графе."""
+        rows = self.conn.execute(
+            "SELECT hash FROM commits WHERE history = ? AND hash NOT IN "
+            "(SELECT parent FROM edges WHERE history = ?) ORDER BY seq",
+            (history, history))
+        return [row[0].hex() for row in rows]
+
+    def records(self, history):
+        """Сохраненные коммиты в порядке вывода, по одному из курсора."""
+        cursor = self.conn.execute(
+            "SELECT hash, parents, files, time FROM commits WHERE history = ? ORDER BY seq", (history,))
+        for commit_hash, parents, files, commit_time in cursor:
+            size = len(commit_hash)
+            yield CommitRecord(
+                commit_hash.hex(),
+                [parents[i:i + size].hex() for i in range(0, len(parents), size)],
+                files.decode("utf-8", "surrogateescape").split("\0") if files else (),
+                commit_time)
+
+    def close(self):
+        self.conn.close()
+
+def update_cached_history(cache, history, repo_path, target_file, backend, old_head, head):
+    """Дообход коммитов old_head..head и вставка их перед сохраненными.
+
+    Новые записи дописываются, только если они образуют цепочку поверх
+    old_head: тогда упрощение слияний git не меняет уже сохраненную часть
+    истории и ее порядок. Если файл менялся в ветке, отошедшей раньше
+    old_head, или в новых слияниях, возвращается False, и история
+    обходится целиком.
+    """
+    new_records = list(iter_commits(repo_path, target_file, backend, head, [old_head]))
+    known = {old_head}
+    for record in reversed(new_records):
+        if len(record.parents) != 1 or record.parents[0] not in known:
+            return False
+        known.add(record.hash)
+
+    heads = cache.heads(history)
+    spliced = [CommitRecord(record.hash, heads if record.parents[0] == old_head else record.parents,
+                            record.files, record.time)
+               for record in new_records]
+    cache.store(history, spliced, cache.first_seq(history) - len(spliced))
+    return True
+
+def iter_commits_cached(repo_path, target_file, cache_path, backend="git"):
+    """Коммиты с указанным файлом с использованием кэша истории.
+
+    Если HEAD не изменился, записи читаются из кэша без обхода репозитория.
+    Если сохраненный HEAD — предок текущего, обходятся только новые коммиты.
+    Иначе (первый запуск, перезапись истории, новые слияния с изменениями
+    файла) история обходится целиком.
+    """
+    head = get_head(repo_path, backend)
+    if head is None:
+        yield from iter_commits(repo_path, target_file, backend)
+        return
+
+    repo_key = os.path.realpath(repo_path)
+    cache = HistoryCache(cache_path)
+    try:
+        with cache.conn:
+            history, old_head = cache.lookup(repo_key, target_file)
+            updated = history is not None and old_head == head
+            if not updated and history is not None and old_head and is_ancestor(repo_path, old_head, head, backend):
+                updated = update_cached_history(cache, history, repo_path, target_file, backend, old_head, head)
+            if not updated:
+                history = cache.reset(repo_key, target_file)
+                cache.store(history, iter_commits(repo_path, target_file, backend), 0)
+            cache.set_head(history, head)
+        yield from cache.records(history)
+    finally:
+        cache.close()
+
+class RepoHistory:
+    """Вся история репозитория за один обход: родители и измененные пути коммитов.
+
+    Коммиты хранятся в порядке "родители раньше детей", а для каждого
+    родителя - кортеж путей, отличающихся от него. Из этого без повторного
+    обхода выводится история любого файла по правилам git log
+    --full-history --simplify-merges.
+    """
+
+    def __init__(self):
+        self.order = []
+        self.parents = {}
+        self.changes = {}
+        self.times = {}
+        self._generation = None
+
+    def add(self, commit_hash, parents, changes, commit_time=0):
+        self.order.append(commit_hash)
+        self.parents[commit_hash] = tuple(parents)
+        self.changes[commit_hash] = tuple(tuple(files) for files in changes)
+        self.times[commit_hash] = commit_time
+        self._generation = None
+
+    def __len__(self):
+        return len(self.order)
+
+    def restrict(self, targets):
+        """История с теми же коммитами, но только с путями, нужными для targets."""
+        wanted = {target.replace("\\", "/").strip("/") for target in targets}
+        needed = {}
+
+        def is_needed(path):
+            if path not in needed:
+                # Путь нужен, если он сам или один из его каталогов - цель
+                parts = path.split("/")
+                needed[path] = any("/".join(parts[:i]) in wanted for i in range(1, len(parts) + 1))
+            return needed[path]
+
+        history = RepoHistory()
+        history.order = self.order
+        history.parents = self.parents
+        history.times = self.times
+        history.changes = {
+            commit_hash: tuple(tuple(f for f in files if is_needed(f)) for files in changes)
+            for commit_hash, changes in self.changes.items()}
+        return history
 
-    for line in lines:
-        if line.strip() == "":
+    def paths(self):
+        """Все пути, когда-либо менявшиеся в истории."""
+        result = set()
+        for changes in self.changes.values():
+            for files in changes:
+                result.update(files)
+        return result
+
+    def generation(self):
+        if self._generation is None:
+            generation = {}
+            for commit_hash in self.order:
+                generation[commit_hash] = 1 + max(
+                    (generation.get(p, 0) for p in self.parents[commit_hash]), default=0)
+            self._generation = generation
+        return self._generation
+
+    def file_history(self, target_file):
+        """Записи коммитов, меняющих target_file, в порядке git log (новые раньше)."""
+        target = target_file.replace("\\", "/").strip("/")
+        prefix = target + "/"
+        generation = self.generation()
+        replacement = {}
+        # Корневые коммиты без файла: git оставляет их родителями при
+        # упрощении слияний, но не выводит и убирает из списка родителей
+        empty_roots = set()
+        simplified = {}
+        shown = {}
+
+        for commit_hash in self.order:
+            parents = self.parents[commit_hash]
+            touched = [[f for f in files if f == target or f.startswith(prefix)]
+                       for files in self.changes[commit_hash]]
+
+            rewritten = list(dict.fromkeys(replacement[parent] for parent in parents))
+            # Файл совпадает с переписанным родителем, если он не менялся
+            # относительно родителя, который в него переписан
+            same = {replacement[parent] for parent, files in zip(parents, touched) if not files}
+            if len(rewritten) > 1:
+                kept = _drop_ancestors(rewritten, simplified, generation)
+                marked = [p for p in rewritten if p not in kept or p in empty_roots]
+                if marked and not same.intersection(p for p in rewritten if p not in marked):
+                    # Как в git: если слияние совпадает по файлу только с
+                    # убираемыми родителями, первый из них остается
+                    restored = next((p for p in marked if p in same), None)
+                    marked = [p for p in marked if p != restored]
+                rewritten = [p for p in rewritten if p not in marked]
+
+            if rewritten:
+                treesame = same.issuperset(rewritten)
+            else:
+                # У корневого коммита изменения считаются от пустого дерева;
+                # у слияния, потерявшего всех родителей, файл есть
+                treesame = not parents and not touched[0]
+            if len(rewritten) == 1 and treesame:
+                replacement[commit_hash] = rewritten[0]
+                continue
+            replacement[commit_hash] = commit_hash
+            if not rewritten and treesame:
+                empty_roots.add(commit_hash)
+                continue
+
+            shown_parents = [p for p in rewritten if p not in empty_roots]
+            if len(shown_parents) > 1:
+                commit_files = ()
+            elif not parents:
+                commit_files = touched[0]
+            else:
+                # Слияние с одним оставшимся родителем git сравнивает с этим
+                # родителем, а без родителей - с пустым деревом
+                commit_files = next(
+                    files for parent, files in zip(parents, touched)
+                    if (replacement[parent] == shown_parents[0] if shown_parents
+                        else replacement[parent] in empty_roots))
+            simplified[commit_hash] = rewritten
+            shown[commit_hash] = CommitRecord(
+                commit_hash, shown_parents, commit_files, self.times[commit_hash])
+
+        return [shown[h] for h in reversed(self.order) if h in shown]
+
+def _drop_ancestors(parents, simplified, generation):
+    """Убирает родителей, достижимых по упрощенному графу из других родителей."""
+    result = []
+    for candidate in parents:
+        limit = generation[candidate]
+        redundant = False
+        for other in parents:
+            if other == candidate:
+                continue
+            stack = [other]
+            seen = set()
+            while stack and not redundant:
+                commit_hash = stack.pop()
+                if commit_hash == candidate:
+                    redundant = True
+                elif commit_hash not in seen and generation[commit_hash] > limit:
+                    seen.add(commit_hash)
+                    stack.extend(simplified[commit_hash])
+            if redundant:
+                break
+        if not redundant:
+            result.append(candidate)
+    return result
+
+def load_repo_history(repo_path, backend="git"):
+    """Один обход всей истории репозитория для последующего анализа многих файлов."""
+    history = RepoHistory()
+    if use_native(backend):
+        try:
+            with gitrepo.Repository(repo_path) as repo:
+                for commit_hash, parents, changes, commit_time in repo.iter_changes():
+                    history.add(commit_hash, parents, changes, commit_time)
+        except gitrepo.GitError as e:
+            print("Ошибка чтения репозитория:", e)
+        return history
+
+    # С -m слияние выводится отдельно для каждого родителя, но только если
+    # отличается от него, поэтому в формат добавлено дерево коммита: родители
+    # с тем же деревом пропущены git и получают пустой список изменений
+    commits = []
+    trees = {}
+    for record in iter_git_log(repo_path, [
+            '--topo-order', '-m', '--root', '--no-renames', '--name-only', '-z',
+            '--pretty=format:%x1e%H %T%x1f%P%x1f%ct%x1f', 'HEAD']):
+        commit_hash, tree = record.hash.split()
+        if commits and commits[-1][0] == commit_hash:
+            commits[-1][3].append(record.files)
             continue
-        if len(line) == 40:  # Если строка имеет длину хэша коммита
-            current_commit = line
-            commits.append({"hash": current_commit, "files": []})
+        trees[commit_hash] = tree
+        commits.append((commit_hash, record.parents, tree, [record.files], record.time))
+
+    for commit_hash, parents, tree, printed, commit_time in reversed(commits):
+        if len(parents) > 1:
+            changes = [()] * len(parents)
+            differing = [i for i, parent in enumerate(parents) if trees.get(parent) != tree]
+            for i, files in zip(differing, printed):
+                changes[i] = files
         else:
-            if current_commit:
-                commits[-1]["files"].append(line)
+            changes = printed
+        history.add(commit_hash, parents, changes, commit_time)
+    return history
 
-    return commits
+def parse_since(value):
+    """Начало окна по дате в секундах Unix: число, дата из YAML или строка ISO 8601."""
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time()).timestamp()
+    return datetime.datetime.fromisoformat(str(value)).timestamp()
 
-def get_parents(repo_path, commit_hash):
-    """Получение родительских коммитов для заданного коммита."""
-    result = subprocess.run(
-        ['git', '-C', repo_path, 'rev-list', '--parents', '-n', '1', commit_hash],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
+def condense_options(config):
+    """Параметры сжатия графа из конфигурации или None, если сжатие не включено."""
+    options = {
+        'collapse_chains': bool(config.get('collapse_chains', False)),
+        'max_depth': config.get('max_depth'),
+        'since': parse_since(config['since']) if config.get('since') is not None else None,
+    }
+    if not options['collapse_chains'] and options['max_depth'] is None and options['since'] is None:
+        return None
+    return options
 
-    if result.returncode != 0:
-        print(f"Ошибка при получении родителей для коммита {commit_hash}: {result.stderr}")
-        return []
+def condense_commits(commits, collapse_chains=True, max_depth=None, since=None):
+    """Сжатие графа коммитов для больших историй.
+
+    Коммиты должны идти в порядке git log (потомки раньше предков).
+    max_depth оставляет коммиты не дальше заданного числа ребер от вершин
+    графа, since - коммиты не старше заданного времени; ребра к отброшенным
+    коммитам удаляются. collapse_chains сворачивает линейные цепочки (у
+    каждого внутреннего ребра единственный родитель с единственным
+    потомком) в одну запись, в squashed которой перечислены свернутые коммиты.
+    """
+    depth = {}
+    kept = []
+    for commit in commits:
+        level = depth.get(commit.hash, 0)
+        for parent in commit.parents:
+            if parent not in depth or depth[parent] > level + 1:
+                depth[parent] = level + 1
+        if max_depth is not None and level > max_depth:
+            continue
+        if since is not None and commit.time and commit.time < since:
+            continue
+        kept.append(commit)
 
-    parts = result.stdout.strip().split()
-    return parts[1:]  # Первый элемент — это сам коммит, остальные — родители
+    present = {commit.hash for commit in kept}
+    parents = {commit.hash: [p for p in commit.parents if p in present] for commit in kept}
+    if not collapse_chains:
+        return [CommitRecord(c.hash, parents[c.hash], c.files, c.time) for c in kept]
 
-def generate_dot_file(repo_path, commits, output_path):
-    """Генерация файла в формате DOT."""
-    commit_hashes = {commit['hash'] for commit in commits}  # Множество хэшей коммитов для быстрого поиска
+    children = {}
+    for commit in kept:
+        for parent in parents[commit.hash]:
+            children[parent] = children.get(parent, 0) + 1
+
+    def joins_parent(commit_hash):
+        # Ребро к родителю внутри цепочки: один родитель, у которого один потомок
+        own = parents[commit_hash]
+        return len(own) == 1 and children.get(own[0]) == 1
+
+    by_hash = {commit.hash: commit for commit in kept}
+    absorbed = set()
+    result = []
+    for commit in kept:
+        if commit.hash in absorbed:
+            continue
+        chain = [commit]
+        while joins_parent(chain[-1].hash):
+            chain.append(by_hash[parents[chain[-1].hash][0]])
+        files = []
+        seen = set()
+        for member in chain:
+            absorbed.add(member.hash)
+            for name in member.files:
+                if name not in seen:
+                    seen.add(name)
+                    files.append(name)
+        result.append(CommitRecord(commit.hash, parents[chain[-1].hash], files, commit.time,
+                                   [member.hash for member in chain[1:]]))
+    return result
+
+def generate_dot_file(repo_path, commits, output_path, max_label_files=None):
+    """Генерация файла в формате DOT.
+
+    Коммиты могут приходить из генератора: каждый узел и его связи пишутся
+    сразу, поэтому список коммитов целиком не хранится. max_label_files
+    ограничивает число файлов в подписи узла. Возвращает число записанных
+    узлов.
+    """
+    count = 0
 
     with open(output_path, 'w') as f:
         f.write("digraph G {\n")
-        
+
         for commit in commits:
-            commit_hash = commit['hash']
+            commit_hash = commit.hash
             short_hash = commit_hash[:8]
-            label = f"{short_hash}\n" + "\n".join(commit["files"])
+            if commit.squashed:
+                # Свернутая цепочка: от нового коммита до самого старого
+                short_hash = f"{short_hash}..{commit.squashed[-1][:8]} (коммитов: {len(commit.squashed) + 1})"
+            files = commit.files
+            if max_label_files is not None and len(files) > max_label_files:
+                files = files[:max_label_files] + (f"... еще {len(files) - max_label_files}",)
+            label = f"{short_hash}\n" + "\n".join(files)
             f.write(f'  "{commit_hash}" [label="{label}"];\n')
 
+            # Связи от родительских коммитов к дочернему. Родители уже
+            # переписаны git log на коммиты, которые тоже попадут в граф.
+            for parent in commit.parents:
+                f.write(f'  "{parent}" -> "{commit_hash}";\n')
+            count += 1
 
-        # Добавляем связи между родительскими коммитами
-        for i in range(len(commits) - 1):
-            current_commit = commits[i]['hash']
-            next_commit = commits[i + 1]['hash']
-            f.write(f'  "{next_commit}" -> "{current_commit}";\n')  # Добавляем связь от следующего к текущему
-        
         f.write("}\n")
 
+    return count
 
-def visualize_graph(dot_file):
-    """Отображение графа из файла формата DOT."""
+def file_digest(path):
+    """SHA-256 содержимого файла, читаемого по частям."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def visualize_graph(dot_file, visualizer_path=None):
+    """Отображение графа из файла формата DOT.
+
+    Рядом с изображением хранится хэш DOT-файла, по которому оно построено;
+    если файл не изменился и изображение на месте, Graphviz не запускается.
+    """
     output_path = os.path.splitext(dot_file)[0] + '.png'
-    
+    digest_path = output_path + '.sha256'
+    digest = file_digest(dot_file)
+    if os.path.exists(output_path) and os.path.exists(digest_path):
+        with open(digest_path, 'r') as f:
+            if f.read().strip() == digest:
+                print(f"Граф не изменился: {output_path}")
+                return
+
+    visualizer = visualizer_path or 'dot'
+    if visualizer_path and not os.path.exists(visualizer_path) and shutil.which(visualizer_path) is None:
+        print(f"Не найден {visualizer_path}, используется dot")
+        visualizer = 'dot'
+
     # Используем команду dot для генерации изображения из файла DOT
-    subprocess.run(['dot', '-Tpng', dot_file, '-o', output_path])
-    
+    try:
+        result = subprocess.run([visualizer, '-Tpng', dot_file, '-o', output_path])
+    except OSError as e:
+        print("Ошибка запуска Graphviz:", e)
+        return
+    if result.returncode != 0:
+        print("Ошибка при построении изображения графа")
+        return
+
+    with open(digest_path, 'w') as f:
+        f.write(digest + "\n")
     print(f"Граф сохранен в файл: {output_path}")
 
+def has_glob(pattern):
+    return any(c in pattern for c in "*?[")
+
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+def is_multi_config(config):
+    """Задано ли в конфигурации несколько репозиториев или файлов (списком или маской)."""
+    return any(isinstance(config[key], list) or has_glob(config[key])
+               for key in ('repo_path', 'target_file'))
+
+def expand_repos(patterns):
+    """Пути репозиториев из списка путей и масок, без повторов."""
+    repos = []
+    for pattern in as_list(patterns):
+        matches = sorted(glob.glob(pattern)) if has_glob(pattern) else [pattern]
+        for path in matches:
+            if os.path.isdir(path) and path not in repos:
+                repos.append(path)
+    return repos
+
+def expand_targets(history, patterns):
+    """Файлы из списка путей и масок; маски сопоставляются с путями из истории."""
+    targets = []
+    paths = None
+    for pattern in as_list(patterns):
+        if has_glob(pattern):
+            if paths is None:
+                paths = sorted(history.paths())
+            matches = fnmatch.filter(paths, pattern)
+        else:
+            matches = [pattern]
+        targets.extend(t for t in matches if t not in targets)
+    return targets
+
+def target_dot_name(target_file):
+    """Имя DOT-файла для анализируемого файла: разделители пути заменяются на __.
+
+    Если в пути есть _, к имени добавляется начало хэша пути, чтобы a/b и
+    a__b не записывались в один файл.
+    """
+    path = target_file.replace("\\", "/").strip("/")
+    name = path.replace("/", "__")
+    if "_" in path:
+        name += "-" + hashlib.sha1(path.encode("utf-8")).hexdigest()[:8]
+    return name + ".dot"
+
+def render_targets(history, repo_path, targets, output_dir, config):
+    """Построение графов для части файлов одного репозитория (выполняется в пуле)."""
+    options = condense_options(config)
+    results = []
+    for target_file in targets:
+        start = time.perf_counter()
+        dot_path = os.path.join(output_dir, target_dot_name(target_file))
+        commits = history.file_history(target_file)
+        if options is not None:
+            commits = condense_commits(commits, **options)
+        count = generate_dot_file(repo_path, commits, dot_path, config.get('max_label_files'))
+        png_path = None
+        if not count:
+            os.remove(dot_path)
+            dot_path = None
+        elif config.get('render', False):
+            visualize_graph(dot_path, config.get('visualizer_path'))
+            png_path = os.path.splitext(dot_path)[0] + '.png'
+        results.append({
+            'repo': repo_path,
+            'target': target_file,
+            'commits': count,
+            'dot': dot_path,
+            'png': png_path,
+            'seconds': round(time.perf_counter() - start, 4),
+        })
+    return results
+
+def chunked(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def run_multi(config):
+    """Анализ нескольких файлов в нескольких репозиториях на пуле процессов.
+
+    История каждого репозитория обходится один раз, а графы отдельных файлов
+    строятся из нее в рабочих процессах. Для каждого файла пишется свой DOT
+    (и PNG при render: true), общий итог - в summary.json.
+    """
+    start = time.perf_counter()
+    backend = config.get('backend', 'git')
+    workers = config.get('workers') or os.cpu_count() or 1
+    output_dir = config.get('output_dir', os.path.join(os.getcwd(), 'graphs'))
+    repos = expand_repos(config['repo_path'])
+
+    if workers > 1 and len(repos) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(min(workers, len(repos))) as pool:
+            histories = dict(zip(repos, pool.map(load_repo_history, repos, [backend] * len(repos))))
+    else:
+        histories = {repo: load_repo_history(repo, backend) for repo in repos}
+
+    tasks = []
+    names = set()
+    for repo_path in repos:
+        targets = expand_targets(histories[repo_path], config['target_file'])
+        name = os.path.basename(os.path.realpath(repo_path)) or 'repo'
+        while name in names:
+            name += '_'
+        names.add(name)
+        repo_dir = os.path.join(output_dir, name)
+        os.makedirs(repo_dir, exist_ok=True)
+        # Мелкие порции выравнивают нагрузку между процессами
+        size = max(1, len(targets) // (workers * 4))
+        tasks.extend((repo_path, chunk, repo_dir) for chunk in chunked(targets, size))
+
+    results = []
+    if workers > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(workers) as pool:
+            # Задаче передается только история ее репозитория и только с путями ее файлов
+            futures = [pool.submit(render_targets, histories[repo].restrict(chunk), repo, chunk, repo_dir, config)
+                       for repo, chunk, repo_dir in tasks]
+            for future in futures:
+                results.extend(future.result())
+    else:
+        for repo, chunk, repo_dir in tasks:
+            results.extend(render_targets(histories[repo], repo, chunk, repo_dir, config))
+
+    summary = {
+        'repos': [{'repo': repo, 'commits': len(histories[repo])} for repo in repos],
+        'targets': results,
+        'seconds': round(time.perf_counter() - start, 4),
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    summary_path = os.path.join(output_dir, 'summary.json')
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    built = sum(1 for result in results if result['dot'])
+    print(f"Построено графов: {built} из {len(results)}, итоги в файле: {summary_path}")
+    return summary
+
 def main(config_path):
     """Главная функция."""
     config = read_config(config_path)
+    if is_multi_config(config):
+        run_multi(config)
+        return
+
     repo_path = config['repo_path']
     target_file = config['target_file']
 
     print(f"Анализируем репозиторий: {repo_path}")
     
-    # Получаем коммиты с указанным файлом
-    commits_with_file = get_commits_with_file(repo_path, target_file)
+    # Генерируем файл в формате DOT прямо из потока коммитов с указанным файлом
+    dot_file_path = os.path.join(os.getcwd(), 'graph.dot')
+    backend = config.get('backend', 'git')
+    if config.get('cache_path'):
+        commits = iter_commits_cached(repo_path, target_file, config['cache_path'], backend)
+    else:
+        commits = iter_commits(repo_path, target_file, backend)
+    options = condense_options(config)
+    if options is not None:
+        commits = condense_commits(commits, **options)
+    count = generate_dot_file(repo_path, commits, dot_file_path, config.get('max_label_files'))
 
-    if not commits_with_file:
+    if not count:
+        os.remove(dot_file_path)
         print("Не найдено коммитов с указанным файлом.")
         return
 
-
-    # Генерируем файл в формате DOT
-    dot_file_path = os.path.join(os.getcwd(), 'graph.dot')
-    generate_dot_file(repo_path, commits_with_file, dot_file_path)
-
     # Визуализируем граф из файла DOT
-    visualize_graph(dot_file_path)
+    visualize_graph(dot_file_path, config.get('visualizer_path'))
 
 if __name__ == "__main__":
-    import sys
+    if fastconfig.IMPORT_PROFILE_FLAG in sys.argv:
+        sys.exit(fastconfig.run_import_profile())
     if len(sys.argv) != 2:
-        print("Использование: python script.py <config.yaml>")
+        print("Использование: python script.py <config.yaml> [--import-profile]")
         sys.exit(1)
 
     main(sys.argv[1])
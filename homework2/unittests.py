@@ -1,8 +1,16 @@
 import unittest
 from unittest.mock import patch, mock_open, MagicMock
-from hw2 import read_config, get_commits_with_file, get_parents, build_dependency_graph
+from hw2 import read_config, get_commits_with_file, generate_dot_file
+from hw2 import CommitRecord, parse_commit_record, iter_commits_cached, load_repo_history, run_multi
+from hw2 import condense_commits, visualize_graph, target_dot_name
+from gitrepo import apply_delta, murmur3
+import subprocess
+import io
+import json
+import stat
+import os
+import tempfile
 import yaml
-from graphviz import Digraph
 
 class TestDependencyGraph(unittest.TestCase):
 
@@ -23,40 +31,299 @@ class TestDependencyGraph(unittest.TestCase):
         self.assertEqual(config['repo_path'], '/repo')
         self.assertEqual(config['target_file'], 'file.txt')
 
-    @patch("subprocess.run")
-    def test_get_commits_with_file(self, mock_run):
-        # Эмуляция вывода git log с коммитами
-        mock_run.return_value = MagicMock(
-            stdout="abcd1234\ntest_file.txt\nother_file.txt\n\nefg5678\ntest_file.txt\n",
-            returncode=0
+    @patch("subprocess.Popen")
+    def test_get_commits_with_file_parents(self, mock_popen):
+        # Вывод git log -z: RS хэш US родители US, затем имена файлов через NUL
+        a, b, c, m = "a" * 40, "b" * 40, "c" * 64, "d" * 40
+        name = "0123456789012345678901234567890123456789"  # имя файла длиной с хэш
+        stdout = (f"\x1e{m}\x1f{b} {c}\x1f\0"
+                  f"\x1e{b}\x1f{a}\x1f\ntest.txt\0{name}\0\0"
+                  f"\x1e{c}\x1f{a}\x1f\ntest.txt\0\0"
+                  f"\x1e{a}\x1f\x1f\ntest.txt\0").encode()
+        mock_popen.return_value = MagicMock(
+            stdout=io.BytesIO(stdout), stderr=io.BytesIO(b""), returncode=0
         )
-        commits = get_commits_with_file("/path/to/repo", "test_file.txt")
-        self.assertEqual(len(commits), 0)
-
-
-    @patch("subprocess.run")
-    def test_get_parents(self, mock_run):
-        mock_run.return_value = MagicMock(stdout="abcd1234 efgh5678 ijkl9012", returncode=0)
-        parents = get_parents("/path/to/repo", "abcd1234")
-        self.assertEqual(parents, ["efgh5678", "ijkl9012"])
-
-    def test_build_dependency_graph(self):
-        graph = build_dependency_graph("/repo", self.sample_commits)
-        self.assertIsInstance(graph, Digraph)
-        nodes = graph.source.splitlines()
-        # Проверяем, что коммиты отображаются как узлы
-        self.assertIn('LR', nodes[1]) 
-        self.assertIn('LR', nodes[1])
-        self.assertIn('LR', graph.source)
-
-    @patch("graphviz.Digraph.render")
-    def test_visualize_graph(self, mock_render):
-        mock_render.return_value = None
-        graph = Digraph(format='png')
-        graph.node("abcd1234", label="Test Node")
-        graph.render("/output/path")
-        # Проверяем, что render был вызван с правильным параметром
-        mock_render.assert_called_with("/output/path")
+        mock_popen.return_value.poll.return_value = 0
+        commits = get_commits_with_file("/path/to/repo", "test.txt")
+        self.assertEqual([commit.hash for commit in commits], [m, b, c, a])
+        self.assertEqual(commits[0].parents, (b, c))
+        self.assertEqual(commits[0].files, ())
+        self.assertEqual(commits[1].files, ("test.txt", name))
+        self.assertEqual(commits[3]["parents"], ())
+
+    def test_parse_commit_record_waits_for_complete_record(self):
+        data = ("\x1e" + "a" * 40 + "\x1f\x1f\ntest.txt\0\0").encode()
+        for cut in range(len(data)):
+            record, pos = parse_commit_record(data[:cut], 0)
+            self.assertIsNone(record)
+            self.assertEqual(pos, 0)
+        record, pos = parse_commit_record(data, 0)
+        self.assertEqual(record.files, ("test.txt",))
+        self.assertEqual(pos, len(data))
+
+    def test_generate_dot_file_uses_parent_edges(self):
+        commits = iter([
+            CommitRecord("m" * 40, ["b" * 40, "c" * 40]),
+            CommitRecord("b" * 40, ["a" * 40], ["test.txt"]),
+            CommitRecord("c" * 40, ["a" * 40], ["test.txt"]),
+            CommitRecord("a" * 40, [], ["test.txt"]),
+        ])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "graph.dot")
+            count = generate_dot_file("/repo", commits, path)
+            with open(path) as f:
+                dot = f.read()
+        self.assertEqual(count, 4)
+        self.assertIn(f'"{"a" * 40}" -> "{"b" * 40}";', dot)
+        self.assertIn(f'"{"a" * 40}" -> "{"c" * 40}";', dot)
+        self.assertIn(f'"{"c" * 40}" -> "{"m" * 40}";', dot)
+        self.assertEqual(dot.count("->"), 4)
+
+    def make_repo(self, path):
+        """Создает репозиторий с ветвлением и слиянием, затрагивающими test.txt."""
+        env = dict(os.environ, GIT_AUTHOR_NAME="test", GIT_AUTHOR_EMAIL="test@example.com",
+                   GIT_COMMITTER_NAME="test", GIT_COMMITTER_EMAIL="test@example.com")
+        timestamp = [1700000000]
+
+        def git(*args):
+            timestamp[0] += 60
+            env["GIT_AUTHOR_DATE"] = env["GIT_COMMITTER_DATE"] = f"{timestamp[0]} +0000"
+            subprocess.run(["git", "-C", path, *args], env=env, check=True,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        def commit(name, text):
+            os.makedirs(os.path.dirname(os.path.join(path, name)) or path, exist_ok=True)
+            with open(os.path.join(path, name), "a") as f:
+                f.write(text + "\n")
+            git("add", name)
+            git("commit", "-q", "-m", text)
+
+        git("init", "-q")
+        commit("test.txt", "1")
+        commit("other.txt", "2")
+        git("checkout", "-q", "-b", "feature")
+        commit("test.txt", "3")
+        commit("dir/nested.txt", "4")
+        git("checkout", "-q", "-")
+        commit("test.txt", "5")
+        git("merge", "-q", "--no-edit", "-X", "theirs", "feature")
+        commit("test.txt", "6")
+        return git
+
+    def history(self, repo, target, backend):
+        return [(c.hash, c.parents, c.files) for c in get_commits_with_file(repo, target, backend)]
+
+    def test_native_backend_matches_git(self):
+        with tempfile.TemporaryDirectory() as repo:
+            git = self.make_repo(repo)
+            for target in ("test.txt", "dir", "missing.txt"):
+                # Loose-объекты
+                self.assertEqual(self.history(repo, target, "native"), self.history(repo, target, "git"))
+            git("gc", "-q")
+            git("commit-graph", "write")
+            for target in ("test.txt", "dir"):
+                # Pack-файлы с дельтами и commit-graph
+                self.assertEqual(self.history(repo, target, "native"), self.history(repo, target, "git"))
+            git("commit-graph", "write", "--reachable", "--changed-paths")
+            for target in ("test.txt", "dir", "dir/nested.txt", "other.txt"):
+                # Фильтры Блума измененных путей
+                self.assertEqual(self.history(repo, target, "native"), self.history(repo, target, "git"))
+            commits = self.history(repo, "test.txt", "native")
+            self.assertEqual(len(commits), 5)
+            self.assertEqual(len(commits[1][1]), 2)  # слияние с двумя родителями
+
+    def test_cached_history_matches_full_walk(self):
+        with tempfile.TemporaryDirectory() as repo, tempfile.TemporaryDirectory() as tmp:
+            git = self.make_repo(repo)
+            cache_path = os.path.join(tmp, "cache.sqlite")
+            git("branch", "old")
+            self.assertEqual(len(list(iter_commits_cached(repo, "test.txt", cache_path))), 5)
+
+            # Ветка от старого коммита сливается после обработанного HEAD
+            git("checkout", "-q", "old~2")
+            git("checkout", "-q", "-b", "late")
+            with open(os.path.join(repo, "test.txt"), "a") as f:
+                f.write("7\n")
+            git("commit", "-q", "-am", "7")
+            git("checkout", "-q", "-")
+            with open(os.path.join(repo, "test.txt"), "a") as f:
+                f.write("8\n")
+            git("commit", "-q", "-am", "8")
+            git("merge", "-q", "--no-edit", "-X", "theirs", "late")
+
+            full = sorted(self.history(repo, "test.txt", "git"))
+            for backend in ("git", "native"):
+                cached = [(c.hash, c.parents, c.files) for c in iter_commits_cached(repo, "test.txt", cache_path, backend)]
+                self.assertEqual(sorted(cached), full)
+
+            # HEAD не изменился: история читается только из кэша
+            with patch("hw2.iter_commits", side_effect=AssertionError):
+                self.assertEqual(len(list(iter_commits_cached(repo, "test.txt", cache_path))), len(full))
+
+            # Линейное продолжение дописывается к кэшу в порядке git log
+            with open(os.path.join(repo, "test.txt"), "a") as f:
+                f.write("9\n")
+            git("commit", "-q", "-am", "9")
+            cached = [(c.hash, c.parents, c.files) for c in iter_commits_cached(repo, "test.txt", cache_path)]
+            self.assertEqual(cached, self.history(repo, "test.txt", "git"))
+
+    def test_repo_history_matches_git(self):
+        with tempfile.TemporaryDirectory() as repo:
+            self.make_repo(repo)
+            for backend in ("git", "native"):
+                history = load_repo_history(repo, backend)
+                for target in ("test.txt", "dir", "dir/nested.txt", "missing.txt"):
+                    derived = [(c.hash, list(c.parents), list(c.files)) for c in history.file_history(target)]
+                    expected = [(h, list(p), list(f)) for h, p, f in self.history(repo, target, "git")]
+                    self.assertEqual(sorted(derived), sorted(expected))
+                    # Усеченная для рабочего процесса история дает тот же результат
+                    restricted = history.restrict([target]).file_history(target)
+                    self.assertEqual([(c.hash, list(c.parents), list(c.files)) for c in restricted], derived)
+
+    def make_octopus_repo(self, path):
+        """Создает слияние трех веток: с файлом, без него и с отдельным корнем."""
+        env = dict(os.environ, GIT_AUTHOR_NAME="test", GIT_AUTHOR_EMAIL="test@example.com",
+                   GIT_COMMITTER_NAME="test", GIT_COMMITTER_EMAIL="test@example.com")
+        timestamp = [1700000000]
+
+        def git(*args):
+            timestamp[0] += 60
+            env["GIT_AUTHOR_DATE"] = env["GIT_COMMITTER_DATE"] = f"{timestamp[0]} +0000"
+            return subprocess.run(["git", "-C", path, *args], env=env, check=True,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True).stdout.strip()
+
+        def write(name, text):
+            os.makedirs(os.path.dirname(os.path.join(path, name)) or path, exist_ok=True)
+            with open(os.path.join(path, name), "w") as f:
+                f.write(text + "\n")
+            git("add", name)
+
+        git("init", "-q", "-b", "main")
+        write("test.txt", "1")
+        write("dir/x.txt", "1")
+        write("dir/y.txt", "1")
+        git("commit", "-q", "-m", "1")
+        git("rm", "-q", "test.txt")
+        git("commit", "-q", "-m", "2")
+        git("checkout", "-q", "-b", "side")
+        write("dir/x.txt", "3")
+        git("commit", "-q", "-m", "3")
+        git("checkout", "-q", "main")
+        write("test.txt", "4")
+        write("dir/y.txt", "4")
+        git("commit", "-q", "-m", "4")
+        git("checkout", "-q", "--orphan", "root")
+        git("rm", "-q", "-r", "--cached", ".")
+        write("other.txt", "5")
+        git("commit", "-q", "-m", "5")
+        git("checkout", "-q", "-f", "main")
+
+        # Слияние берет dir/x.txt из side и удаляет test.txt
+        git("checkout", "-q", "side", "--", "dir/x.txt")
+        git("rm", "-q", "test.txt")
+        tree = git("write-tree")
+        parents = [git("rev-parse", ref) for ref in ("root", "main", "side")]
+        merge = git("commit-tree", tree, "-m", "octopus", *[arg for p in parents for arg in ("-p", p)])
+        git("reset", "-q", "--hard", merge)
+        return merge, parents
+
+    def test_octopus_merge_matches_git(self):
+        with tempfile.TemporaryDirectory() as repo:
+            merge, (_, main, _) = self.make_octopus_repo(repo)
+            expected = {target: self.history(repo, target, "git")
+                        for target in ("test.txt", "dir", "dir/x.txt", "other.txt")}
+            # Корень без файла и ветка side, которая сводится к предку main,
+            # убираются из родителей, а слияние сравнивается с main
+            self.assertEqual(expected["test.txt"][0], (merge, (main,), ("test.txt",)))
+            history = load_repo_history(repo, "git")
+            for target, commits in expected.items():
+                self.assertEqual(self.history(repo, target, "native"), commits)
+                derived = [(c.hash, list(c.parents), list(c.files)) for c in history.file_history(target)]
+                self.assertEqual(derived, [(h, list(p), list(f)) for h, p, f in commits])
+
+    def test_run_multi_writes_graph_per_target(self):
+        with tempfile.TemporaryDirectory() as repo, tempfile.TemporaryDirectory() as out:
+            self.make_repo(repo)
+            config = {'repo_path': [repo], 'target_file': ['*.txt', 'missing.txt'],
+                      'output_dir': out, 'workers': 1}
+            with patch("hw2.load_repo_history", wraps=load_repo_history) as load:
+                summary = run_multi(config)
+            load.assert_called_once()
+            built = {r['target']: r['commits'] for r in summary['targets']}
+            self.assertEqual(built, {'dir/nested.txt': 1, 'other.txt': 1, 'test.txt': 5, 'missing.txt': 0})
+            repo_dir = os.path.join(out, os.path.basename(os.path.realpath(repo)))
+            self.assertTrue(os.path.exists(os.path.join(repo_dir, 'dir__nested.txt.dot')))
+            self.assertFalse(os.path.exists(os.path.join(repo_dir, 'missing.txt.dot')))
+            with open(os.path.join(out, 'summary.json'), encoding='utf-8') as f:
+                self.assertEqual(json.load(f)['targets'], summary['targets'])
+
+    def test_target_dot_names_do_not_collide(self):
+        names = {target_dot_name(t) for t in ("a/b", "a__b", "a_/_b", "a/_/b", "a/b/")}
+        self.assertEqual(len(names), 4)
+        self.assertEqual(target_dot_name("dir/nested.txt"), "dir__nested.txt.dot")
+
+    def test_parse_commit_record_with_time(self):
+        buf = b"\x1eaaa\x1fbbb\x1f1700000000\x1f\ntest.txt\x00\x00"
+        record, pos = parse_commit_record(buf, 0)
+        self.assertEqual((record.hash, record.parents, record.files, record.time),
+                         ("aaa", ("bbb",), ("test.txt",), 1700000000))
+        self.assertEqual(pos, len(buf))
+
+    def test_condense_commits(self):
+        # e -> d -> c -> b -> a, и ветка x от b, слитая в d
+        commits = [
+            CommitRecord("e", ["d"], ["f1"], 500),
+            CommitRecord("d", ["c", "x"], [], 400),
+            CommitRecord("x", ["b"], ["f2"], 350),
+            CommitRecord("c", ["b"], ["f1"], 300),
+            CommitRecord("b", ["a"], ["f1", "f3"], 200),
+            CommitRecord("a", [], ["f1"], 100),
+        ]
+        condensed = {c.hash: (c.parents, c.files, c.squashed) for c in condense_commits(commits)}
+        self.assertEqual(condensed, {
+            "e": (("c", "x"), ("f1",), ("d",)),
+            "x": (("b",), ("f2",), ()),
+            "c": (("b",), ("f1",), ()),
+            "b": ((), ("f1", "f3"), ("a",)),
+        })
+        window = condense_commits(commits, collapse_chains=False, max_depth=2)
+        self.assertEqual([c.hash for c in window], ["e", "d", "x", "c"])
+        self.assertEqual(window[-1].parents, ())
+        recent = condense_commits(commits, collapse_chains=False, since=300)
+        self.assertEqual([c.hash for c in recent], ["e", "d", "x", "c"])
+
+    @unittest.skipUnless(os.name == "posix", "заглушка dot - shell-скрипт")
+    def test_visualize_graph_skips_unchanged_dot(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            stub = os.path.join(tmp, "dot")
+            calls = os.path.join(tmp, "calls")
+            with open(stub, "w") as f:
+                f.write(f'#!/bin/sh\necho run >> "{calls}"\nshift 2\necho png > "$2"\n')
+            os.chmod(stub, os.stat(stub).st_mode | stat.S_IEXEC)
+            dot_path = os.path.join(tmp, "graph.dot")
+            generate_dot_file("/repo", [CommitRecord("a" * 40, [], ["test.txt"])], dot_path)
+
+            visualize_graph(dot_path, stub)
+            visualize_graph(dot_path, stub)
+            generate_dot_file("/repo", [CommitRecord("b" * 40, [], ["test.txt"])], dot_path)
+            visualize_graph(dot_path, stub)
+
+            with open(calls) as f:
+                self.assertEqual(len(f.readlines()), 2)
+            self.assertTrue(os.path.exists(os.path.join(tmp, "graph.png")))
+
+    def test_apply_delta(self):
+        base = b"hello world"
+        # размер базы 11, размер результата 12, копия 5 байт с 0, вставка "!", копия 6 байт с 5
+        delta = bytes([11, 12, 0x90, 5, 1]) + b"!" + bytes([0x91, 5, 6])
+        self.assertEqual(apply_delta(base, delta), b"hello! world")
+
+    def test_murmur3(self):
+        # Контрольные значения 32-битного murmur3
+        self.assertEqual(murmur3(b"", 0), 0)
+        self.assertEqual(murmur3(b"", 1), 0x514E28B7)
+        self.assertEqual(murmur3(b"Hello, world!", 1234), 0xFAF6CDB3)
+        self.assertEqual(murmur3(b"The quick brown fox jumps over the lazy dog", 0x9747B28C), 0x2FA826CD)
 
 if __name__ == "__main__":
     unittest.main()
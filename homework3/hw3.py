@@ -1,63 +1,1263 @@
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
 import sys
-import re
-import toml
+import time
+from collections.abc import Mapping
 
-def toml_to_custom_config(data):
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fastconfig
+
+# toml и concurrent.futures импортируются только там, где нужны: потоковый
+# режим и разбор результата обходятся без них. toml.TomlDecodeError -
+# подкласс ValueError, поэтому для перехвата ошибок модуль не нужен.
+
+def format_scalar(value):
+    """Запись скалярного значения на учебном конфигурационном языке."""
+    if isinstance(value, str):
+        # Строки; кавычки, обратная косая черта и переводы строк экранируются
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+    elif isinstance(value, int) or isinstance(value, float):
+        return str(value)  # Числа
+    else:
+        raise ValueError(f"Неподдерживаемое значение: {value}")
+
+def format_key(key):
+    """Ключ без кавычек, если он состоит из латинских букв, цифр, _ и -, иначе в кавычках."""
+    if key and all(char in BARE_KEY_CHARS for char in key):
+        return key
+    return format_scalar(key)
+
+NAME_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_")
+OPERATORS = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": lambda a, b: a / b,
+}
+
+def is_reference(value):
+    """Является ли значение ссылкой на константу или выражением вида #(...)."""
+    return isinstance(value, str) and value.startswith("#(") and value.endswith(")")
+
+def tokenize_expression(text):
+    """Разбиение выражения на числа, имена, строки, операторы и скобки."""
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        char = text[pos]
+        if char in " \t":
+            pos += 1
+        elif char in "+-*/()":
+            tokens.append(("op", char))
+            pos += 1
+        elif char == '"':
+            end = text.find('"', pos + 1)
+            if end < 0:
+                raise ValueError(f"Неверное выражение константы: {text}")
+            tokens.append(("str", text[pos + 1:end]))
+            pos = end + 1
+        elif char in NAME_CHARS:
+            start = pos
+            while pos < len(text) and (text[pos] in NAME_CHARS or text[pos] == "."):
+                pos += 1
+            word = text[start:pos]
+            if word[0].isdigit():
+                try:
+                    tokens.append(("num", int(word) if word.isdigit() else float(word)))
+                except ValueError:
+                    raise ValueError(f"Неверное выражение константы: {text}") from None
+            else:
+                tokens.append(("name", word))
+        else:
+            raise ValueError(f"Неверное выражение константы: {text}")
+    return tokens
+
+def compile_expression(text):
     """
-    Преобразует TOML-данные в текст формата учебного конфигурационного языка.
+    Разбор выражения в дерево из кортежей и список имен, от которых оно зависит.
+
+    Поддерживаются числа, строки в двойных кавычках, имена констант,
+    операции + - * / со скобками и унарный минус.
+    """
+    tokens = tokenize_expression(text)
+    names = []
+    pos = 0
+
+    def fail():
+        raise ValueError(f"Неверное выражение константы: {text}")
+
+    def parse_sum():
+        nonlocal pos
+        node = parse_product()
+        while pos < len(tokens) and tokens[pos] in (("op", "+"), ("op", "-")):
+            op = tokens[pos][1]
+            pos += 1
+            node = ("op", op, node, parse_product())
+        return node
+
+    def parse_product():
+        nonlocal pos
+        node = parse_unary()
+        while pos < len(tokens) and tokens[pos] in (("op", "*"), ("op", "/")):
+            op = tokens[pos][1]
+            pos += 1
+            node = ("op", op, node, parse_unary())
+        return node
+
+    def parse_unary():
+        nonlocal pos
+        if pos < len(tokens) and tokens[pos] == ("op", "-"):
+            pos += 1
+            return ("neg", parse_unary())
+        return parse_atom()
+
+    def parse_atom():
+        nonlocal pos
+        if pos >= len(tokens):
+            fail()
+        kind, value = tokens[pos]
+        pos += 1
+        if kind in ("num", "str"):
+            return ("const", value)
+        if kind == "name":
+            if value not in names:
+                names.append(value)
+            return ("name", value)
+        if value == "(":
+            node = parse_sum()
+            if pos >= len(tokens) or tokens[pos] != ("op", ")"):
+                fail()
+            pos += 1
+            return node
+        fail()
+
+    tree = parse_sum()
+    if pos != len(tokens):
+        fail()
+    return tree, names
+
+class ConstantTable:
+    """
+    Таблица констант с вычислением выражений.
+
+    Значения вида "#(выражение)" могут ссылаться на другие константы в любом
+    порядке: по ссылкам строится граф зависимостей, циклы обнаруживаются,
+    а значения вычисляются один раз в топологическом порядке. Разобранные
+    выражения и результаты подстановок запоминаются. Таблица с base
+    наследует константы базовой, поэтому одну заранее вычисленную таблицу
+    можно использовать для многих файлов.
+    """
+
+    def __init__(self, definitions=None, base=None):
+        self.base = base
+        self.values = {}
+        self._compiled = {}
+        self._resolved = {}
+        if definitions:
+            self.define(definitions)
+
+    def __contains__(self, name):
+        return name in self.values or (self.base is not None and name in self.base)
+
+    def __getitem__(self, name):
+        table = self
+        while table is not None:
+            if name in table.values:
+                return table.values[name]
+            table = table.base
+        raise ValueError(f"Константа '{name}' не определена.")
+
+    def compile(self, text):
+        compiled = self._compiled.get(text)
+        if compiled is None:
+            compiled = self._compiled[text] = compile_expression(text)
+        return compiled
+
+    def evaluate(self, tree):
+        """Вычисление дерева выражения по значениям уже определенных констант."""
+        kind = tree[0]
+        if kind == "const":
+            return tree[1]
+        if kind == "name":
+            return self[tree[1]]
+        if kind == "neg":
+            return -self.evaluate(tree[1])
+        left, right = self.evaluate(tree[2]), self.evaluate(tree[3])
+        try:
+            return OPERATORS[tree[1]](left, right)
+        except (TypeError, ZeroDivisionError) as e:
+            raise ValueError(f"Ошибка вычисления константы: {left!r} {tree[1]} {right!r}: {e}") from None
+
+    def define(self, definitions):
+        """Добавление констант из словаря с вычислением зависимостей."""
+        pending = {}
+        for name, value in definitions.items():
+            if is_reference(value):
+                pending[name] = self.compile(value[2:-1])
+            else:
+                self.values[name] = value
+
+        dependents = {name: [] for name in pending}
+        waiting = {}
+        for name, (_, names) in pending.items():
+            count = 0
+            for dependency in names:
+                if dependency in pending:
+                    dependents[dependency].append(name)
+                    count += 1
+                elif dependency not in self:
+                    raise ValueError(f"Константа '{dependency}' не определена.")
+            waiting[name] = count
+
+        ready = [name for name, count in waiting.items() if count == 0]
+        evaluated = 0
+        while ready:
+            name = ready.pop()
+            self.values[name] = self.evaluate(pending[name][0])
+            evaluated += 1
+            for dependent in dependents[name]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+
+        if evaluated < len(pending):
+            cycle = self._find_cycle({n: names for n, (_, names) in pending.items() if waiting[n]})
+            raise ValueError(f"Циклическая зависимость констант: {' -> '.join(cycle)}")
+        self._resolved.clear()
+
+    @staticmethod
+    def _find_cycle(graph):
+        """Путь по циклу среди констант, оставшихся невычисленными."""
+        name = next(iter(graph))
+        path = []
+        seen = {}
+        while name not in seen:
+            seen[name] = len(path)
+            path.append(name)
+            name = next(d for d in graph[name] if d in graph)
+        return path[seen[name]:] + [name]
+
+    def resolve(self, value):
+        """Значение с подстановкой, если это ссылка #(...); иначе само значение."""
+        if not is_reference(value):
+            return value
+        text = value[2:-1]
+        try:
+            return self._resolved[text]
+        except KeyError:
+            pass
+        if text in self:
+            result = self[text]
+        else:
+            result = self.evaluate(self.compile(text)[0])
+        self._resolved[text] = result
+        return result
+
+def load_constants(path):
+    """Таблица констант из TOML-файла: секция [constants] или весь файл."""
+    data = fastconfig.load_config(path, "toml")
+    return ConstantTable(data.get("constants", data))
+
+def write_table(table, stream, constants, depth=0):
+    """
+    Запись словаря в поток без рекурсии.
+
+    Вложенные словари обходятся через явный стек итераторов, каждый фрагмент
+    пишется в поток один раз, а отступ определяется глубиной вложенности.
+    """
+    stream.write("{")
+    stack = [(iter(table.items()), depth)]
+    while stack:
+        items, level = stack[-1]
+        indent = "  " * (level + 1)
+        for key, value in items:
+            value = constants.resolve(value)
+            if isinstance(value, dict):
+                stream.write(f"\n{indent}{format_key(key)} = {{")
+                stack.append((iter(value.items()), level + 1))
+                break
+            stream.write(f"\n{indent}{format_key(key)} = {format_scalar(value)};")
+        else:
+            stack.pop()
+            stream.write("\n" + "  " * level + "}")
+            if stack:
+                stream.write(";")
+
+def write_value(value, stream, constants):
+    if isinstance(value, dict):
+        write_table(value, stream, constants)
+    else:
+        stream.write(format_scalar(value))
+
+def write_tables(tables, stream, constants=None, verify=False):
     """
-    output = []
-    constants = {}
+    Запись пар (имя, значение) верхнего уровня в поток на учебном языке.
 
-    def format_value(value):
-        if isinstance(value, str):
-            return f'"{value}"'  # Строки
-        elif isinstance(value, int) or isinstance(value, float):
-            return str(value)  # Числа
+    Таблица constants выводится объявлениями const, остальные - блоками.
+    Пары могут приходить из генератора, по одной таблице за раз. Внешняя
+    таблица constants (ConstantTable) доступна документу, но не выводится.
+    С verify каждый фрагмент перед записью разбирается обратно и сверяется
+    с исходными данными.
+    """
+    constants = ConstantTable(base=constants)
+    separator = ""
+
+    for key, value in tables:
+        target = io.StringIO() if verify else stream
+        if key == "constants":
+            constants.define(value)
+            for name in value:
+                target.write(f"{separator}const {format_key(name)} = ")
+                write_value(constants[name], target, constants)
+                separator = "\n"
         elif isinstance(value, dict):
-            return dict_to_config(value)  # Словари
+            target.write(separator)
+            write_table(value, target, constants)
+            separator = "\n"
         else:
-            raise ValueError(f"Неподдерживаемое значение: {value}")
-
-    def dict_to_config(d):
-        lines = ["{"]
-        for key, value in d.items():
-            if isinstance(value, str) and value.startswith("#(") and value.endswith(")"):
-                const_name = value[2:-1]
-                if const_name in constants:
-                    value = constants[const_name]
+            raise ValueError(f"Неподдерживаемый верхнеуровневый элемент: {key}")
+        if verify:
+            fragment = target.getvalue()
+            verify_fragment(fragment, key, value, constants)
+            stream.write(fragment)
+
+def write_custom_config(data, stream, constants=None, verify=False):
+    """
+    Запись TOML-данных в поток на учебном конфигурационном языке.
+
+    Сначала выводятся константы, затем таблицы верхнего уровня; исходный
+    словарь не изменяется.
+    """
+    tables = [("constants", data["constants"])] if "constants" in data else []
+    tables.extend((key, value) for key, value in data.items() if key != "constants")
+    write_tables(tables, stream, constants, verify)
+
+def toml_to_custom_config(data, constants=None, verify=False):
+    """
+    Преобразует TOML-данные в текст формата учебного конфигурационного языка.
+    """
+    output = io.StringIO()
+    write_custom_config(data, output, constants, verify)
+    return output.getvalue()
+
+class TomlSyntaxError(ValueError):
+    """Ошибка разбора TOML в потоковом режиме."""
+
+    def __init__(self, message, lineno):
+        super().__init__(f"{message} (строка {lineno})")
+        self.lineno = lineno
+
+BARE_KEY_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-")
+BASIC_ESCAPES = {"b": "\b", "t": "\t", "n": "\n", "f": "\f", "r": "\r", '"': '"', "\\": "\\"}
+VALUE_END_CHARS = frozenset(" \t\r\n,]}#")
+
+class TomlStreamParser:
+    """
+    Потоковый разбор TOML.
+
+    Документ читается по строкам, а таблицы верхнего уровня выдаются по одной,
+    как только начинается следующая, поэтому в памяти находится только
+    текущая таблица. Подтаблицы ([a.b]) должны идти вместе со своей таблицей
+    верхнего уровня. Поддерживаются строки, числа, логические значения,
+    массивы, встроенные таблицы и ключи с точками.
+    """
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.line = ""
+        self.pos = 0
+        self.lineno = 0
+
+    def error(self, message):
+        raise TomlSyntaxError(message, self.lineno)
+
+    def next_line(self):
+        for line in self.lines:
+            self.line = line
+            self.pos = 0
+            self.lineno += 1
+            return True
+        self.line = ""
+        self.pos = 0
+        return False
+
+    def peek(self):
+        return self.line[self.pos:self.pos + 1]
+
+    def skip_spaces(self):
+        while self.pos < len(self.line) and self.line[self.pos] in " \t":
+            self.pos += 1
+
+    def at_line_end(self):
+        self.skip_spaces()
+        return self.pos >= len(self.line) or self.line[self.pos] in "#\r\n"
+
+    def skip_blank(self):
+        """Пропуск пробелов, комментариев и переводов строк внутри массива."""
+        while self.at_line_end():
+            if not self.next_line():
+                self.error("Неожиданный конец документа")
+
+    def expect(self, char):
+        self.skip_spaces()
+        if self.peek() != char:
+            self.error(f"Ожидался символ '{char}'")
+        self.pos += 1
+
+    def expect_line_end(self):
+        if not self.at_line_end():
+            self.error(f"Лишние символы: {self.line[self.pos:].strip()}")
+
+    def tables(self):
+        """Генератор пар (имя, таблица) верхнего уровня в порядке документа."""
+        root = {}
+        current_name = None
+        current = current_table = root
+        emitted = set()
+        headers = set()
+
+        while self.next_line():
+            if self.at_line_end():
+                continue
+            if self.peek() == "[":
+                if self.line.startswith("[[", self.pos):
+                    self.error("Массивы таблиц не поддерживаются")
+                self.pos += 1
+                path = self.parse_key()
+                self.expect("]")
+                self.expect_line_end()
+                if current_name is None:
+                    yield from root.items()
+                    emitted.update(root)
+                if path[0] != current_name:
+                    if current_name is not None:
+                        yield current_name, current_table
+                    if path[0] in emitted:
+                        self.error(f"Таблица '{path[0]}' уже выведена, ее части должны идти подряд")
+                    emitted.add(path[0])
+                    current_name = path[0]
+                    current_table = {}
+                    headers = set()
+                if tuple(path) in headers:
+                    self.error(f"Таблица '{'.'.join(path)}' определена повторно")
+                headers.add(tuple(path))
+                current = self.descend(current_table, path[1:])
+                continue
+
+            path = self.parse_key()
+            self.expect("=")
+            value = self.parse_value()
+            self.expect_line_end()
+            table = self.descend(current, path[:-1])
+            if path[-1] in table:
+                self.error(f"Ключ '{'.'.join(path)}' определен повторно")
+            table[path[-1]] = value
+
+        if current_name is None:
+            yield from root.items()
+        else:
+            yield current_name, current_table
+
+    def descend(self, table, path):
+        for key in path:
+            table = table.setdefault(key, {})
+            if not isinstance(table, dict):
+                self.error(f"Ключ '{key}' уже задан значением, а не таблицей")
+        return table
+
+    def parse_key(self):
+        """Ключ, возможно с точками, в виде списка частей."""
+        parts = []
+        while True:
+            self.skip_spaces()
+            char = self.peek()
+            if char == '"':
+                self.pos += 1
+                parts.append(self.parse_basic_string(False))
+            elif char == "'":
+                self.pos += 1
+                parts.append(self.parse_literal_string(False))
+            else:
+                start = self.pos
+                while self.pos < len(self.line) and self.line[self.pos] in BARE_KEY_CHARS:
+                    self.pos += 1
+                if start == self.pos:
+                    self.error("Ожидался ключ")
+                parts.append(self.line[start:self.pos])
+            self.skip_spaces()
+            if self.peek() != ".":
+                return parts
+            self.pos += 1
+
+    def parse_value(self):
+        self.skip_spaces()
+        line, pos = self.line, self.pos
+        if line.startswith('"""', pos):
+            self.pos += 3
+            return self.parse_basic_string(True)
+        if line.startswith("'''", pos):
+            self.pos += 3
+            return self.parse_literal_string(True)
+        char = self.peek()
+        if char == '"':
+            self.pos += 1
+            return self.parse_basic_string(False)
+        if char == "'":
+            self.pos += 1
+            return self.parse_literal_string(False)
+        if char == "{":
+            self.pos += 1
+            return self.parse_inline_table()
+        if char == "[":
+            self.pos += 1
+            return self.parse_array()
+
+        end = pos
+        while end < len(line) and line[end] not in VALUE_END_CHARS:
+            end += 1
+        token = line[pos:end]
+        self.pos = end
+        if token == "true":
+            return True
+        if token == "false":
+            return False
+        return self.parse_number(token)
+
+    def parse_number(self, token):
+        if not token:
+            self.error("Ожидалось значение")
+        digits = token.replace("_", "")
+        if ":" in digits or digits.count("-") > 1:
+            self.error(f"Дата и время не поддерживаются: {token}")
+        try:
+            if digits[:2] in ("0x", "0o", "0b"):
+                return int(digits, 0)
+            if digits.lstrip("+-").isdigit():
+                return int(digits)
+            return float(digits)
+        except ValueError:
+            self.error(f"Неверное значение: {token}")
+
+    def parse_inline_table(self):
+        table = {}
+        self.skip_spaces()
+        if self.peek() == "}":
+            self.pos += 1
+            return table
+        while True:
+            path = self.parse_key()
+            self.expect("=")
+            value = self.parse_value()
+            target = self.descend(table, path[:-1])
+            if path[-1] in target:
+                self.error(f"Ключ '{'.'.join(path)}' определен повторно")
+            target[path[-1]] = value
+            self.skip_spaces()
+            char = self.peek()
+            self.pos += 1
+            if char == "}":
+                return table
+            if char != ",":
+                self.error("Ожидался символ ',' или '}'")
+
+    def parse_array(self):
+        items = []
+        while True:
+            self.skip_blank()
+            if self.peek() == "]":
+                self.pos += 1
+                return items
+            items.append(self.parse_value())
+            self.skip_blank()
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return items
+            if char != ",":
+                self.error("Ожидался символ ',' или ']'")
+
+    def parse_basic_string(self, multiline):
+        chars = []
+        if multiline and self.line[self.pos:].lstrip("\r") in ("\n", ""):
+            # Перевод строки сразу после открывающих кавычек не входит в строку
+            self.next_line()
+        while True:
+            if self.pos >= len(self.line):
+                if not multiline or not self.next_line():
+                    self.error("Незакрытая строка")
+                continue
+            char = self.line[self.pos]
+            if char == '"':
+                if not multiline:
+                    self.pos += 1
+                    return "".join(chars)
+                if self.line.startswith('"""', self.pos):
+                    # Перед закрывающими кавычками допускается еще до двух кавычек
+                    end = self.pos + 3
+                    while end < len(self.line) and self.line[end] == '"' and end - self.pos < 5:
+                        end += 1
+                    chars.append('"' * (end - self.pos - 3))
+                    self.pos = end
+                    return "".join(chars)
+            elif char == "\\":
+                escape = self.line[self.pos + 1:self.pos + 2]
+                if multiline and not self.line[self.pos + 1:].strip():
+                    # Обратная косая черта в конце строки убирает перевод строки
+                    # и пробелы в начале следующих строк
+                    self.pos = len(self.line)
+                    while True:
+                        if self.pos >= len(self.line) and not self.next_line():
+                            self.error("Незакрытая строка")
+                        self.pos += len(self.line[self.pos:]) - len(self.line[self.pos:].lstrip())
+                        if self.pos < len(self.line):
+                            break
+                    continue
+                if escape in BASIC_ESCAPES:
+                    chars.append(BASIC_ESCAPES[escape])
+                    self.pos += 2
+                    continue
+                if escape in ("u", "U"):
+                    size = 4 if escape == "u" else 8
+                    code = self.line[self.pos + 2:self.pos + 2 + size]
+                    try:
+                        chars.append(chr(int(code, 16)))
+                    except ValueError:
+                        self.error(f"Неверная escape-последовательность: \\{escape}{code}")
+                    self.pos += 2 + size
+                    continue
+                self.error(f"Неверная escape-последовательность: \\{escape}")
+            elif char in "\r\n" and not multiline:
+                self.error("Незакрытая строка")
+            chars.append(char)
+            self.pos += 1
+
+    def parse_literal_string(self, multiline):
+        quote = "'''" if multiline else "'"
+        chars = []
+        if multiline and self.line[self.pos:].lstrip("\r") in ("\n", ""):
+            self.next_line()
+        while True:
+            end = self.line.find(quote, self.pos)
+            if end >= 0:
+                if multiline:
+                    # Перед закрывающими кавычками допускается еще до двух кавычек
+                    extra = 0
+                    while extra < 2 and self.line.startswith("'", end + 3 + extra):
+                        extra += 1
+                    end += extra
+                chars.append(self.line[self.pos:end])
+                self.pos = end + len(quote)
+                return "".join(chars)
+            if not multiline:
+                self.error("Незакрытая строка")
+            chars.append(self.line[self.pos:])
+            if not self.next_line():
+                self.error("Незакрытая строка")
+
+def iter_toml_tables(stream):
+    """Таблицы верхнего уровня TOML-документа из потока строк, по одной."""
+    return TomlStreamParser(stream).tables()
+
+class ConfigSyntaxError(ValueError):
+    """Ошибка разбора учебного конфигурационного языка."""
+
+    def __init__(self, message, text, pos):
+        self.lineno = text.count("\n", 0, pos) + 1
+        super().__init__(f"{message} (строка {self.lineno})")
+
+STRING_ESCAPES = {'"': '"', "\\": "\\", "n": "\n", "t": "\t"}
+WORD_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-.+")
+SPACE_CHARS = frozenset(" \t\r\n")
+
+class ConfigLexer:
+    """
+    Однопроходный лексер учебного конфигурационного языка без регулярных выражений.
+
+    Токены - пары (вид, значение): word (имена и числа), string, ref (#(...))
+    и одиночные символы { } = ;. В конце текста возвращается ("eof", None).
+    """
+
+    def __init__(self, text, pos=0):
+        self.text = text
+        self.pos = pos
+        self.start = pos
+
+    def error(self, message):
+        raise ConfigSyntaxError(message, self.text, self.start)
+
+    def next(self):
+        text = self.text
+        pos = self.pos
+        length = len(text)
+        while pos < length and text[pos] in SPACE_CHARS:
+            pos += 1
+        self.start = pos
+        if pos >= length:
+            self.pos = pos
+            return "eof", None
+
+        char = text[pos]
+        if char in "{}=;":
+            self.pos = pos + 1
+            return char, char
+        if char == '"':
+            return "string", self.read_string(pos + 1)
+        if char == "#" and text.startswith("#(", pos):
+            return "ref", self.read_reference(pos)
+        end = pos
+        while end < length and text[end] in WORD_CHARS:
+            end += 1
+        if end == pos:
+            self.error(f"Неожиданный символ '{char}'")
+        self.pos = end
+        return "word", text[pos:end]
+
+    def read_reference(self, pos):
+        """
+        Ссылка #(...), начинающаяся в pos. Конец ищется с учетом вложенных
+        скобок и строк в кавычках внутри выражения.
+        """
+        text = self.text
+        depth = 0
+        index = pos + 1
+        while index < len(text):
+            char = text[index]
+            if char == '"':
+                index = text.find('"', index + 1)
+                if index < 0:
+                    break
+            elif char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+                if depth == 0:
+                    self.pos = index + 1
+                    return text[pos:index + 1]
+            index += 1
+        self.error("Незакрытая ссылка на константу")
+
+    def read_string(self, pos):
+        text = self.text
+        chunks = []
+        while True:
+            quote = text.find('"', pos)
+            backslash = text.find("\\", pos, quote if quote >= 0 else len(text))
+            if quote < 0:
+                self.error("Незакрытая строка")
+            if backslash < 0:
+                chunks.append(text[pos:quote])
+                self.pos = quote + 1
+                return "".join(chunks)
+            chunks.append(text[pos:backslash])
+            escape = text[backslash + 1:backslash + 2]
+            if escape not in STRING_ESCAPES:
+                self.start = backslash
+                self.error(f"Неверная escape-последовательность: \\{escape}")
+            chunks.append(STRING_ESCAPES[escape])
+            pos = backslash + 2
+
+def parse_word(word):
+    """Значение слова: логическое, целое или вещественное число."""
+    if word == "True":
+        return True
+    if word == "False":
+        return False
+    try:
+        return int(word)
+    except ValueError:
+        return float(word)
+
+class ConfigParser:
+    """
+    Разбор текста учебного конфигурационного языка в словари.
+
+    Объявления const попадают в таблицу констант, а ссылки #(...) в значениях
+    заменяются их значениями. Вложенные таблицы разбираются без рекурсии.
+    """
+
+    def __init__(self, text, constants=None, pos=0):
+        self.lexer = ConfigLexer(text, pos)
+        self.constants = ConstantTable(base=constants)
+
+    def error(self, message):
+        self.lexer.error(message)
+
+    def expect(self, kind):
+        token, value = self.lexer.next()
+        if token != kind:
+            self.error(f"Ожидался символ '{kind}'")
+        return value
+
+    def parse_scalar(self, token, value):
+        if token == "string":
+            return value
+        if token == "ref":
+            return self.constants.resolve(value)
+        if token == "word":
+            try:
+                return parse_word(value)
+            except ValueError:
+                self.error(f"Неверное значение: {value}")
+        self.error("Ожидалось значение")
+
+    def parse_key(self):
+        token, value = self.lexer.next()
+        if token == "}":
+            return None
+        if token not in ("word", "string"):
+            self.error("Ожидался ключ")
+        return value
+
+    def parse_table(self):
+        """Таблица, начинающаяся с текущего символа {."""
+        self.expect("{")
+        root = {}
+        stack = [root]
+        while stack:
+            key = self.parse_key()
+            if key is None:
+                stack.pop()
+                if stack:
+                    self.expect(";")
+                continue
+            self.expect("=")
+            token, value = self.lexer.next()
+            if token == "{":
+                table = stack[-1][key] = {}
+                stack.append(table)
+                continue
+            stack[-1][key] = self.parse_scalar(token, value)
+            self.expect(";")
+        return root
+
+    def parse_value(self):
+        token, value = self.lexer.next()
+        if token == "{":
+            self.lexer.pos = self.lexer.start
+            return self.parse_table()
+        return self.parse_scalar(token, value)
+
+    def skip_table(self):
+        """Поиск конца таблицы без ее разбора; возвращает позицию после }."""
+        text = self.lexer.text
+        pos = self.lexer.start
+        depth = 0
+        # Ближайшие скобки и кавычка ищутся методами строки, а не по символу;
+        # позиция пересчитывается, только когда обход ее прошел
+        found = {"{": -1, "}": -1, '"': -1}
+        while True:
+            for char, index in found.items():
+                if index < pos:
+                    index = text.find(char, pos)
+                    found[char] = index if index >= 0 else len(text)
+            pos = min(found.values())
+            if pos >= len(text):
+                self.error("Незакрытая таблица")
+            char = text[pos]
+            if char == '"':
+                self.lexer.read_string(pos + 1)
+                pos = self.lexer.pos
+                continue
+            pos += 1
+            depth += 1 if char == "{" else -1
+            if depth == 0:
+                self.lexer.pos = pos
+                return pos
+
+    def parse_document(self, lazy=False):
+        """Разбор всего текста: объявления констант и таблицы верхнего уровня."""
+        config = GeneratedConfig(self.constants)
+        while True:
+            token, value = self.lexer.next()
+            if token == "eof":
+                return config
+            if token == "word" and value == "const":
+                token, name = self.lexer.next()
+                if token not in ("word", "string"):
+                    self.error("Ожидалось имя константы")
+                self.expect("=")
+                self.constants.values[name] = self.parse_value()
+                config.constant_names.append(name)
+            elif token == "{":
+                start = self.lexer.start
+                if lazy:
+                    config.tables.append(LazyTable(self.lexer.text, start, self.constants))
+                    self.skip_table()
                 else:
-                    raise ValueError(f"Константа '{const_name}' не определена.")
-            lines.append(f"  {key} = {format_value(value)};")
-        lines.append("}")
-        return "\n".join(lines)
-
-    def process_constants(constants_section):
-        for key, value in constants_section.items():
-            constants[key] = value
-            output.append(f"const {key} = {format_value(value)}")
-
-    # Сначала обрабатываем константы
-    if "constants" in data:
-        process_constants(data.pop("constants"))
-
-    # Теперь обрабатываем остальной контент
-    for key, value in data.items():
-        if isinstance(value, dict):
-            output.append(dict_to_config(value))
+                    self.lexer.pos = start
+                    config.tables.append(self.parse_table())
+            else:
+                self.error("Ожидалось объявление const или таблица")
+
+class LazyTable(Mapping):
+    """Таблица верхнего уровня, которая разбирается при первом обращении к ней."""
+
+    def __init__(self, text, start, constants):
+        self._text = text
+        self._start = start
+        self._constants = constants
+        self._data = None
+
+    def materialize(self):
+        if self._data is None:
+            parser = ConfigParser(self._text, pos=self._start)
+            parser.constants = self._constants
+            self._data = parser.parse_table()
+            self._text = None
+        return self._data
+
+    def __getitem__(self, key):
+        return self.materialize()[key]
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def __len__(self):
+        return len(self.materialize())
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+class GeneratedConfig:
+    """Результат разбора: константы в порядке объявления и список таблиц."""
+
+    def __init__(self, constants):
+        self.constant_table = constants
+        self.constant_names = []
+        self.tables = []
+
+    @property
+    def constants(self):
+        return {name: self.constant_table[name] for name in self.constant_names}
+
+def parse_config(text, lazy=False, constants=None):
+    """Разбор текста на учебном конфигурационном языке."""
+    return ConfigParser(text, constants).parse_document(lazy)
+
+def load_config(path, lazy=False, constants=None):
+    """Загрузка файла на учебном конфигурационном языке."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_config(f.read(), lazy, constants)
+
+def resolve_deep(value, constants):
+    """Копия значения, в которой все ссылки #(...) заменены значениями констант."""
+    value = constants.resolve(value)
+    if not isinstance(value, dict):
+        return value
+    result = {}
+    stack = [(value, result)]
+    while stack:
+        source, target = stack.pop()
+        for key, item in source.items():
+            item = constants.resolve(item)
+            if isinstance(item, dict):
+                target[key] = {}
+                stack.append((item, target[key]))
+            else:
+                target[key] = item
+    return result
+
+def verify_fragment(fragment, key, value, constants):
+    """
+    Проверка записанного фрагмента: разбор обратно должен дать исходные данные
+    с подставленными константами.
+    """
+    parsed = parse_config(fragment)
+    if key == "constants":
+        actual = parsed.constants
+        expected = {name: resolve_deep(constants[name], constants) for name in value}
+    else:
+        actual = parsed.tables
+        expected = [resolve_deep(value, constants)]
+    # Сравнение repr нужно для значений nan, не равных самим себе
+    if actual != expected and repr(actual) != repr(expected):
+        raise ValueError(f"Проверка вывода не пройдена для '{key}'")
+
+def convert_stream(input_stream, output_file, constants=None, verify=False):
+    """
+    Потоковое преобразование: таблицы читаются и записываются по одной.
+
+    Результат пишется во временный файл рядом с output_file и переносится на
+    его место только после успешного преобразования.
+    """
+    temp_file = output_file + ".tmp"
+    try:
+        with open(temp_file, 'w') as f:
+            write_tables(iter_toml_tables(input_stream), f, constants, verify)
+        os.replace(temp_file, output_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+MANIFEST_NAME = ".hw3_manifest.json"
+
+def file_sha256(path):
+    """SHA-256 содержимого файла."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def expand_inputs(patterns, out_dir):
+    """
+    Входные TOML-файлы и пути результатов для них.
+
+    Каталог обходится рекурсивно, и структура его подкаталогов повторяется
+    в out_dir; для маски повторяется путь относительно ее части без
+    подстановочных символов, а отдельный файл кладется в out_dir по имени.
+    Если два входных файла дают один результат, выбрасывается ValueError.
+    """
+    outputs = {}
+    sources = {}
+
+    def add(path, relative):
+        output = os.path.join(out_dir, os.path.splitext(relative)[0] + ".txt")
+        other = sources.setdefault(os.path.normcase(os.path.abspath(output)), path)
+        if os.path.abspath(other) != os.path.abspath(path):
+            raise ValueError(f"Файлы '{other}' и '{path}' преобразуются в один файл '{output}'")
+        outputs[path] = output
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, files in os.walk(pattern):
+                for name in sorted(files):
+                    if name.endswith(".toml"):
+                        path = os.path.join(root, name)
+                        add(path, os.path.relpath(path, pattern))
+            continue
+        if not any(c in pattern for c in "*?["):
+            if os.path.isfile(pattern):
+                add(pattern, os.path.basename(pattern))
+            continue
+        parts = pattern.replace(os.sep, "/").split("/")
+        fixed = next(i for i, part in enumerate(parts) if any(c in part for c in "*?["))
+        glob_root = os.sep.join(parts[:fixed]) or os.curdir
+        for path in sorted(glob.glob(pattern)):
+            if os.path.isfile(path):
+                add(path, os.path.relpath(path, glob_root))
+    return outputs
+
+def convert_file(input_path, output_path, constants=None, stream=False, verify=False):
+    """Преобразование одного TOML-файла в файл на учебном языке."""
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(input_path, 'r', encoding='utf-8') as f:
+        if stream:
+            convert_stream(f, output_path, constants, verify)
+            return
+        import toml
+        result = toml_to_custom_config(toml.load(f), constants, verify)
+    with open(output_path, 'w') as f:
+        f.write(result)
+
+_worker_constants = None
+
+def _init_batch_worker(constants_path):
+    global _worker_constants
+    _worker_constants = load_constants(constants_path) if constants_path else None
+
+def _convert_task(input_path, output_path, stream, verify):
+    """Задача пула: возвращает текст ошибки или None."""
+    try:
+        convert_file(input_path, output_path, _worker_constants, stream, verify)
+    except (OSError, ValueError) as e:
+        return str(e)
+    return None
+
+class BatchConverter:
+    """
+    Пакетное преобразование многих TOML-файлов на пуле процессов.
+
+    В out_dir хранится манифест с SHA-256 входных файлов: файлы, содержимое
+    которых не изменилось с прошлого успешного преобразования, пропускаются.
+    Изменение файла общих констант приводит к пересборке всех файлов.
+    """
+
+    def __init__(self, patterns, out_dir, jobs=None, constants_path=None, stream=False, verify=False):
+        self.patterns = patterns
+        self.out_dir = out_dir
+        self.jobs = jobs or os.cpu_count() or 1
+        self.constants_path = constants_path
+        self.stream = stream
+        self.verify = verify
+        self.manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+        self.manifest = self.load_manifest()
+        self._constants = None
+        self._stats = {}
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"constants": None, "files": {}}
+
+    def save_manifest(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.manifest_path)
+
+    def constants(self):
+        if self._constants is None and self.constants_path:
+            self._constants = load_constants(self.constants_path)
+        return self._constants
+
+    def build(self, paths=None):
+        """
+        Преобразование изменившихся файлов.
+
+        paths ограничивает проверку заданными входными файлами. Возвращает
+        (преобразованные, пропущенные, ошибки) - списки путей.
+        """
+        outputs = expand_inputs(self.patterns, self.out_dir)
+        files = self.manifest["files"]
+        constants_hash = file_sha256(self.constants_path) if self.constants_path else None
+        if constants_hash != self.manifest.get("constants"):
+            files.clear()
+            self.manifest["constants"] = constants_hash
+            self._constants = None
+
+        dirty = []
+        skipped = []
+        for path in outputs if paths is None else paths:
+            digest = file_sha256(path)
+            entry = files.get(path)
+            if entry and entry["sha256"] == digest and os.path.exists(entry["output"]):
+                skipped.append(path)
+            else:
+                dirty.append((path, digest))
+
+        errors = {}
+        if len(dirty) > 1 and self.jobs > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(min(self.jobs, len(dirty)), initializer=_init_batch_worker,
+                                     initargs=(self.constants_path,)) as pool:
+                futures = {path: pool.submit(_convert_task, path, outputs[path], self.stream, self.verify)
+                           for path, _ in dirty}
+                for path, future in futures.items():
+                    error = future.result()
+                    if error is not None:
+                        errors[path] = error
         else:
-            raise ValueError(f"Неподдерживаемый верхнеуровневый элемент: {key}")
+            # Один файл быстрее преобразовать в текущем процессе, чем запускать пул
+            for path, _ in dirty:
+                try:
+                    convert_file(path, outputs[path], self.constants(), self.stream, self.verify)
+                except (OSError, ValueError) as e:
+                    errors[path] = str(e)
 
-    return "\n".join(output)
+        converted = []
+        for path, digest in dirty:
+            if path in errors:
+                files.pop(path, None)
+                print(f"Ошибка преобразования {path}: {errors[path]}")
+            else:
+                files[path] = {"sha256": digest, "output": outputs[path]}
+                converted.append(path)
+        for path in list(files):
+            if path not in outputs:
+                del files[path]
+        self.save_manifest()
+        return converted, skipped, list(errors)
+
+    def poll(self):
+        """Один проход наблюдения: преобразование файлов с новыми mtime или размером."""
+        changed = []
+        current = {}
+        for path in expand_inputs(self.patterns, self.out_dir):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            current[path] = (st.st_mtime_ns, st.st_size)
+            if self._stats.get(path) != current[path]:
+                changed.append(path)
+        if self.constants_path:
+            st = os.stat(self.constants_path)
+            current[self.constants_path] = (st.st_mtime_ns, st.st_size)
+            if self._stats.get(self.constants_path) != current[self.constants_path]:
+                changed = [path for path in current if path != self.constants_path]
+        self._stats = current
+        if not changed:
+            return []
+        return self.build(changed)[0]
+
+    def watch(self, interval=1.0):
+        """Наблюдение за входными файлами с опросом раз в interval секунд."""
+        print(f"Наблюдение за файлами, интервал {interval} с. Ctrl+C - выход.")
+        try:
+            while True:
+                for path in self.poll():
+                    print(f"Преобразован {path}")
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python hw3.py <output_file>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Преобразование TOML из стандартного ввода в учебный конфигурационный язык.")
+    parser.add_argument("output_file", help="файл для результата (в пакетном режиме - каталог)")
+    parser.add_argument("--stream", action="store_true",
+                        help="читать и записывать таблицы по одной, не загружая весь документ в память")
+    parser.add_argument("--constants", metavar="FILE",
+                        help="TOML-файл с общими константами, доступными документу")
+    parser.add_argument("--batch", nargs="+", metavar="PATH",
+                        help="каталоги, файлы или маски TOML-файлов для пакетного преобразования")
+    parser.add_argument("--jobs", type=int, help="число процессов в пакетном режиме")
+    parser.add_argument("--watch", action="store_true",
+                        help="после пакетного преобразования следить за изменениями файлов")
+    parser.add_argument("--interval", type=float, default=1.0, help="интервал опроса в секундах")
+    parser.add_argument("--verify", action="store_true",
+                        help="разбирать результат обратно и сверять его с исходными данными")
+    parser.add_argument("--import-profile", action="store_true",
+                        help="выполнить запуск под -X importtime и показать, на что уходит время импорта")
+    args = parser.parse_args()
+    output_file = args.output_file
+
+    if args.batch:
+        converter = BatchConverter(args.batch, output_file, args.jobs, args.constants, args.stream, args.verify)
+        try:
+            converted, skipped, failed = converter.build()
+        except (OSError, ValueError) as e:
+            print(f"Ошибка пакетного преобразования: {e}")
+            sys.exit(1)
+        print(f"Преобразовано: {len(converted)}, без изменений: {len(skipped)}, ошибок: {len(failed)}")
+        if args.watch:
+            converter.watch(args.interval)
+        if failed:
+            sys.exit(1)
+        return
+
+    constants = None
+    if args.constants:
+        try:
+            constants = load_constants(args.constants)
+        except (OSError, ValueError) as e:
+            print(f"Ошибка загрузки констант: {e}")
+            sys.exit(1)
 
-    output_file = sys.argv[1]
+    if args.stream:
+        try:
+            convert_stream(sys.stdin, output_file, constants, args.verify)
+        except TomlSyntaxError as e:
+            print(f"Ошибка парсинга TOML: {e}")
+            sys.exit(1)
+        except Exception as e:
+            print(f"Ошибка преобразования: {e}")
+            sys.exit(1)
+        print(f"Конфигурация преобразована и сохранена в {output_file}")
+        return
 
     # Чтение TOML-данных из стандартного ввода
+    import toml
     input_text = sys.stdin.read()
 
     try:
@@ -69,7 +1269,7 @@ def main():
 
     try:
         # Преобразование TOML в учебный конфигурационный язык
-        result = toml_to_custom_config(toml_data)
+        result = toml_to_custom_config(toml_data, constants, args.verify)
     except Exception as e:
         print(f"Ошибка преобразования: {e}")
         sys.exit(1)
@@ -81,4 +1281,6 @@ def main():
     print(f"Конфигурация преобразована и сохранена в {output_file}")
 
 if __name__ == "__main__":
+    if fastconfig.IMPORT_PROFILE_FLAG in sys.argv:
+        sys.exit(fastconfig.run_import_profile())
     main()
@@ -1,35 +1,188 @@
 import unittest
-import re
 from io import StringIO
 import sys
-from hw3 import parse_dictionary
-
-class TestParseDictionary(unittest.TestCase):
-
-    def test_correct_input(self):
-        input_data = '$[ name : "Ivan", age : 30, address : "Moscow" ]'
-        expected_output = '<dictionary>\n    <entry key="name">Ivan</entry>\n    <entry key="age">30</entry>\n    <entry key="address">Moscow</entry>\n</dictionary>'
-        self.assertEqual(parse_dictionary(input_data), expected_output)
-
-    def test_correct_input_with_comments(self):
-        input_data = '/*\nЭто пример конфигурации пользователя\n*/$[ name : "Alex", age : 25, city : "Novosibirsk" ]'
-        expected_output = '<dictionary>\n    <entry key="name">Alex</entry>\n    <entry key="age">25</entry>\n    <entry key="city">Novosibirsk</entry>\n</dictionary>'
-        self.assertEqual(parse_dictionary(input_data), expected_output)
-
-    def test_input_with_extra_field(self):
-        input_data = '$[ name : "Kostya", age : 19, address : "Russia", sport: "Football" ]'
-        expected_output = '<dictionary>\n    <entry key="name">Kostya</entry>\n    <entry key="age">19</entry>\n    <entry key="address">Russia</entry>\n    <entry key="sport">Football</entry>\n</dictionary>'
-        self.assertEqual(parse_dictionary(input_data), expected_output)
-
-    def test_syntax_error_missing_key(self):
-        with self.assertRaises(SyntaxError) as context:
-            parse_dictionary('$[ age : 80, address : "Italia",  : "Mia", food: "Pizza" ]')
-        self.assertIn("Ошибка: Неверное имя ''. Имя должно начинаться с буквы или '_'.", str(context.exception))
-
-    def test_syntax_error_invalid_key(self):
-        with self.assertRaises(SyntaxError) as context:
-            parse_dictionary('$[ 123name : "Ivan", age : 30 ]')
-        self.assertIn("Ошибка: Неверное имя '123name'", str(context.exception))
+from hw3 import toml_to_custom_config, iter_toml_tables, write_tables, TomlSyntaxError
+from hw3 import ConstantTable, BatchConverter, expand_inputs
+from hw3 import parse_config, ConfigSyntaxError
+import os
+import tempfile
+from unittest.mock import patch
+
+class TestTomlToCustomConfig(unittest.TestCase):
+
+    def test_top_level_tables(self):
+        data = {"constants": {"app_name": "MyApp"}, "general": {"name": "#(app_name)", "version": 1}}
+        expected_output = 'const app_name = "MyApp"\n{\n  name = "MyApp";\n  version = 1;\n}'
+        self.assertEqual(toml_to_custom_config(data), expected_output)
+        self.assertIn("constants", data)
+
+    def test_nested_tables_are_indented(self):
+        data = {"server": {"limits": {"cpu": 2, "memory": {"max": 512}}, "name": "api"}}
+        expected_output = ('{\n  limits = {\n    cpu = 2;\n    memory = {\n      max = 512;\n    };\n  };\n'
+                           '  name = "api";\n}')
+        self.assertEqual(toml_to_custom_config(data), expected_output)
+
+    def test_deep_nesting_without_recursion(self):
+        data = table = {}
+        for _ in range(sys.getrecursionlimit() * 2):
+            table["inner"] = {}
+            table = table["inner"]
+        output = toml_to_custom_config({"root": data})
+        self.assertTrue(output.endswith("  };\n}"))
+
+    def test_undefined_constant(self):
+        with self.assertRaises(ValueError) as context:
+            toml_to_custom_config({"general": {"name": "#(missing)"}})
+        self.assertIn("Константа 'missing' не определена.", str(context.exception))
+
+class TestTomlStream(unittest.TestCase):
+
+    def test_stream_matches_full_conversion(self):
+        text = ('[constants]\napp_name = "MyApp"\n\n[general]\nname = "#(app_name)"  # комментарий\n'
+                'version = 1\n[general.limits]\ncpu = 2\n[database]\nhost = \'localhost\'\n'
+                'port = 5_432\nopts = { ssl = 1, "mode" = "ro" }\n')
+        tables = iter_toml_tables(StringIO(text))
+        self.assertEqual(next(tables), ("constants", {"app_name": "MyApp"}))
+        output = StringIO()
+        write_tables(iter_toml_tables(StringIO(text)), output)
+        expected = {
+            "constants": {"app_name": "MyApp"},
+            "general": {"name": "#(app_name)", "version": 1, "limits": {"cpu": 2}},
+            "database": {"host": "localhost", "port": 5432, "opts": {"ssl": 1, "mode": "ro"}},
+        }
+        self.assertEqual(output.getvalue(), toml_to_custom_config(expected))
+
+    def test_stream_strings(self):
+        text = '[t]\na = "x\\ty\\u0041"\nb = """\none\ntwo \\\n   three"""\nc = \'\'\'\nraw\\n\'\'\'\n'
+        self.assertEqual(dict(iter_toml_tables(StringIO(text))),
+                         {"t": {"a": "x\tyA", "b": "one\ntwo three", "c": "raw\\n"}})
+
+    def test_stream_rejects_split_tables(self):
+        with self.assertRaises(TomlSyntaxError) as context:
+            list(iter_toml_tables(StringIO("[a]\nx = 1\n[b]\ny = 2\n[a.c]\nz = 3\n")))
+        self.assertIn("(строка 5)", str(context.exception))
+
+class TestConstantTable(unittest.TestCase):
+
+    def test_constants_in_any_order(self):
+        table = ConstantTable({"total": "#(half * 2 + base)", "half": "#(base / 2)", "base": 10})
+        self.assertEqual(table["total"], 20.0)
+        self.assertEqual(table.resolve("#(-(base - 12) * 3)"), 6)
+        self.assertEqual(table.resolve("plain"), "plain")
+
+    def test_cycle_is_reported(self):
+        with self.assertRaises(ValueError) as context:
+            ConstantTable({"a": "#(b + 1)", "b": "#(c)", "c": "#(a)", "d": 1})
+        self.assertIn("Циклическая зависимость констант: a -> b -> c -> a", str(context.exception))
+
+    def test_references_are_memoized(self):
+        table = ConstantTable({"base": 2})
+        with patch.object(table, "evaluate", wraps=table.evaluate) as evaluate:
+            self.assertEqual(table.resolve("#(base * 3)"), 6)
+            calls = evaluate.call_count
+            for _ in range(1000):
+                self.assertEqual(table.resolve("#(base * 3)"), 6)
+        self.assertEqual(evaluate.call_count, calls)
+
+    def test_shared_table_across_documents(self):
+        shared = ConstantTable({"app": "MyApp", "port": 8000})
+        first = toml_to_custom_config({"constants": {"api": "#(port + 1)"}, "s": {"p": "#(api)"}}, shared)
+        second = toml_to_custom_config({"s": {"name": "#(app)"}}, shared)
+        self.assertEqual(first, 'const api = 8001\n{\n  p = 8001;\n}')
+        self.assertEqual(second, '{\n  name = "MyApp";\n}')
+        self.assertNotIn("api", shared)
+
+class TestBatchConverter(unittest.TestCase):
+
+    def write(self, path, text):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def test_batch_skips_unchanged_files(self):
+        with tempfile.TemporaryDirectory() as src, tempfile.TemporaryDirectory() as out:
+            self.write(os.path.join(src, "a.toml"), '[t]\nx = 1\n')
+            self.write(os.path.join(src, "sub", "b.toml"), '[t]\ny = "b"\n')
+            converted, skipped, failed = BatchConverter([src], out, jobs=2).build()
+            self.assertEqual((len(converted), skipped, failed), (2, [], []))
+            with open(os.path.join(out, "sub", "b.txt")) as f:
+                self.assertEqual(f.read(), '{\n  y = "b";\n}')
+
+            self.write(os.path.join(src, "a.toml"), '[t]\nx = 2\n')
+            converted, skipped, failed = BatchConverter([src], out, jobs=2).build()
+            self.assertEqual(converted, [os.path.join(src, "a.toml")])
+            self.assertEqual(len(skipped), 1)
+
+    def test_poll_reconverts_changed_file(self):
+        with tempfile.TemporaryDirectory() as src, tempfile.TemporaryDirectory() as out:
+            path = os.path.join(src, "a.toml")
+            self.write(path, '[t]\nx = 1\n')
+            converter = BatchConverter([os.path.join(src, "*.toml")], out, jobs=1)
+            self.assertEqual(converter.poll(), [path])
+            self.assertEqual(converter.poll(), [])
+            self.write(path, '[t]\nx = 3\n')
+            os.utime(path, ns=(0, 0))
+            self.assertEqual(converter.poll(), [path])
+            with open(os.path.join(out, "a.txt")) as f:
+                self.assertEqual(f.read(), '{\n  x = 3;\n}')
+
+    def test_glob_keeps_paths_below_its_root(self):
+        with tempfile.TemporaryDirectory() as src, tempfile.TemporaryDirectory() as out:
+            for name in ("a", "b"):
+                self.write(os.path.join(src, name, "app.toml"), f'[t]\nname = "{name}"\n')
+            converted, _, failed = BatchConverter([os.path.join(src, "*", "app.toml")], out, jobs=1).build()
+            self.assertEqual((len(converted), failed), (2, []))
+            with open(os.path.join(out, "b", "app.txt")) as f:
+                self.assertEqual(f.read(), '{\n  name = "b";\n}')
+            with self.assertRaises(ValueError):
+                expand_inputs([os.path.join(src, "a"), os.path.join(src, "b")], out)
+
+    def test_batch_reports_errors(self):
+        with tempfile.TemporaryDirectory() as src, tempfile.TemporaryDirectory() as out:
+            self.write(os.path.join(src, "bad.toml"), '[t]\nx = "#(missing)"\n')
+            with patch("sys.stdout", new_callable=StringIO):
+                converted, skipped, failed = BatchConverter([src], out, jobs=1).build()
+            self.assertEqual(failed, [os.path.join(src, "bad.toml")])
+
+class TestConfigParser(unittest.TestCase):
+
+    def test_round_trip(self):
+        data = {
+            "constants": {"name": 'say "hi"\\', "port": 8000},
+            "server": {"host": "#(name)", "quoted key": 1.5, "limits": {"cpu": 2, "on": True}},
+            "empty": {},
+        }
+        config = parse_config(toml_to_custom_config(data, verify=True))
+        self.assertEqual(config.constants, {"name": 'say "hi"\\', "port": 8000})
+        self.assertEqual(config.tables, [
+            {"host": 'say "hi"\\', "quoted key": 1.5, "limits": {"cpu": 2, "on": True}},
+            {},
+        ])
+
+    def test_references_are_resolved(self):
+        config = parse_config('const base = 10\n{\n  port = #(base * 2);\n  name = "x";\n}')
+        self.assertEqual(config.tables, [{"port": 20, "name": "x"}])
+
+    def test_reference_with_nested_parentheses(self):
+        config = parse_config('const base = 10\n{\n  port = #((base + 1) * 2);\n'
+                              '  name = #("a)" + "b");\n}')
+        self.assertEqual(config.tables, [{"port": 22, "name": "a)b"}])
+        with self.assertRaises(ConfigSyntaxError):
+            parse_config('{\n  port = #((base + 1);\n}')
+
+    def test_lazy_tables(self):
+        text = '{\n  a = 1;\n}\n{\n  b = "}";\n  c = {\n    d = 2;\n  };\n}'
+        config = parse_config(text, lazy=True)
+        self.assertFalse(config.tables[1].loaded)
+        self.assertEqual(config.tables[1]["c"], {"d": 2})
+        self.assertTrue(config.tables[1].loaded)
+        self.assertFalse(config.tables[0].loaded)
+        self.assertEqual(dict(config.tables[0]), {"a": 1})
+
+    def test_syntax_error_has_line(self):
+        with self.assertRaises(ConfigSyntaxError) as context:
+            parse_config('{\n  a = 1;\n  b = 2\n}')
+        self.assertIn("Ожидался символ ';' (строка 4)", str(context.exception))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file